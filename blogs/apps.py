@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class BlogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blogs'
+
+    def ready(self):
+        from . import attachments, search
+        from .models import Attachment, Blog
+
+        post_save.connect(search.index_blog, sender=Blog, dispatch_uid='blogs_index_blog')
+        post_delete.connect(search.unindex_blog, sender=Blog, dispatch_uid='blogs_unindex_blog')
+        post_delete.connect(attachments.release_blob, sender=Attachment, dispatch_uid='blogs_release_blob')
@@ -0,0 +1,200 @@
+"""
+Chunked, resumable blog attachment uploads.
+
+`start_upload` opens a multipart upload in object storage. The client then
+PUTs the file in ATTACHMENT_CHUNK_SIZE chunks, in any order and from as many
+requests as it likes; each chunk is streamed from the request body straight
+into the storage part of the same number, so a request holds a network
+buffer of it at a time, never the file. `received_chunks` lists the parts
+storage already has, which is what a client resumes from. `complete_upload`
+joins the parts, hashes the object by reading it back and links the
+attachment to the StoredBlob of that hash: when the content is already
+stored, the new copy is deleted and the existing blob is shared. A blob
+goes with the last attachment that shares it (`release_blob`). Those
+storage deletes run after the response, from the task queue.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils import timezone
+from tasks.queue import defer
+from utils.storage import NoSuchUpload, ObjectStorage
+from .models import Attachment, AttachmentUpload, StoredBlob
+
+# the most parts a multipart upload can have on S3
+MAX_CHUNKS = 10000
+HASH_READ_SIZE = 1024 * 1024
+
+storage = ObjectStorage('attachments')
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadGone(UploadError):
+    # storage no longer has the multipart upload: aborted, or expired by a
+    # bucket lifecycle rule
+    def __init__(self):
+        super().__init__("The upload was abandoned or has expired; start a new one.")
+
+
+class _ExactReader:
+    # reads at most `length` bytes of `stream` and counts them
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+
+def start_upload(blog, uploader_id, filename, content_type, size):
+    chunk_size = settings.ATTACHMENT_CHUNK_SIZE
+    if size > chunk_size * MAX_CHUNKS:
+        raise UploadError(f"Files larger than {chunk_size * MAX_CHUNKS} bytes can not be uploaded.")
+    name = uuid.uuid4().hex
+    storage_upload_id = storage.create_multipart_upload(name, content_type)
+    return AttachmentUpload.objects.create(
+        blog=blog, uploader_id=uploader_id, filename=filename, content_type=content_type, size=size,
+        chunk_size=chunk_size, name=name, storage_upload_id=storage_upload_id,
+    )
+
+
+def received_chunks(upload):
+    """
+    Numbers of the chunks storage holds in full, in order.
+    """
+    if upload.attachment_id:
+        return list(range(1, upload.chunk_count + 1))
+    try:
+        parts = storage.list_parts(upload.name, upload.storage_upload_id)
+    except NoSuchUpload:
+        raise UploadGone()
+    return sorted(number for number, (_, size) in parts.items()
+                  if number <= upload.chunk_count and size == upload.chunk_length(number))
+
+
+def write_chunk(upload, number, stream, length):
+    """
+    Stream chunk `number` (1-based) of `length` bytes from `stream` into
+    storage. Writing a chunk again replaces it.
+    """
+    if upload.attachment_id:
+        raise UploadError("The upload is already complete.")
+    if not 1 <= number <= upload.chunk_count:
+        raise UploadError(f"Chunks are numbered 1 to {upload.chunk_count}.")
+    expected = upload.chunk_length(number)
+    if length != expected:
+        raise UploadError(f"Chunk {number} has to be {expected} bytes, not {length}.")
+    body = _ExactReader(stream, length)
+    try:
+        storage.upload_part(upload.name, upload.storage_upload_id, number, body, length)
+    except NoSuchUpload:
+        raise UploadGone()
+    if body.remaining:
+        raise UploadError(f"The body of chunk {number} ended {body.remaining} bytes early.")
+
+
+def _sha256(name):
+    digest = hashlib.sha256()
+    with storage.open(name) as body:
+        while data := body.read(HASH_READ_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    Join the chunks of `upload` and return its Attachment. Completing an
+    upload twice returns the same attachment.
+
+    The request that completes an upload claims it first, so a concurrent
+    completion of the same upload is refused instead of joining the parts
+    and creating an attachment a second time. Joining and hashing run
+    outside any transaction, as they take as long as reading the file.
+    """
+    if upload.attachment_id:
+        return upload.attachment
+    claimed_at = timezone.now()
+    lapsed = claimed_at - timedelta(seconds=settings.ATTACHMENT_COMPLETE_TIMEOUT)
+    claimed = AttachmentUpload.objects.filter(
+        Q(completing_since__isnull=True) | Q(completing_since__lt=lapsed), pk=upload.pk, attachment__isnull=True,
+    ).update(completing_since=claimed_at)
+    if not claimed:
+        upload.refresh_from_db(fields=['attachment'])
+        if upload.attachment_id:
+            return upload.attachment
+        raise UploadError("The upload is already being completed.")
+    try:
+        return _complete_claimed(upload)
+    except BaseException:
+        AttachmentUpload.objects.filter(pk=upload.pk, completing_since=claimed_at).update(completing_since=None)
+        raise
+
+
+def _complete_claimed(upload):
+    try:
+        parts = storage.list_parts(upload.name, upload.storage_upload_id)
+    except NoSuchUpload:
+        raise UploadGone()
+    missing = [number for number in range(1, upload.chunk_count + 1)
+               if parts.get(number, (None, None))[1] != upload.chunk_length(number)]
+    if missing:
+        shown = ', '.join(map(str, missing[:10])) + (', ...' if len(missing) > 10 else '')
+        raise UploadError(f"Chunks {shown} are missing or incomplete.")
+
+    try:
+        storage.complete_multipart_upload(upload.name, upload.storage_upload_id,
+                                          {number: etag for number, (etag, _) in parts.items()
+                                           if number <= upload.chunk_count})
+    except NoSuchUpload:
+        raise UploadGone()
+    sha256 = _sha256(upload.name)
+    with transaction.atomic():
+        blob, created = StoredBlob.objects.get_or_create(sha256=sha256,
+                                                         defaults={'size': upload.size, 'name': upload.name})
+        upload.attachment = Attachment.objects.create(blog_id=upload.blog_id, blob=blob, filename=upload.filename,
+                                                      content_type=upload.content_type)
+        upload.completing_since = None
+        upload.save(update_fields=['attachment', 'completing_since'])
+        if not created:
+            defer('blogs.delete_objects', {'prefix': storage.prefix, 'name': upload.name})
+    return upload.attachment
+
+
+def abort_upload(upload):
+    with transaction.atomic():
+        if not upload.attachment_id:
+            defer('blogs.abort_upload', {'name': upload.name, 'upload_id': upload.storage_upload_id})
+        upload.delete()
+
+
+def release_blob(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_delete receiver for Attachment: once no attachment shares the
+    deleted one's StoredBlob, delete the blob and, after the commit, its
+    object. Runs for every attachment a blog deletion cascades to.
+    """
+    blob = StoredBlob.objects.using(using).filter(pk=instance.blob_id, attachments__isnull=True).first()
+    if blob is None:
+        return
+    blob.delete()
+    defer('blogs.delete_objects', {'prefix': storage.prefix, 'name': blob.name}, using=using)
+
+
+def download_links(attachments):
+    """
+    Return {attachment id: presigned download link} for Attachments with
+    their blob loaded, signed as one batch.
+    """
+    links = storage.presigned_urls({attachment.blob.name for attachment in attachments},
+                                   settings.ATTACHMENT_LINK_EXPIRY)
+    return {attachment.id: links[attachment.blob.name] for attachment in attachments}
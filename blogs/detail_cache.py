@@ -0,0 +1,83 @@
+"""
+Cache of serialized BlogDetailView payloads.
+
+Entries live in the CACHES alias named by BLOG_DETAIL_CACHE and are keyed by
+blog id, blog version and the request's comments page parameters. The
+version is an opaque token stored next to the entries; `invalidate()`
+replaces it, which orphans every cached page of that blog at once. Orphaned
+entries age out through the backend's TIMEOUT / MAX_ENTRIES. A version lost
+to eviction is replaced by a fresh token too, so an old entry can never be
+served again.
+"""
+import hashlib
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+QUERY_PARAMS = ('comments_page', 'comments_page_size', 'expand')
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _cache():
+    return caches[settings.BLOG_DETAIL_CACHE]
+
+
+def _version_key(blog_id):
+    return f'blog-detail:{blog_id}:version'
+
+
+def _version(blog_id):
+    cache = _cache()
+    version = cache.get(_version_key(blog_id))
+    if version is None:
+        cache.add(_version_key(blog_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(blog_id))
+    return version
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def key_for(request, blog_id):
+    # pagination links are absolute, so the host is part of the key as well
+    variant = '&'.join(f'{name}={request.query_params.get(name, "")}' for name in QUERY_PARAMS)
+    variant = f'{request.scheme}://{request.get_host()}?{variant}'
+    digest = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()
+    return f'blog-detail:{blog_id}:{_version(blog_id)}:{digest}'
+
+
+def get(key):
+    data = _cache().get(key)
+    _count('misses' if data is None else 'hits')
+    return data
+
+
+def set(key, data, timeout=DEFAULT_TIMEOUT):
+    _cache().set(key, data, timeout=timeout)
+
+
+def invalidate(blog_id):
+    if blog_id is None:
+        return
+    _cache().set(_version_key(blog_id), uuid.uuid4().hex, timeout=None)
+    _count('invalidations')
+
+
+def invalidate_many(blog_ids):
+    versions = {_version_key(blog_id): uuid.uuid4().hex for blog_id in blog_ids if blog_id is not None}
+    if not versions:
+        return
+    _cache().set_many(versions, timeout=None)
+    with _stats_lock:
+        _stats['invalidations'] += len(versions)
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,78 @@
+"""
+NDJSON export of blogs.
+
+One line per blog, in id order: the blog with its author, vote counters,
+comment count and every comment of its thread in thread order. Blogs are
+streamed with `.iterator(chunk_size=...)` and the comments of each chunk of
+blogs come from one more query, so memory is bounded by the chunk size
+whatever the size of the tables.
+
+`since` is an id watermark: only blogs with a larger id are exported, so
+passing the last exported id continues an export or picks up the blogs
+created since. Edits to blogs below the watermark are not re-exported.
+"""
+import itertools
+from collections import defaultdict
+from django.db import DEFAULT_DB_ALIAS
+from utils.renderers import FastJSONRenderer
+from .models import Blog, Comment
+
+DEFAULT_CHUNK_SIZE = 500
+CONTENT_TYPE = 'application/x-ndjson'
+
+BLOG_FIELDS = ('id', 'title', 'description', 'up_count', 'down_count', 'score',
+               'author_id', 'author__first_name', 'author__last_name')
+COMMENT_FIELDS = ('id', 'blog_id', 'author_id', 'object_id', 'depth', 'description')
+
+
+def _comments_by_blog(blog_ids, using):
+    comments = defaultdict(list)
+    rows = Comment.objects.using(using).filter(blog_id__in=blog_ids).order_by('blog_id', 'path') \
+        .values_list(*COMMENT_FIELDS)
+    for comment_id, blog_id, author_id, object_id, depth, description in rows.iterator():
+        comments[blog_id].append({
+            'id': comment_id,
+            'author_id': author_id,
+            # replies hang off a comment, top-level comments off the blog
+            'parent_id': object_id if depth else None,
+            'depth': depth,
+            'description': description,
+        })
+    return comments
+
+
+def iter_blogs(since=None, chunk_size=DEFAULT_CHUNK_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Yield one export record (a dict) per blog with an id above `since`.
+    """
+    blogs = Blog.objects.using(using).order_by('id').values_list(*BLOG_FIELDS)
+    if since is not None:
+        blogs = blogs.filter(id__gt=since)
+    rows = blogs.iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        comments = _comments_by_blog([row[0] for row in chunk], using)
+        for blog_id, title, description, up_count, down_count, score, author_id, first_name, last_name in chunk:
+            thread = comments.pop(blog_id, [])
+            yield {
+                'id': blog_id,
+                'title': title,
+                'description': description,
+                'author': {'id': author_id, 'first_name': first_name, 'last_name': last_name},
+                'up_count': up_count,
+                'down_count': down_count,
+                'score': score,
+                'comment_count': len(thread),
+                'comments': thread,
+            }
+
+
+def render_line(record):
+    return FastJSONRenderer().render(record) + b'\n'
+
+
+def export_ndjson(since=None, chunk_size=DEFAULT_CHUNK_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Yield the export as NDJSON lines (bytes), e.g. for a StreamingHttpResponse.
+    """
+    for record in iter_blogs(since, chunk_size, using):
+        yield render_line(record)
@@ -0,0 +1,209 @@
+"""
+Time-decayed "hot" ranking of blogs.
+
+Each vote contributes +1 / -1 halved every HOT_RANKING_HALF_LIFE seconds
+since it was cast. Decay is the same for every blog, so instead of decaying
+all scores continuously each vote is stored as ±2 ** ((created_at - epoch) /
+half_life): the ordering never changes as time passes and a vote only
+touches the score of its own blog. The decayed value shown to clients is
+that sum scaled by 2 ** ((epoch - now) / half_life).
+
+The top HOT_LEADERBOARD_SIZE blogs live in the Django cache, kept sorted so
+a page is a list slice. Votes update the entry of their blog in place. A
+blog outside the board scores the vote alone while the board is complete,
+i.e. holds every blog with votes in the window; once blogs have been
+dropped from it, only an upvote can lift an outside blog onto it and only
+then is the blog scored from its votes. Every
+HOT_LEADERBOARD_REFRESH_SECONDS the board is rebuilt from BlogVote, which
+rebases the epoch, drops expired votes and repairs updates lost to
+concurrent writers in other processes.
+"""
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+from .models import BlogVote
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'blogs:leaderboard:hot'
+
+HALF_LIFE = settings.HOT_RANKING_HALF_LIFE
+SIZE = settings.HOT_LEADERBOARD_SIZE
+REFRESH_SECONDS = settings.HOT_LEADERBOARD_REFRESH_SECONDS
+# votes older than this many half-lives weigh less than 0.1% and are ignored
+WINDOW_HALF_LIVES = 10
+
+_lock = threading.Lock()
+
+
+def _weight(vote_type, created_at, epoch):
+    sign = 1 if vote_type == 'up' else -1
+    return sign * 2 ** ((created_at.timestamp() - epoch) / HALF_LIFE)
+
+
+def _window_start(now):
+    return datetime.fromtimestamp(now - WINDOW_HALF_LIVES * HALF_LIFE, tz=timezone.utc)
+
+
+def _sorted_ranking(scores):
+    return sorted(scores, key=lambda blog_id: (-scores[blog_id], -blog_id))
+
+
+def _change(created_at, added, removed, epoch):
+    delta = 0.0
+    if added:
+        delta += _weight(added, created_at, epoch)
+    if removed:
+        delta -= _weight(removed, created_at, epoch)
+    return delta
+
+
+def _blog_values(blog_ids, epoch, now):
+    values = dict.fromkeys(blog_ids, 0.0)
+    votes = BlogVote.objects.filter(blog_id__in=blog_ids, created_at__gte=_window_start(now)) \
+        .values_list('blog_id', 'vote_type', 'created_at')
+    for blog_id, vote_type, created_at in votes:
+        values[blog_id] += _weight(vote_type, created_at, epoch)
+    return values
+
+
+def rebuild(now=None):
+    """
+    Recompute the board from BlogVote and store it in the cache.
+    """
+    now = time.time() if now is None else now
+    scores = {}
+    votes = BlogVote.objects.filter(created_at__gte=_window_start(now)) \
+        .values_list('blog_id', 'vote_type', 'created_at')
+    for blog_id, vote_type, created_at in votes.iterator(chunk_size=5000):
+        scores[blog_id] = scores.get(blog_id, 0.0) + _weight(vote_type, created_at, now)
+
+    ranking = _sorted_ranking(scores)[:SIZE]
+    state = {
+        'epoch': now,
+        'built_at': now,
+        'scores': {blog_id: scores[blog_id] for blog_id in ranking},
+        'ranking': ranking,
+        'complete': len(scores) <= SIZE,
+    }
+    cache.set(CACHE_KEY, state, timeout=None)
+    return state
+
+
+def get_state(now=None):
+    now = time.time() if now is None else now
+    state = cache.get(CACHE_KEY)
+    if state is None or now - state['built_at'] >= REFRESH_SECONDS:
+        with _lock:
+            state = cache.get(CACHE_KEY)
+            if state is None or now - state['built_at'] >= REFRESH_SECONDS:
+                state = rebuild(now)
+    return state
+
+
+def warm():
+    """
+    Build the board at process start so the first reader does not pay for it.
+    """
+    try:
+        get_state()
+    except Exception as exc:
+        # e.g. migrations not applied yet; the first request will retry
+        logger.warning("hot leaderboard warm-up failed: %s", exc)
+
+
+def record_vote(blog_id, created_at, added=None, removed=None):
+    """
+    Apply a vote change to the cached board. Call it once the vote has been
+    committed (a flip passes both `added` and `removed`).
+    """
+    record_votes([(blog_id, created_at, added, removed)])
+
+
+def record_votes(changes):
+    """
+    Apply committed vote changes, (blog_id, created_at, added, removed)
+    each, to the cached board in one update. Outside blogs that need their
+    votes scored are loaded with a single query.
+    """
+    state = cache.get(CACHE_KEY)
+    if state is None:
+        return  # rebuilt from BlogVote by the next reader
+
+    now = time.time()
+    epoch = state['epoch']
+    window_start = _window_start(now)
+    deltas = {}
+    for blog_id, created_at, added, removed in changes:
+        # votes before the window are not on the board
+        if created_at >= window_start:
+            deltas[blog_id] = deltas.get(blog_id, 0.0) + _change(created_at, added, removed, epoch)
+    if not deltas:
+        return
+
+    values = {}
+    if not state.get('complete'):
+        lifted = [blog_id for blog_id, delta in deltas.items() if blog_id not in state['scores'] and delta > 0]
+        if lifted:
+            # queried outside the lock: votes on other blogs need not wait for it
+            values = _blog_values(lifted, epoch, now)
+
+    with _lock:
+        state = cache.get(CACHE_KEY) or state
+        if state['epoch'] != epoch:
+            return  # rebuilt after the votes were committed, so they are counted
+        scores, ranking = state['scores'], state['ranking']
+
+        for blog_id, delta in deltas.items():
+            if blog_id in scores:
+                ranking.remove(blog_id)
+                scores[blog_id] += delta
+            elif blog_id in values:
+                scores[blog_id] = values[blog_id]
+            elif state.get('complete'):
+                # no votes in the window until these
+                scores[blog_id] = delta
+            else:
+                # below every blog on the board before votes that can not raise it
+                continue
+
+            keys = [(-scores[other], -other) for other in ranking]
+            ranking.insert(bisect.bisect_left(keys, (-scores[blog_id], -blog_id)), blog_id)
+            if ranking[SIZE:]:
+                state['complete'] = False
+            for evicted in ranking[SIZE:]:
+                del scores[evicted]
+            del ranking[SIZE:]
+
+        cache.set(CACHE_KEY, state, timeout=None)
+
+
+class Ranking:
+    """
+    Read-only view of the board as (blog_id, decayed hot score) pairs, best
+    first. Only the requested slice is materialized, so paginating it costs
+    O(page) whatever the board size.
+    """
+
+    def __init__(self, state, now):
+        self.ids = state['ranking']
+        self.scores = state['scores']
+        self.scale = 2 ** ((state['epoch'] - now) / HALF_LIFE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(blog_id, self.scores[blog_id] * self.scale) for blog_id in self.ids[index]]
+        blog_id = self.ids[index]
+        return blog_id, self.scores[blog_id] * self.scale
+
+
+def ranking(now=None):
+    now = time.time() if now is None else now
+    return Ranking(get_state(now), now)
@@ -0,0 +1,152 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from blogs.models import Blog
+from blogs.votes import cast_vote, withdraw_vote
+from .bench_votes import legacy_cast
+from users.models import User
+
+ALIAS = 'bench_db'
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run reader and vote writer threads against a scratch SQLite database for each DATABASE_PROFILES entry "
+        "and report throughput, read latency and lock errors. Every operation ends the way a request does, by "
+        "closing the connection unless the profile keeps it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=list(settings.DATABASE_PROFILES), nargs='+',
+                            default=list(settings.DATABASE_PROFILES))
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per profile.")
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--blogs', type=int, default=200)
+        parser.add_argument('--write-path', choices=['upsert', 'legacy'], default='upsert',
+                            help="legacy reads before it writes in one transaction, like most ORM code does.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for profile in options['profile']:
+            with tempfile.TemporaryDirectory() as directory:
+                self.configure(profile, os.path.join(directory, 'bench.sqlite3'))
+                try:
+                    user_ids, blog_ids = self.seed(options['users'], options['blogs'])
+                    self.run(profile, user_ids, blog_ids, options)
+                finally:
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+
+    def configure(self, profile, name):
+        connections.settings[ALIAS] = {
+            **connections.settings['default'],
+            'NAME': name,
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False,
+            'OPTIONS': {},
+            **settings.DATABASE_PROFILES[profile],
+        }
+        call_command('migrate', database=ALIAS, verbosity=0)
+
+    def seed(self, users, blogs):
+        password = make_password(None)
+        created_users = User.objects.using(ALIAS).bulk_create([
+            User(phone_number=f'0999{index:06d}', password=password) for index in range(users)
+        ])
+        created_blogs = Blog.objects.using(ALIAS).bulk_create([
+            Blog(title=f'bench {index}', description='bench', author=created_users[index % users])
+            for index in range(blogs)
+        ])
+        return [user.id for user in created_users], [blog.id for blog in created_blogs]
+
+    def run(self, profile, user_ids, blog_ids, options):
+        counts, errors = Counter(), Counter()
+        read_latencies = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['readers'] + options['writers'] + 1)
+        deadline = []
+
+        def request_finished():
+            connections[ALIAS].close_if_unusable_or_obsolete()
+
+        def reader(rng):
+            local_latencies = []
+            while time.perf_counter() < deadline[0]:
+                began = time.perf_counter()
+                try:
+                    list(Blog.objects.using(ALIAS).select_related('author').order_by('-score', '-id')
+                         .filter(id__gte=rng.choice(blog_ids))[:20])
+                    local_latencies.append(time.perf_counter() - began)
+                except Exception as exc:
+                    with lock:
+                        errors[f'read {type(exc).__name__}: {exc}'] += 1
+                request_finished()
+            with lock:
+                read_latencies.extend(local_latencies)
+
+        cast = cast_vote if options['write_path'] == 'upsert' else legacy_cast
+
+        def writer(rng):
+            local_counts = Counter()
+            while time.perf_counter() < deadline[0]:
+                blog_id, user_id = rng.choice(blog_ids), rng.choice(user_ids)
+                try:
+                    if rng.random() < 0.15:
+                        withdraw_vote(blog_id, user_id, using=ALIAS)
+                    else:
+                        cast(blog_id, user_id, rng.choice(['up', 'down']), using=ALIAS)
+                    local_counts['writes'] += 1
+                except Exception as exc:
+                    with lock:
+                        errors[f'write {type(exc).__name__}: {exc}'] += 1
+                request_finished()
+            with lock:
+                counts.update(local_counts)
+
+        def worker(target, seed):
+            rng = random.Random(seed)
+            start.wait()
+            try:
+                target(rng)
+            finally:
+                connections[ALIAS].close()
+
+        threads = [threading.Thread(target=worker, args=(reader, options['seed'] + index))
+                   for index in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(writer, options['seed'] + 1000 + index))
+                    for index in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        deadline.append(time.perf_counter() + options['duration'])
+        start.wait()
+        for thread in threads:
+            thread.join()
+
+        duration = options['duration']
+        ms = [latency * 1000 for latency in read_latencies]
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{profile} profile, {options['write_path']} writes"))
+        self.stdout.write(f"  reads: {len(ms) / duration:.0f}/s  p50 {percentile(ms, 0.5):.2f}ms  "
+                          f"p99 {percentile(ms, 0.99):.2f}ms")
+        self.stdout.write(f"  writes: {counts['writes'] / duration:.0f}/s")
+        locked = sum(count for error, count in errors.items() if 'database is locked' in error)
+        self.stdout.write(f"  'database is locked' errors: {locked}")
+        for error, count in errors.most_common(5):
+            self.stdout.write(f"  {count} x {error}")
@@ -0,0 +1,70 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from utils.parsers import FastJSONParser
+from utils.renderers import FastJSONRenderer, orjson
+
+PAYLOADS = {
+    'blog list': ('/blog/blogs/', {'page_size': 100}),
+    'most popular': ('/blog/most-popular-blogs', {'page_size': 100}),
+    'comment list': ('/blog/comments/', {'page_size': 100, 'expand': 'related'}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time DRF's JSONRenderer / JSONParser against the project's FastJSONRenderer / FastJSONParser on large "
+        "blog and comment list payloads taken from the configured database (see `manage.py seed_data`). Each "
+        "payload is a full page repeated --scale times."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=10, help="Copies of a 100 row page per payload.")
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; both paths use the stdlib json module."))
+        client = Client()
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, (url, params) in PAYLOADS.items():
+                response = client.get(url, params)
+                if response.status_code != 200 or not response.data['results']:
+                    raise CommandError(f"{url} returned no rows; seed the database first.")
+                data = {**response.data, 'results': list(response.data['results']) * options['scale']}
+                self.report(name, data, options['iterations'])
+
+    def report(self, name, data, iterations):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {len(data['results'])} rows"))
+        baseline = None
+        for renderer, parser in ((JSONRenderer(), JSONParser()), (FastJSONRenderer(), FastJSONParser())):
+            body = renderer.render(data)
+            render_ms = self.time(lambda: renderer.render(data), iterations)
+            parse_ms = self.time(lambda: parser.parse(_Stream(body)), iterations)
+            line = (f"  {type(renderer).__name__:<17} {len(body) / 1024:8.1f} KiB  render {render_ms:7.2f}ms  "
+                    f"parse {parse_ms:7.2f}ms")
+            if baseline:
+                line += f"  ({baseline[0] / render_ms:.1f}x / {baseline[1] / parse_ms:.1f}x)"
+            baseline = baseline or (render_ms, parse_ms)
+            self.stdout.write(line)
+
+    @staticmethod
+    def time(func, iterations):
+        func()
+        began = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - began) / iterations * 1000
+
+
+class _Stream:
+    # a fresh readable body per parse, like request.stream
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, *args):
+        body, self.body = self.body, b''
+        return body
@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+from collections import Counter
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from blogs.models import Blog, BlogVote
+from blogs.votes import apply_vote_batch, cast_vote, withdraw_vote
+from users.models import User
+
+BENCH_NAME = 'bench-votes'
+
+
+def legacy_cast(blog_id, user_id, vote_type, using=DEFAULT_DB_ALIAS):
+    """
+    The pre-upsert BlogVoteView.post write path (load blog, get_or_create,
+    save), kept here as the baseline to compare against.
+    """
+    blogs, votes = Blog.objects.db_manager(using), BlogVote.objects.db_manager(using)
+    with transaction.atomic(using=using):
+        blog = blogs.get(id=blog_id)
+        vote, created = votes.get_or_create(blog=blog, user_id=user_id, defaults={'vote_type': vote_type})
+        if created:
+            blogs.adjust_vote_counts(blog.id, added=vote_type)
+            return votes.CREATED
+        if vote.vote_type == vote_type:
+            return votes.UNCHANGED
+        old_type, vote.vote_type = vote.vote_type, vote_type
+        vote.save(using=using)
+        blogs.adjust_vote_counts(blog.id, added=vote_type, removed=old_type)
+        return votes.CHANGED
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the vote write path from several threads against the configured database and report "
+        "throughput, outcome counts and errors. Creates its own users and blogs and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=500, help="Operations per thread.")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--blogs', type=int, default=5,
+                            help="Few blogs and users mean many threads racing on the same (blog, user) pair.")
+        parser.add_argument('--withdraw-ratio', type=float, default=0.15)
+        parser.add_argument('--path', choices=['upsert', 'legacy', 'batch', 'both', 'all'], default='both',
+                            help="both = legacy and upsert; all adds the batch path.")
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Votes per apply_vote_batch call on the batch path.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            raise CommandError("Threads can not share an in-memory SQLite database; point settings at a file.")
+
+        paths = {'both': ['legacy', 'upsert'], 'all': ['legacy', 'upsert', 'batch']}.get(options['path'],
+                                                                                      [options['path']])
+        self.cleanup()
+        user_ids, blog_ids = self.seed(options['users'], options['blogs'])
+        try:
+            for path in paths:
+                BlogVote.objects.filter(blog_id__in=blog_ids).delete()
+                Blog.objects.filter(id__in=blog_ids).update(up_count=0, down_count=0, score=0)
+                self.run(path, user_ids, blog_ids, options)
+        finally:
+            self.cleanup()
+
+    def seed(self, users, blogs):
+        password = make_password(None)
+        created_users = User.objects.bulk_create([
+            User(phone_number=f'0999{index:06d}', first_name=BENCH_NAME, password=password)
+            for index in range(users)
+        ])
+        author = created_users[0]
+        created_blogs = Blog.objects.bulk_create([
+            Blog(title=f'{BENCH_NAME} {index}', description=BENCH_NAME, author=author) for index in range(blogs)
+        ])
+        return [user.id for user in created_users], [blog.id for blog in created_blogs]
+
+    def cleanup(self):
+        User.objects.filter(first_name=BENCH_NAME, phone_number__startswith='0999').delete()
+
+    def run(self, path, user_ids, blog_ids, options):
+        cast = cast_vote if path == 'upsert' else legacy_cast
+        outcomes, errors = Counter(), Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'] + 1)
+
+        def run_batches(rng, local_outcomes, local_errors):
+            # the same operation mix, sent as one batch per user
+            remaining = options['ops']
+            while remaining > 0:
+                size = min(options['batch_size'], remaining)
+                remaining -= size
+                items = [(rng.choice(blog_ids), None if rng.random() < options['withdraw_ratio']
+                          else rng.choice(['up', 'down'])) for _ in range(size)]
+                try:
+                    local_outcomes.update(apply_vote_batch(rng.choice(user_ids), items))
+                except Exception as exc:
+                    local_errors[f'{type(exc).__name__}: {exc}'] += size
+
+        def worker(seed):
+            rng = random.Random(seed)
+            local_outcomes, local_errors = Counter(), Counter()
+            start.wait()
+            try:
+                if path == 'batch':
+                    run_batches(rng, local_outcomes, local_errors)
+                    return
+                for _ in range(options['ops']):
+                    blog_id, user_id = rng.choice(blog_ids), rng.choice(user_ids)
+                    try:
+                        if rng.random() < options['withdraw_ratio']:
+                            local_outcomes['withdrawn' if withdraw_vote(blog_id, user_id) else 'no vote'] += 1
+                        else:
+                            local_outcomes[cast(blog_id, user_id, rng.choice(['up', 'down']))] += 1
+                    except Exception as exc:
+                        local_errors[f'{type(exc).__name__}: {exc}'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    outcomes.update(local_outcomes)
+                    errors.update(local_errors)
+
+        threads = [threading.Thread(target=worker, args=(options['seed'] + index,))
+                   for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        total = options['threads'] * options['ops']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{path} write path"))
+        self.stdout.write(f"  {total} operations from {options['threads']} threads in {elapsed:.2f}s "
+                          f"= {total / elapsed:.0f} ops/s")
+        self.stdout.write(f"  outcomes: {dict(outcomes)}")
+        integrity_errors = sum(count for error, count in errors.items() if error.startswith('IntegrityError'))
+        self.stdout.write(f"  integrity errors: {integrity_errors}")
+        for error, count in errors.most_common(5):
+            self.stdout.write(f"  {count} x {error}")
+        self.stdout.write(f"  counters consistent with BlogVote: {self.counters_match(blog_ids)}")
+
+    def counters_match(self, blog_ids):
+        for blog in Blog.objects.filter(id__in=blog_ids):
+            up = BlogVote.objects.filter(blog=blog, vote_type='up').count()
+            down = BlogVote.objects.filter(blog=blog, vote_type='down').count()
+            if (blog.up_count, blog.down_count, blog.score) != (up, down, up - down):
+                return False
+        return True
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from blogs import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every blog with its author, counters and comments as NDJSON, one blog per line in id order. "
+        "--since exports only blogs with a larger id; --state keeps that watermark in a file between runs, so "
+        "each run appends only the blogs created since the previous one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="File to append to; defaults to stdout.")
+        parser.add_argument('--since', type=int, help="Only export blogs with a larger id.")
+        parser.add_argument('--state', help="Watermark file, read before and updated after a successful export.")
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = options['since']
+        state = Path(options['state']) if options['state'] else None
+        if since is None and state is not None and state.exists():
+            try:
+                since = int(state.read_text().strip())
+            except ValueError:
+                raise CommandError(f"{state} does not hold a blog id.")
+
+        output = open(options['output'], 'ab') if options['output'] else sys.stdout.buffer
+        exported, last_id = 0, since
+        try:
+            for record in export.iter_blogs(since, options['chunk_size']):
+                output.write(export.render_line(record))
+                exported, last_id = exported + 1, record['id']
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+
+        if state is not None and last_id is not None:
+            state.write_text(f'{last_id}\n')
+        self.stderr.write(f"Exported {exported} blogs; watermark {last_id}.")
@@ -0,0 +1,239 @@
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from blogs import search
+from blogs.models import Blog, BlogVote, Comment, ImportCheckpoint, ImportedRecord
+from users.models import User
+
+MAX_REPORTED_SKIPS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Import blogs, comments and votes from a JSONL file, one object per line:\n"
+        '  {"type": "blog", "id": 1, "author": "<phone number>", "title": "...", "description": "..."}\n'
+        '  {"type": "comment", "id": 7, "author": "<phone number>", "blog": 1, "description": "..."}\n'
+        '  {"type": "comment", "id": 8, "author": "<phone number>", "parent": 7, "description": "..."}\n'
+        '  {"type": "vote", "blog": 1, "user": "<phone number>", "vote_type": "up"}\n'
+        "ids are the legacy platform's; blogs have to come before their comments and votes, and comments "
+        "before their replies. Lines are written in chunks with bulk_create, each chunk in one transaction "
+        "together with the position in the file, so a crashed or interrupted import resumes after the last "
+        "committed chunk when run again. Authors are existing users, matched by phone number; lines that "
+        "reference unknown users or objects are skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Lines per transaction.")
+        parser.add_argument('--source', help="Name the progress is kept under; defaults to the absolute path.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Forget the progress and id mapping of this source and read it from the start. "
+                                 "Rows it already imported stay.")
+
+    def handle(self, *args, path, chunk_size, source=None, restart=False, **options):
+        path = Path(path)
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+        source = source or str(path.resolve())
+        if restart:
+            ImportCheckpoint.objects.filter(source=source).delete()
+            ImportedRecord.objects.filter(source=source).delete()
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source)
+        if checkpoint.line:
+            self.stdout.write(f"Resuming {source} after line {checkpoint.line}.")
+
+        self.source = source
+        self.blog_type = ContentType.objects.get_for_model(Blog)
+        self.comment_type = ContentType.objects.get_for_model(Comment)
+        self.blogs = self.load_mapping('blog')
+        self.comments = self.load_mapping('comment')
+        self.users = {}
+        self.skipped = []
+
+        began, imported = time.perf_counter(), 0
+        with path.open('rb') as file:
+            file.seek(checkpoint.offset)
+            line = checkpoint.line
+            while True:
+                chunk = []
+                for raw in iter(file.readline, b''):
+                    line += 1
+                    if raw.strip():
+                        chunk.append((line, raw))
+                    if len(chunk) == chunk_size:
+                        break
+                if not chunk:
+                    break
+                chunk_began = time.perf_counter()
+                with transaction.atomic():
+                    rows = self.import_chunk(chunk)
+                    checkpoint.offset, checkpoint.line = file.tell(), line
+                    checkpoint.save(update_fields=['offset', 'line', 'updated_at'])
+                imported += rows
+                elapsed = time.perf_counter() - chunk_began
+                self.stdout.write(f"line {line}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
+
+        elapsed = time.perf_counter() - began
+        for line, reason in self.skipped[:MAX_REPORTED_SKIPS]:
+            self.stdout.write(self.style.WARNING(f"  skipped line {line}: {reason}"))
+        if len(self.skipped) > MAX_REPORTED_SKIPS:
+            self.stdout.write(self.style.WARNING(f"  ... and {len(self.skipped) - MAX_REPORTED_SKIPS} more"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} rows in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/s), "
+            f"skipped {len(self.skipped)} lines."
+        ))
+
+    def load_mapping(self, kind):
+        records = ImportedRecord.objects.filter(source=self.source, kind=kind).values_list('legacy_id', 'object_id')
+        return dict(records.iterator())
+
+    def skip(self, line, reason):
+        self.skipped.append((line, reason))
+
+    def resolve_users(self, records):
+        phone_numbers = {record.get(key) for _, record in records for key in ('author', 'user')}
+        missing = [phone_number for phone_number in phone_numbers - self.users.keys()
+                   if isinstance(phone_number, str)]
+        if missing:
+            self.users.update(User.objects.filter(phone_number__in=missing).values_list('phone_number', 'id'))
+
+    def remember(self, kind, mapping):
+        ImportedRecord.objects.bulk_create([
+            ImportedRecord(source=self.source, kind=kind, legacy_id=legacy_id, object_id=object_id)
+            for legacy_id, object_id in mapping.items()
+        ])
+        getattr(self, f'{kind}s').update(mapping)
+
+    def import_chunk(self, chunk):
+        records = {'blog': [], 'comment': [], 'vote': []}
+        for line, raw in chunk:
+            try:
+                record = json.loads(raw)
+            except ValueError as exc:
+                self.skip(line, f"invalid JSON ({exc})")
+                continue
+            if not isinstance(record, dict) or record.get('type') not in records:
+                self.skip(line, "not a blog, comment or vote object")
+                continue
+            records[record['type']].append((line, record))
+
+        self.resolve_users([item for items in records.values() for item in items])
+        return (self.import_blogs(records['blog']) + self.import_comments(records['comment'])
+                + self.import_votes(records['vote']))
+
+    def import_blogs(self, records):
+        created = {}
+        for line, record in records:
+            legacy_id, author_id = str(record.get('id')), self.users.get(record.get('author'))
+            if record.get('id') is None:
+                self.skip(line, "blog without an id")
+            elif author_id is None:
+                self.skip(line, f"unknown author {record.get('author')!r}")
+            elif legacy_id in self.blogs or legacy_id in created:
+                self.skip(line, f"blog {legacy_id} was already imported")
+            else:
+                created[legacy_id] = Blog(title=record.get('title', ''), description=record.get('description', ''),
+                                          author_id=author_id)
+        Blog.objects.bulk_create(created.values())
+        search.index_blogs([blog.id for blog in created.values()])
+        self.remember('blog', {legacy_id: blog.id for legacy_id, blog in created.items()})
+        return len(created)
+
+    def import_comments(self, records):
+        # known threads: new comment id -> (blog id, path, depth)
+        threads = {}
+        parent_ids = {self.comments[str(record['parent'])] for _, record in records
+                      if str(record.get('parent')) in self.comments}
+        for comment_id, blog_id, path, depth in Comment.objects.filter(id__in=parent_ids) \
+                .values_list('id', 'blog_id', 'path', 'depth'):
+            threads[comment_id] = (blog_id, path, depth)
+
+        # a reply can only be written once its parent has an id, so go in
+        # waves: top-level comments and replies to known comments first
+        pending, imported = records, 0
+        while pending:
+            in_chunk = {str(record.get('id')) for _, record in pending}
+            wave, waiting, seen = [], [], set()
+            for line, record in pending:
+                legacy_id, author_id = str(record.get('id')), self.users.get(record.get('author'))
+                if record.get('id') is None:
+                    self.skip(line, "comment without an id")
+                    continue
+                if author_id is None:
+                    self.skip(line, f"unknown author {record.get('author')!r}")
+                    continue
+                if legacy_id in self.comments or legacy_id in seen:
+                    self.skip(line, f"comment {legacy_id} was already imported")
+                    continue
+                if 'parent' in record:
+                    parent_id = self.comments.get(str(record['parent']))
+                    if parent_id is None:
+                        if str(record['parent']) in in_chunk:
+                            waiting.append((line, record))
+                        else:
+                            self.skip(line, f"unknown parent comment {record['parent']!r}")
+                        continue
+                    blog_id, parent_path, parent_depth = threads[parent_id]
+                    if parent_depth + 1 > Comment.MAX_DEPTH:
+                        self.skip(line, f"replies nest deeper than {Comment.MAX_DEPTH}")
+                        continue
+                    comment = Comment(content_type=self.comment_type, object_id=parent_id, blog_id=blog_id,
+                                      depth=parent_depth + 1)
+                else:
+                    blog_id, parent_path = self.blogs.get(str(record.get('blog'))), ''
+                    if blog_id is None:
+                        self.skip(line, f"unknown blog {record.get('blog')!r}")
+                        continue
+                    comment = Comment(content_type=self.blog_type, object_id=blog_id, blog_id=blog_id, depth=0)
+                comment.author_id, comment.description = author_id, record.get('description', '')
+                wave.append((legacy_id, parent_path, comment))
+                seen.add(legacy_id)
+
+            if not wave:
+                for line, record in waiting:
+                    self.skip(line, f"unknown parent comment {record['parent']!r}")
+                break
+            Comment.objects.bulk_create([comment for _, _, comment in wave])
+            # bulk_create skips Comment.save(), which derives the thread path from the new id
+            for _, parent_path, comment in wave:
+                comment.path = parent_path + Comment.path_segment(comment.id)
+                threads[comment.id] = (comment.blog_id, comment.path, comment.depth)
+            Comment.objects.bulk_update([comment for _, _, comment in wave], ['path'])
+            Blog.objects.adjust_comment_counts(Counter(comment.blog_id for _, _, comment in wave))
+            Comment.objects.adjust_reply_counts(Counter(comment.object_id for _, _, comment in wave if comment.depth))
+            self.remember('comment', {legacy_id: comment.id for legacy_id, _, comment in wave})
+            imported += len(wave)
+            pending = waiting
+        return imported
+
+    def import_votes(self, records):
+        votes = {}
+        for line, record in records:
+            blog_id, user_id = self.blogs.get(str(record.get('blog'))), self.users.get(record.get('user'))
+            if blog_id is None or user_id is None:
+                self.skip(line, f"unknown blog {record.get('blog')!r} or user {record.get('user')!r}")
+            elif record.get('vote_type') not in ('up', 'down'):
+                self.skip(line, f"invalid vote_type {record.get('vote_type')!r}")
+            else:
+                votes[blog_id, user_id] = (line, record['vote_type'])  # the last vote of a user counts
+        if not votes:
+            return 0
+
+        existing = set(BlogVote.objects.filter(blog_id__in={blog_id for blog_id, _ in votes},
+                                               user_id__in={user_id for _, user_id in votes})
+                       .values_list('blog_id', 'user_id'))
+        created, deltas = [], {}
+        for (blog_id, user_id), (line, vote_type) in votes.items():
+            if (blog_id, user_id) in existing:
+                self.skip(line, "the user already voted on this blog")
+                continue
+            created.append(BlogVote(blog_id=blog_id, user_id=user_id, vote_type=vote_type))
+            up, down = deltas.get(blog_id, (0, 0))
+            deltas[blog_id] = (up + (vote_type == 'up'), down + (vote_type == 'down'))
+        BlogVote.objects.bulk_create(created)
+        Blog.objects.bulk_adjust_vote_counts(deltas)
+        return len(created)
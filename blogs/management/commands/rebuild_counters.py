@@ -0,0 +1,88 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from blogs.models import Blog, BlogVote, Comment
+
+
+def _vote_count(vote_type):
+    votes = BlogVote.objects.filter(blog=OuterRef('pk'), vote_type=vote_type) \
+        .order_by().values('blog').annotate(c=Count('pk')).values('c')
+    return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+
+
+def _comment_count():
+    comments = Comment.objects.filter(blog=OuterRef('pk')) \
+        .order_by().values('blog').annotate(c=Count('pk')).values('c')
+    return Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+
+
+def _reply_count():
+    # replies are the comments on a comment; object_id is their parent
+    comment_type = ContentType.objects.get_for_model(Comment)
+    replies = Comment.objects.filter(content_type=comment_type, object_id=OuterRef('pk')) \
+        .order_by().values('object_id').annotate(c=Count('pk')).values('c')
+    return Coalesce(Subquery(replies, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = ("Rebuild (or with --verify, check) the denormalized counters: the vote counters and comment_count "
+            "of Blog from BlogVote and Comment, and reply_count of Comment.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report blogs and comments whose stored counters drift; exit 1 on drift.")
+        parser.add_argument('--blog', type=int, action='append', dest='blog_ids',
+                            help="Limit to the given blog id (repeatable).")
+
+    def handle(self, *args, verify=False, blog_ids=None, **options):
+        blogs, comments = Blog.objects.all(), Comment.objects.all()
+        if blog_ids:
+            blogs, comments = blogs.filter(id__in=blog_ids), comments.filter(blog_id__in=blog_ids)
+
+        if verify:
+            self.verify(blogs, comments)
+        else:
+            self.rebuild(blogs, comments)
+
+    def rebuild(self, blogs, comments):
+        with transaction.atomic():
+            updated = blogs.update(up_count=_vote_count('up'), down_count=_vote_count('down'),
+                                   comment_count=_comment_count())
+            blogs.update(score=F('up_count') - F('down_count'))
+            updated_comments = comments.update(reply_count=_reply_count())
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt vote and comment counters for {updated} blogs and reply counters for {updated_comments} comments."
+        ))
+
+    def verify(self, blogs, comments):
+        drifted = blogs.annotate(
+            actual_up=_vote_count('up'),
+            actual_down=_vote_count('down'),
+            actual_comments=_comment_count(),
+        ).filter(
+            ~Q(up_count=F('actual_up')) |
+            ~Q(down_count=F('actual_down')) |
+            ~Q(score=F('actual_up') - F('actual_down')) |
+            ~Q(comment_count=F('actual_comments'))
+        ).values_list('id', 'up_count', 'down_count', 'score', 'comment_count',
+                      'actual_up', 'actual_down', 'actual_comments')
+
+        mismatches = 0
+        for blog_id, up, down, score, comment_count, actual_up, actual_down, actual_comments in drifted.iterator():
+            mismatches += 1
+            self.stdout.write(
+                f"blog {blog_id}: stored up={up} down={down} score={score} comments={comment_count}, "
+                f"actual up={actual_up} down={actual_down} score={actual_up - actual_down} comments={actual_comments}"
+            )
+
+        drifted = comments.annotate(actual_replies=_reply_count()).filter(~Q(reply_count=F('actual_replies'))) \
+            .values_list('id', 'reply_count', 'actual_replies')
+        for comment_id, replies, actual_replies in drifted.iterator():
+            mismatches += 1
+            self.stdout.write(f"comment {comment_id}: stored replies={replies}, actual replies={actual_replies}")
+
+        if mismatches:
+            raise CommandError(f"{mismatches} blogs or comments have drifted counters; run without --verify to rebuild.")
+        self.stdout.write(self.style.SUCCESS("All counters match BlogVote and Comment."))
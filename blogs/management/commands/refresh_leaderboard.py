@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from blogs import leaderboard
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the cached hot leaderboard from BlogVote. Readers rebuild a stale board on their own; "
+            "run this from cron when CACHES points at a shared backend to keep that off the request path.")
+
+    def handle(self, *args, **options):
+        state = leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Hot leaderboard rebuilt with {len(state['ranking'])} blogs."))
@@ -0,0 +1,281 @@
+import io
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from blogs.models import Blog, Comment
+from core.wsgi import application
+from users.authentication import token_for_user
+from users.models import User
+from .seed_data import SEED_NAME, SEED_PASSWORD, SEED_PHONE_PREFIX
+
+DEFAULT_MIX = Path(settings.BASE_DIR) / 'benchmarks' / 'mix.jsonl'
+DEFAULT_EXPECT = (200, 201)
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Dataset:
+    """
+    Values for the {placeholders} of a request mix, drawn from the data
+    `manage.py seed_data` created.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.users = list(User.objects.filter(phone_number__startswith=SEED_PHONE_PREFIX, first_name=SEED_NAME)
+                          .only('id', 'phone_number', 'is_staff', 'is_active'))
+        if not self.users:
+            raise CommandError("No seeded data found; run `manage.py seed_data` first.")
+        self.tokens = {}
+        author_ids = [user.id for user in self.users]
+        self.blog_ids = list(Blog.objects.filter(author_id__in=author_ids).values_list('id', flat=True))
+        self.popular_blog_ids = list(Blog.objects.filter(author_id__in=author_ids).order_by('-score', '-id')
+                                     .values_list('id', flat=True)[:10])
+        self.comment_ids = list(Comment.objects.filter(blog_id__in=self.blog_ids, depth=0)
+                                .values_list('id', flat=True)[:10000])
+        # the blogs holding the deepest reply chains
+        self.thread_blog_ids = list(Comment.objects.filter(blog_id__in=self.blog_ids).order_by('-depth')
+                                    .values_list('blog_id', flat=True).distinct()[:10])
+
+    def token(self, user):
+        if user.id not in self.tokens:
+            self.tokens[user.id] = str(token_for_user(user).access_token)
+        return self.tokens[user.id]
+
+    def values(self):
+        user = self.rng.choice(self.users)
+        return user, {
+            'blog_id': self.rng.choice(self.blog_ids),
+            'popular_blog_id': self.rng.choice(self.popular_blog_ids),
+            'comment_id': self.rng.choice(self.comment_ids),
+            'thread_blog_id': self.rng.choice(self.thread_blog_ids),
+            'phone_number': user.phone_number,
+            'password': SEED_PASSWORD,
+        }
+
+
+def fill(value, values):
+    if isinstance(value, str):
+        return value.format_map(values)
+    if isinstance(value, list):
+        return [fill(item, values) for item in value]
+    if isinstance(value, dict):
+        return {key: fill(item, values) for key, item in value.items()}
+    return value
+
+
+def call_wsgi(method, path, body=None, token=None):
+    """
+    Send one request through the project's WSGI application and return
+    (status code, response headers).
+    """
+    path, _, query = path.partition('?')
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+    }
+    if token:
+        environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    setup_testing_defaults(environ)  # host 127.0.0.1
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = int(status.split()[0]), dict(headers)
+
+    result = application(environ, start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers']
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a recorded JSONL request mix against the WSGI application in-process and report throughput, "
+        "p50/p95/p99 latency and queries per endpoint. Each line holds name, method, path and optionally body, "
+        "auth (send a seeded user's token) and expect (accepted status codes); {placeholders} are filled from "
+        "the data of `manage.py seed_data`. Writes in the mix change the database, so run it on a seeded "
+        "scratch database. --output saves the results as JSON; --baseline compares them with saved results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=str(DEFAULT_MIX))
+        parser.add_argument('--rounds', type=int, default=20, help="Replays of the whole mix per thread.")
+        parser.add_argument('--warmup', type=int, default=1, help="Unrecorded rounds before measuring.")
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare with results saved by an earlier --output.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 latency growth over the baseline, as a fraction.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        mix = self.load_mix(options['mix'])
+        dataset = Dataset(random.Random(options['seed']))
+        samples = defaultdict(list)
+        errors = defaultdict(list)
+        lock = threading.Lock()
+
+        def replay(thread_index):
+            # threads start at different points of the mix, so they do not move in lockstep
+            offset = thread_index * len(mix) // options['threads']
+            order = mix[offset:] + mix[:offset]
+            local_samples, local_errors = defaultdict(list), defaultdict(list)
+            try:
+                for round_index in range(options['warmup'] + options['rounds']):
+                    measured = round_index >= options['warmup']
+                    for entry in order:
+                        with lock:  # Dataset shares one rng and token cache
+                            user, values = dataset.values()
+                            token = dataset.token(user) if entry.get('auth') else None
+                        began = time.perf_counter()
+                        status, headers = call_wsgi(entry['method'], fill(entry['path'], values),
+                                                    fill(entry.get('body'), values), token)
+                        elapsed = time.perf_counter() - began
+                        if not measured:
+                            continue
+                        match = QUERIES.search(headers.get('Server-Timing', ''))
+                        local_samples[entry['name']].append((elapsed, int(match.group(1)) if match else None))
+                        if status not in entry.get('expect', DEFAULT_EXPECT):
+                            local_errors[entry['name']].append(status)
+            finally:
+                connections.close_all()
+                with lock:
+                    for name, values in local_samples.items():
+                        samples[name] += values
+                    for name, statuses in local_errors.items():
+                        errors[name] += statuses
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=replay, args=(index,)) for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # warmup rounds are a small, fixed share of the wall time
+        wall = (time.perf_counter() - began) * options['rounds'] / (options['rounds'] + options['warmup'])
+
+        results = self.summarize(samples, errors, wall, options)
+        self.report(results)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f"Saved results to {options['output']}.")
+        if options['baseline']:
+            regressions = self.compare(results, json.loads(Path(options['baseline']).read_text()), options)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} endpoints regressed: {', '.join(regressions)}.")
+
+    def load_mix(self, path):
+        try:
+            with open(path) as file:
+                mix = [json.loads(line) for line in file if line.strip()]
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Can not read request mix {path}: {exc}")
+        for line, entry in enumerate(mix, 1):
+            missing = {'name', 'method', 'path'} - set(entry)
+            if missing:
+                raise CommandError(f"{path}:{line} lacks {', '.join(sorted(missing))}.")
+        return mix
+
+    def summarize(self, samples, errors, wall, options):
+        endpoints = {}
+        for name, values in sorted(samples.items()):
+            ms = [elapsed * 1000 for elapsed, _ in values]
+            queries = [count for _, count in values if count is not None]
+            endpoints[name] = {
+                'requests': len(values),
+                'errors': len(errors[name]),
+                'error_statuses': sorted(set(errors[name])),
+                # requests per second while serving only this endpoint
+                'throughput': round(len(ms) / (sum(ms) / 1000), 1),
+                'p50_ms': round(percentile(ms, 0.5), 2),
+                'p95_ms': round(percentile(ms, 0.95), 2),
+                'p99_ms': round(percentile(ms, 0.99), 2),
+                'mean_queries': round(statistics.fmean(queries), 2) if queries else None,
+                'max_queries': max(queries, default=None),
+            }
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'mix': options['mix'],
+            'rounds': options['rounds'],
+            'threads': options['threads'],
+            'total': {'requests': total, 'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+                      'throughput': round(total / wall, 1)},
+            'endpoints': endpoints,
+        }
+
+    def report(self, results):
+        total = results['total']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{total['requests']} requests, {total['throughput']} req/s, {total['errors']} unexpected statuses"
+        ))
+        self.stdout.write(f"  {'endpoint':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>8} {'errors':>7}")
+        for name, endpoint in results['endpoints'].items():
+            queries = '-' if endpoint['mean_queries'] is None else f"{endpoint['mean_queries']:g}"
+            self.stdout.write(f"  {name:<20} {endpoint['throughput']:>8} {endpoint['p50_ms']:>8} "
+                              f"{endpoint['p95_ms']:>8} {endpoint['p99_ms']:>8} {queries:>8} "
+                              f"{endpoint['errors']:>7}")
+            if endpoint['errors']:
+                self.stdout.write(self.style.WARNING(f"    statuses: {endpoint['error_statuses']}"))
+
+    def compare(self, results, baseline, options):
+        """
+        Print the change of every endpoint against the baseline and return
+        the names of the ones whose p95 grew beyond the tolerance or that
+        run more queries than before.
+        """
+        self.stdout.write(self.style.MIGRATE_HEADING(f"compared with the baseline of {baseline['created']}"))
+        if (baseline['threads'], baseline['mix']) != (results['threads'], results['mix']):
+            self.stdout.write(self.style.WARNING(
+                f"  the baseline ran {baseline['mix']} on {baseline['threads']} threads; latencies may not compare"
+            ))
+        regressions = []
+        for name, endpoint in results['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                self.stdout.write(f"  {name:<20} new endpoint")
+                continue
+            change = endpoint['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            reasons = []
+            if change > options['tolerance']:
+                reasons.append(f"p95 {before['p95_ms']} -> {endpoint['p95_ms']} ms")
+            if None not in (endpoint['max_queries'], before['max_queries']) \
+                    and endpoint['max_queries'] > before['max_queries']:
+                reasons.append(f"queries {before['max_queries']} -> {endpoint['max_queries']}")
+            line = f"  {name:<20} p95 {change:+.0%}"
+            if reasons:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSION: {'; '.join(reasons)}"))
+            else:
+                self.stdout.write(line)
+        for name in baseline['endpoints'].keys() - results['endpoints'].keys():
+            self.stdout.write(f"  {name:<20} missing from this run")
+        return regressions
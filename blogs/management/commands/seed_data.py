@@ -0,0 +1,146 @@
+import itertools
+import random
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
+from blogs import search
+from blogs.models import Blog, BlogVote, Comment
+from users.models import User
+
+# seeded users are recognized by this phone number prefix; deleting them
+# cascades to their blogs, votes and comments
+SEED_PHONE_PREFIX = '0997'
+SEED_PASSWORD = 'seed-password-1'
+SEED_NAME = 'seed'
+BATCH_SIZE = 1000
+
+
+def seed_phone_number(index):
+    return f'{SEED_PHONE_PREFIX}{index:06d}'
+
+
+def zipf_weights(count, exponent):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the configured database with a reproducible dataset for benchmarks: users sharing one password, "
+        "blogs with a skewed (Zipf) vote distribution, top-level comments and deep reply chains. Seeded data is "
+        "recognized by the users' phone number prefix and replaced on every run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--blogs', type=int, default=5000)
+        parser.add_argument('--votes-per-user', type=int, default=20,
+                            help="Average; each user casts between 0 and twice this many votes.")
+        parser.add_argument('--vote-skew', type=float, default=1.1,
+                            help="Zipf exponent of the blog popularity; 0 spreads votes evenly.")
+        parser.add_argument('--down-ratio', type=float, default=0.2)
+        parser.add_argument('--comments', type=int, default=20000, help="Top-level comments, skewed like votes.")
+        parser.add_argument('--reply-chains', type=int, default=50)
+        parser.add_argument('--chain-depth', type=int, default=30, help=f"At most {Comment.MAX_DEPTH}.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--flush', action='store_true', help="Only delete previously seeded data.")
+
+    def handle(self, *args, **options):
+        if options['chain_depth'] > Comment.MAX_DEPTH:
+            raise CommandError(f"--chain-depth can not exceed {Comment.MAX_DEPTH}.")
+        if options['users'] < 1 or options['blogs'] < 1:
+            raise CommandError("--users and --blogs must be positive.")
+
+        deleted = self.flush()
+        self.stdout.write(f"Deleted {deleted} previously seeded users and their content.")
+        if options['flush']:
+            return
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            users = self.seed_users(options['users'])
+            blogs = self.seed_blogs(rng, users, options['blogs'])
+            weights = zipf_weights(len(blogs), options['vote_skew'])
+            votes = self.seed_votes(rng, users, blogs, weights, options)
+            comments = self.seed_comments(rng, users, blogs, weights, options['comments'])
+            replies = self.seed_reply_chains(rng, users, blogs, weights, options)
+        search.rebuild_index()
+        call_command('rebuild_counters', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(blogs)} blogs, {votes} votes, {comments} comments and {replies} "
+            f"replies. Every user's password is {SEED_PASSWORD!r}."
+        ))
+
+    def flush(self):
+        deleted = User.objects.filter(phone_number__startswith=SEED_PHONE_PREFIX, first_name=SEED_NAME)
+        count = deleted.count()
+        deleted.delete()
+        return count
+
+    def seed_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        return User.objects.bulk_create([
+            User(phone_number=seed_phone_number(index), first_name=SEED_NAME, password=password)
+            for index in range(count)
+        ], batch_size=BATCH_SIZE)
+
+    def seed_blogs(self, rng, users, count):
+        # shuffled, so popularity does not follow ids
+        blogs = Blog.objects.bulk_create([
+            Blog(title=f'seeded blog {index}', description=f'seeded description {index} ' * 20,
+                 author=rng.choice(users))
+            for index in range(count)
+        ], batch_size=BATCH_SIZE)
+        rng.shuffle(blogs)
+        return blogs
+
+    def seed_votes(self, rng, users, blogs, weights, options):
+        cum_weights = list(itertools.accumulate(weights))
+        votes = []
+        for user in users:
+            wanted = min(len(blogs), rng.randint(0, 2 * options['votes_per_user']))
+            voted = {blog.id for blog in rng.choices(blogs, cum_weights=cum_weights, k=wanted)}
+            for blog_id in voted:
+                vote_type = 'down' if rng.random() < options['down_ratio'] else 'up'
+                votes.append(BlogVote(blog_id=blog_id, user=user, vote_type=vote_type))
+        BlogVote.objects.bulk_create(votes, batch_size=BATCH_SIZE)
+        return len(votes)
+
+    def seed_comments(self, rng, users, blogs, weights, count):
+        blog_type = ContentType.objects.get_for_model(Blog)
+        created = []
+        for target in rng.choices(blogs, weights=weights, k=count):
+            created.append(Comment(author=rng.choice(users), description=f'comment on {target.title}',
+                                   content_type=blog_type, object_id=target.id, blog=target, depth=0))
+        created = Comment.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        # bulk_create skips Comment.save(), which derives the thread path from the new id
+        Comment.objects.filter(path='').update(
+            path=LPad(Cast('id', CharField()), Comment.PATH_STEP, fill_text=Value('0')),
+        )
+        return len(created)
+
+    def seed_reply_chains(self, rng, users, blogs, weights, options):
+        # one level of every chain per round, so each round is two bulk queries
+        comment_type = ContentType.objects.get_for_model(Comment)
+        parents = []
+        for target in rng.choices(blogs, weights=weights, k=options['reply_chains']):
+            parent = Comment(author=rng.choice(users), description='chain start', content_object=target)
+            parent.save()
+            parents.append(parent)
+
+        created = 0
+        for depth in range(1, options['chain_depth'] + 1):
+            replies = Comment.objects.bulk_create([
+                Comment(author=rng.choice(users), description=f'reply at depth {depth}', content_type=comment_type,
+                        object_id=parent.id, blog_id=parent.blog_id, depth=depth)
+                for parent in parents
+            ], batch_size=BATCH_SIZE)
+            for reply, parent in zip(replies, parents):
+                reply.path = parent.path + Comment.path_segment(reply.id)
+            Comment.objects.bulk_update(replies, ['path'], batch_size=BATCH_SIZE)
+            parents = replies
+            created += len(replies)
+        return created
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:39
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_counters(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    BlogVote = apps.get_model('blogs', 'BlogVote')
+    db_alias = schema_editor.connection.alias
+
+    def count_of(vote_type):
+        votes = BlogVote.objects.filter(blog=OuterRef('pk'), vote_type=vote_type) \
+            .order_by().values('blog').annotate(c=Count('pk')).values('c')
+        return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+
+    Blog.objects.using(db_alias).update(up_count=count_of('up'), down_count=count_of('down'))
+    Blog.objects.using(db_alias).update(score=F('up_count') - F('down_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0005_remove_blog_down_votes_remove_blog_up_votes_blogvote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='down_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='score',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='up_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE blogs_blog_fts USING fts5("
+            "title, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite compiled without FTS5: search falls back to icontains
+        return
+    schema_editor.execute(
+        "INSERT INTO blogs_blog_fts (rowid, title, description) SELECT id, title, description FROM blogs_blog"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS blogs_blog_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0006_blog_vote_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def backfill_thread_paths(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Blog = apps.get_model('blogs', 'Blog')
+    Comment = apps.get_model('blogs', 'Comment')
+    db_alias = schema_editor.connection.alias
+    blog_type = ContentType.objects.db_manager(db_alias).get_for_model(Blog)
+    comment_type = ContentType.objects.db_manager(db_alias).get_for_model(Comment)
+
+    # walk the threads one level at a time, starting from comments on blogs
+    level = list(Comment.objects.using(db_alias).filter(content_type=blog_type))
+    existing_blogs = set(Blog.objects.using(db_alias).values_list('id', flat=True))
+    for comment in level:
+        comment.blog_id = comment.object_id if comment.object_id in existing_blogs else None
+        comment.depth = 0
+        comment.path = str(comment.pk).zfill(PATH_STEP)
+
+    while level:
+        Comment.objects.using(db_alias).bulk_update(level, ['blog', 'depth', 'path'], batch_size=500)
+        parents = {comment.pk: comment for comment in level}
+        parent_ids = list(parents)
+        level = []
+        for start in range(0, len(parent_ids), 500):
+            level.extend(Comment.objects.using(db_alias).filter(
+                content_type=comment_type, object_id__in=parent_ids[start:start + 500]
+            ))
+        for comment in level:
+            parent = parents[comment.object_id]
+            comment.blog_id = parent.blog_id
+            comment.depth = parent.depth + 1
+            comment.path = parent.path + str(comment.pk).zfill(PATH_STEP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0007_blog_fts'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='blog',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_comments', to='blogs.blog'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['blog', 'path'], name='blogs_comment_thread_idx'),
+        ),
+        migrations.RunPython(backfill_thread_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0008_comment_thread_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blog',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['-score', '-id'], name='blogs_blog_score_id_idx'),
+        ),
+    ]
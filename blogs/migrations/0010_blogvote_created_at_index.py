@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0009_blog_score_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogvote',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0010_blogvote_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('line', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('blog', 'Blog'), ('comment', 'Comment')], max_length=7)),
+                ('legacy_id', models.CharField(max_length=64)),
+                ('object_id', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'unique_together': {('source', 'kind', 'legacy_id')},
+            },
+        ),
+    ]
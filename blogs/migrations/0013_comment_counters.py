@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counters(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Comment = apps.get_model('blogs', 'Comment')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    db_alias = schema_editor.connection.alias
+
+    def count_of(comments, key):
+        counts = comments.filter(**{key: OuterRef('pk')}).order_by().values(key).annotate(c=Count('pk')).values('c')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    comments = Comment.objects.using(db_alias)
+    Blog.objects.using(db_alias).update(comment_count=count_of(comments, 'blog'))
+    # replies are the comments on a comment; object_id is their parent
+    comment_type = ContentType.objects.using(db_alias).filter(app_label='blogs', model='comment').first()
+    if comment_type is not None:
+        comments.update(reply_count=count_of(comments.filter(content_type=comment_type), 'object_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0012_attachments'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['content_type', 'object_id'], name='blogs_comment_target_idx'),
+        ),
+        migrations.RunPython(backfill_comment_counters, migrations.RunPython.noop),
+    ]
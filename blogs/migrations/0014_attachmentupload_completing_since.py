@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0013_comment_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentupload',
+            name='completing_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0014_attachmentupload_completing_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogvote',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
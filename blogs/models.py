@@ -1,19 +1,198 @@
+import uuid
 from django.contrib.contenttypes.fields import GenericRelation, GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from users.models import User
 
 
+def _shift(changes):
+    """
+    CASE expression giving each id of `changes` (id -> change) its change,
+    with one WHEN per distinct change, not one per id.
+    """
+    ids_by_change = {}
+    for pk, change in changes.items():
+        ids_by_change.setdefault(change, []).append(pk)
+    ids_by_change.pop(0, None)
+    return Case(
+        *[When(id__in=ids, then=Value(change)) for change, ids in ids_by_change.items()],
+        default=Value(0),
+    )
+
+
+class BlogManager(models.Manager):
+    def adjust_vote_counts(self, blog_id, added=None, removed=None):
+        """
+        Atomically shift the stored vote counters of a blog.
+
+        `added` and `removed` are vote types ('up' / 'down'), so a new vote
+        passes only `added`, a deleted one only `removed` and a flip both.
+        Returns the number of updated rows (0 when the blog does not exist).
+        """
+        up = (added == 'up') - (removed == 'up')
+        down = (added == 'down') - (removed == 'down')
+        if not up and not down:
+            return 0
+        return self.filter(id=blog_id).update(
+            up_count=F('up_count') + up,
+            down_count=F('down_count') + down,
+            score=F('score') + (up - down),
+        )
+
+    def bulk_adjust_vote_counts(self, deltas):
+        """
+        Shift the counters of many blogs in one UPDATE; `deltas` maps a blog
+        id to its (up, down) change.
+        """
+        deltas = {blog_id: delta for blog_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return 0
+
+        return self.filter(id__in=list(deltas)).update(
+            up_count=F('up_count') + _shift({blog_id: up for blog_id, (up, down) in deltas.items()}),
+            down_count=F('down_count') + _shift({blog_id: down for blog_id, (up, down) in deltas.items()}),
+            score=F('score') + _shift({blog_id: up - down for blog_id, (up, down) in deltas.items()}),
+        )
+
+    def adjust_comment_counts(self, deltas):
+        """
+        Shift the comment_count of many blogs in one UPDATE; `deltas` maps a
+        blog id to its change. Counts stop at 0, so comments created outside
+        the API (admin, shell) can not make a delete fail.
+        """
+        deltas = {blog_id: delta for blog_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        return self.filter(id__in=list(deltas)).update(comment_count=Greatest(F('comment_count') + _shift(deltas), 0))
+
+
 class Blog(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     comments = GenericRelation('Comment')
+    # denormalized from BlogVote, maintained by BlogVoteView and `manage.py rebuild_counters`
+    up_count = models.PositiveIntegerField(default=0)
+    down_count = models.PositiveIntegerField(default=0)
+    score = models.IntegerField(default=0)
+    # every comment of the thread, replies included; maintained by
+    # CommentCreateSerializer, CommentViewSet and `manage.py rebuild_counters`
+    comment_count = models.PositiveIntegerField(default=0)
+
+    objects = BlogManager()
+
+    class Meta:
+        indexes = [
+            # key of the popular listing and its keyset pagination
+            models.Index(fields=['-score', '-id'], name='blogs_blog_score_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class BlogVoteManager(models.Manager):
+    CREATED, CHANGED, UNCHANGED = 'created', 'changed', 'unchanged'
+
+    def upsert(self, blog_id, user_id, vote_type):
+        """
+        Record `user_id`'s vote on `blog_id` in a single
+        INSERT ... ON CONFLICT (blog_id, user_id) DO UPDATE ... RETURNING
+        statement. The Blog row is not loaded; a missing blog surfaces as an
+        IntegrityError when the transaction commits.
+
+        Returns (CREATED | CHANGED | UNCHANGED, created_at of the vote). Only
+        the update branch sets updated_at, so a NULL one marks an insert.
+        """
+        connection = connections[self.db]
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert):
+            return self._get_or_create_vote(blog_id, user_id, vote_type)
+
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        blog, user = opts.get_field('blog'), opts.get_field('user')
+        vote_type_column, created_at_field = qn(opts.get_field('vote_type').column), opts.get_field('created_at')
+        created_at_column, updated_at_column = qn(created_at_field.column), qn(opts.get_field('updated_at').column)
+
+        now = timezone.now()
+        sql = (
+            f"INSERT INTO {table} ({qn(blog.column)}, {qn(user.column)}, {vote_type_column}, {created_at_column}) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT ({qn(blog.column)}, {qn(user.column)}) DO UPDATE SET {vote_type_column} = EXCLUDED.{vote_type_column}, "
+            f"{updated_at_column} = EXCLUDED.{created_at_column} "
+            f"WHERE {table}.{vote_type_column} <> EXCLUDED.{vote_type_column} "
+            f"RETURNING {created_at_column}, {updated_at_column}"
+        )
+        params = [
+            blog.get_db_prep_value(blog_id, connection),
+            user.get_db_prep_value(user_id, connection),
+            vote_type,
+            created_at_field.get_db_prep_value(now, connection),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+        if row is None:
+            # the conflicting row already holds this vote type, so nothing was written
+            return self.UNCHANGED, None
+        # the update branch keeps the original created_at
+        created_at = self._to_datetime(row[0], created_at_field, connection)
+        return (self.CREATED if row[1] is None else self.CHANGED), created_at
+
+    def withdraw(self, blog_id, user_id):
+        """
+        Delete a vote in one statement. Returns (vote_type, created_at) of the
+        deleted vote, or None when there was none.
+        """
+        connection = connections[self.db]
+        if not connection.features.can_return_rows_from_bulk_insert:
+            vote = self.select_for_update().filter(blog_id=blog_id, user_id=user_id).first()
+            if vote is None or not vote.delete()[0]:
+                return None
+            return vote.vote_type, vote.created_at
+
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        blog, user = opts.get_field('blog'), opts.get_field('user')
+        created_at_field = opts.get_field('created_at')
+        sql = (
+            f"DELETE FROM {qn(opts.db_table)} WHERE {qn(blog.column)} = %s AND {qn(user.column)} = %s "
+            f"RETURNING {qn(opts.get_field('vote_type').column)}, {qn(created_at_field.column)}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [blog.get_db_prep_value(blog_id, connection),
+                                 user.get_db_prep_value(user_id, connection)])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return row[0], self._to_datetime(row[1], created_at_field, connection)
+
+    def _get_or_create_vote(self, blog_id, user_id, vote_type):
+        # backends without ON CONFLICT ... RETURNING (e.g. MySQL)
+        vote, created = self.select_for_update().get_or_create(
+            blog_id=blog_id, user_id=user_id, defaults={'vote_type': vote_type},
+        )
+        if created:
+            return self.CREATED, vote.created_at
+        if vote.vote_type == vote_type:
+            return self.UNCHANGED, None
+        self.filter(pk=vote.pk).update(vote_type=vote_type, updated_at=timezone.now())
+        return self.CHANGED, vote.created_at
+
+    @staticmethod
+    def _to_datetime(value, field, connection):
+        for converter in connection.ops.get_db_converters(field.get_col(field.model._meta.db_table)):
+            value = converter(value, field, connection)
+        return value
+
+
 class BlogVote(models.Model):
     VOTE_TYPE_CHOICES = [
         ('up', 'Upvote'),
@@ -23,7 +202,11 @@ class BlogVote(models.Model):
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='votes')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     vote_type = models.CharField(max_length=4, choices=VOTE_TYPE_CHOICES)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # when the vote last changed direction; NULL for a vote as first cast
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    objects = BlogVoteManager()
 
     class Meta:
         unique_together = ('blog', 'user')  # Ensure a user can only vote once per blog
@@ -32,13 +215,199 @@ class BlogVote(models.Model):
         return f"{self.user} voted {self.vote_type} on {self.blog}"
 
 
+class CommentManager(models.Manager):
+    def adjust_reply_counts(self, deltas):
+        """
+        Shift the reply_count of many comments in one UPDATE; `deltas` maps a
+        comment id to its change. Counts stop at 0, like Blog.comment_count.
+        """
+        deltas = {comment_id: delta for comment_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        return self.filter(id__in=list(deltas)).update(reply_count=Greatest(F('reply_count') + _shift(deltas), 0))
+
+
 class Comment(models.Model):
+    # `path` is the materialized thread path: the zero-padded ids of every
+    # ancestor comment followed by the comment's own id, PATH_STEP characters
+    # each. Ordering a blog's comments by path yields the thread in pre-order
+    # and a subtree is the contiguous range [path, path + PATH_END).
+    PATH_STEP = 10
+    PATH_END = ':'  # sorts right after '9'
+    MAX_DEPTH = 99
+
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.TextField()
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
     replies = GenericRelation('Comment')
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, null=True, blank=True, related_name='thread_comments')
+    depth = models.PositiveIntegerField(default=0)
+    path = models.CharField(max_length=PATH_STEP * (MAX_DEPTH + 1), blank=True, default='', editable=False)
+    # direct replies, maintained like Blog.comment_count
+    reply_count = models.PositiveIntegerField(default=0)
+
+    objects = CommentManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['blog', 'path'], name='blogs_comment_thread_idx'),
+            # replies of a comment, and the cascade when one is deleted
+            models.Index(fields=['content_type', 'object_id'], name='blogs_comment_target_idx'),
+        ]
 
     def __str__(self):
         return (self.description[:50] + '...') if len(self.description) > 50 else self.description
+
+    @classmethod
+    def path_segment(cls, pk):
+        return str(pk).zfill(cls.PATH_STEP)
+
+    @classmethod
+    def thread_position(cls, target):
+        """
+        Return (blog_id, parent_path, depth) for a new comment on `target`,
+        which is either a Blog or the Comment being replied to.
+        """
+        if isinstance(target, Comment):
+            return target.blog_id, target.path, target.depth + 1
+        return target.pk, '', 0
+
+    @classmethod
+    def resolve_targets(cls, comments):
+        """
+        Load `content_object` for a batch of comments with one query per
+        target model instead of one per comment. Missing targets resolve to None.
+        """
+        comments = list(comments)
+        ids_by_type = {}
+        for comment in comments:
+            ids_by_type.setdefault(comment.content_type_id, set()).add(comment.object_id)
+
+        targets = {}
+        for content_type_id, ids in ids_by_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+            for pk, target in model._default_manager.in_bulk(list(ids)).items():
+                targets[content_type_id, pk] = target
+
+        field = cls._meta.get_field('content_object')
+        for comment in comments:
+            field.set_cached_value(comment, targets.get((comment.content_type_id, comment.object_id)))
+        return comments
+
+    @property
+    def parent_path(self):
+        return self.path[:-self.PATH_STEP]
+
+    def save(self, *args, **kwargs):
+        assign_path = self._state.adding and not self.path
+        if assign_path:
+            target = self.content_object
+            if target is None:
+                raise ValidationError("A comment has to be posted on an existing blog or comment.")
+            self.blog_id, parent_path, self.depth = self.thread_position(target)
+        super().save(*args, **kwargs)
+        if assign_path:
+            self.path = parent_path + self.path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of `manage.py import_content` through one source file: the byte
+    offset and line number after the last committed chunk. It is saved in
+    the transaction of the chunk, so it never runs ahead of or behind the
+    imported rows.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    line = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} at line {self.line}"
+
+
+class ImportedRecord(models.Model):
+    """
+    The id a row of an import source got here, so later chunks, and a
+    resumed run, can resolve references to it.
+    """
+    KIND_CHOICES = [
+        ('blog', 'Blog'),
+        ('comment', 'Comment'),
+    ]
+
+    source = models.CharField(max_length=255)
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    legacy_id = models.CharField(max_length=64)
+    object_id = models.PositiveBigIntegerField()
+
+    class Meta:
+        unique_together = ('source', 'kind', 'legacy_id')
+
+
+class StoredBlob(models.Model):
+    """
+    One attachment file in object storage, stored once however many
+    attachments share its content.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    # object name under blogs.attachments.storage
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class Attachment(models.Model):
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='attachments')
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, related_name='attachments')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
+
+class AttachmentUpload(models.Model):
+    """
+    A chunked upload in progress (see blogs.attachments). The chunks go to
+    the multipart upload `storage_upload_id` of object `name`; the parts
+    received so far are listed from storage, not kept here.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='attachment_uploads')
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    storage_upload_id = models.CharField(max_length=255)
+    attachment = models.OneToOneField(Attachment, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='upload')
+    # claimed by the request joining the chunks, see complete_upload()
+    completing_since = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, number):
+        """
+        Size of chunk `number` (1-based); only the last one may be short.
+        """
+        if number < self.chunk_count:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.chunk_count - 1)
+
+    def __str__(self):
+        return f"{self.filename} ({self.id})"
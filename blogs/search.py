@@ -0,0 +1,156 @@
+"""
+Full-text search over blog titles and descriptions.
+
+On SQLite builds with FTS5 the `blogs_blog_fts` virtual table (created by
+migration 0007) mirrors title/description keyed by the blog id; it is kept
+in sync by the post_save/post_delete receivers connected in BlogsConfig.
+Other backends, or SQLite without FTS5, fall back to `icontains` filtering.
+"""
+import html
+import re
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+FTS_TABLE = 'blogs_blog_fts'
+
+# bm25() column weights: a title hit counts ten times a description hit
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+# snippet() copies the indexed text verbatim, so it marks hits with control
+# characters that survive html.escape and become tags only afterwards
+_HIT_START = '\x02'
+_HIT_END = '\x03'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 16
+
+# orderings end with a unique column so they can double as pagination keys
+ORDERINGS = {
+    'relevance': None,
+    'newest': ('-id',),
+    'oldest': ('id',),
+    'top': ('-score', '-id'),
+}
+
+_fts_available = {}
+
+
+def fts_available(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    key = (using, str(connection.settings_dict['NAME']))
+    if key not in _fts_available:
+        _fts_available[key] = (
+            connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[key]
+
+
+def build_match_query(query):
+    """
+    Turn free user input into a safe FTS5 MATCH expression: every word becomes
+    a quoted phrase and the last one a prefix query, so results keep up while
+    the user is still typing.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += '*'
+    return ' '.join(phrases)
+
+
+def search_blogs(queryset, query, ordering=None):
+    """
+    Filter `queryset` down to blogs matching `query` and order the result.
+
+    With FTS every row carries `search_rank` (bm25, lower is better) and a
+    raw `search_snippet` to pass through highlight(); the fallback path
+    leaves them unset.
+    """
+    match = build_match_query(query) if query else None
+
+    if match and fts_available(queryset.db):
+        snippet = "snippet({table}, -1, '{start}', '{end}', '{ellipsis}', {tokens})".format(
+            table=FTS_TABLE, start=_HIT_START, end=_HIT_END,
+            ellipsis=SNIPPET_ELLIPSIS, tokens=SNIPPET_TOKENS,
+        )
+        qn = connections[queryset.db].ops.quote_name
+        opts = queryset.model._meta
+        queryset = queryset.extra(
+            select={
+                'search_rank': f'bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})',
+                'search_snippet': snippet,
+            },
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {qn(opts.db_table)}.{qn(opts.pk.column)}', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        )
+        if ordering in (None, 'relevance'):
+            return queryset.order_by('search_rank', '-id')
+    elif query:
+        queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+        if ordering in (None, 'relevance'):
+            return queryset.order_by('-id')
+
+    if ORDERINGS.get(ordering):
+        queryset = queryset.order_by(*ORDERINGS[ordering])
+    return queryset
+
+
+def highlight(snippet):
+    """
+    HTML-escape a raw `search_snippet` and wrap its hits in SNIPPET_START and
+    SNIPPET_END.
+    """
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_HIT_START, SNIPPET_START).replace(_HIT_END, SNIPPET_END)
+
+
+def _blog_table():
+    return apps.get_model('blogs', 'Blog')._meta.db_table
+
+
+def _execute(using, sql, params):
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def index_blog(sender, instance, using=DEFAULT_DB_ALIAS, update_fields=None, **kwargs):
+    if not fts_available(using):
+        return
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    _execute(using, f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+    _execute(using, f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+             [instance.pk, instance.title, instance.description])
+
+
+def unindex_blog(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if not fts_available(using):
+        return
+    _execute(using, f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    if not fts_available(using):
+        return
+    _execute(using, f'DELETE FROM {FTS_TABLE}', [])
+    _execute(using, f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                    f'SELECT id, title, description FROM {_blog_table()}', [])
+
+
+def index_blogs(blog_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Index blogs written with bulk_create, which sends no post_save.
+    """
+    if not blog_ids or not fts_available(using):
+        return
+    placeholders = ', '.join(['%s'] * len(blog_ids))
+    _execute(using, f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(blog_ids))
+    _execute(using, f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                    f'SELECT id, title, description FROM {_blog_table()} WHERE id IN ({placeholders})',
+             list(blog_ids))
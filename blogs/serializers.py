@@ -1,9 +1,13 @@
 from rest_framework import serializers
-from .models import Blog, Comment
+from . import search
+from .models import Attachment, AttachmentUpload, Blog, Comment
 from users.models import User
-from rest_framework.pagination import PageNumberPagination
 from users.serializers import UserSerializer
+from utils.pagination import StandardPageNumberPagination
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from drf_spectacular.utils import extend_schema_field
 
 
 class AuthorSerializer(UserSerializer):
@@ -14,20 +18,33 @@ class AuthorSerializer(UserSerializer):
 
 class BlogSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
-    total_votes = serializers.SerializerMethodField()
+    total_votes = serializers.IntegerField(source='score', read_only=True)
 
     class Meta:
         model = Blog
-        fields = '__all__'
+        # the vote counters behind total_votes stay internal
+        fields = ('id', 'title', 'description', 'author', 'total_votes', 'comment_count')
 
-    def get_total_votes(self, obj):
-        try:
-            return obj.total_votes
-        except:
-            try:
-                return obj.votes.filter(vote_type='up').count() - obj.votes.filter(vote_type='down').count()
-            except:
-                return None
+
+class HotBlogSerializer(BlogSerializer):
+    hot_score = serializers.FloatField(read_only=True)
+
+    class Meta(BlogSerializer.Meta):
+        fields = BlogSerializer.Meta.fields + ('hot_score',)
+
+
+class BlogSearchSerializer(BlogSerializer):
+    rank = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+
+    class Meta(BlogSerializer.Meta):
+        fields = BlogSerializer.Meta.fields + ('rank', 'snippet')
+
+    def get_rank(self, obj):
+        return getattr(obj, 'search_rank', None)
+
+    def get_snippet(self, obj):
+        return search.highlight(getattr(obj, 'search_snippet', None))
 
 
 class BlogCreateUpdateSerializer(serializers.ModelSerializer):
@@ -35,7 +52,7 @@ class BlogCreateUpdateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Blog
-        fields = '__all__'
+        fields = ('id', 'title', 'description', 'author')
 
     def create(self, validated_data):
         user = self.context['request'].user
@@ -48,19 +65,91 @@ class BlogVoteRequestSerializer(serializers.Serializer):
     vote_type = serializers.ChoiceField(choices=['up', 'down'])
 
 
+class BlogVoteBatchItemSerializer(BlogVoteRequestSerializer):
+    blog_id = serializers.IntegerField(min_value=1)
+    remove = serializers.BooleanField(default=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields['vote_type'].required = False
+        return fields
+
+    def validate(self, data):
+        if data['remove'] == ('vote_type' in data):
+            raise serializers.ValidationError("Send either vote_type or remove: true.")
+        return data
+
+
+class BlogVoteBatchRequestSerializer(serializers.Serializer):
+    votes = BlogVoteBatchItemSerializer(many=True, allow_empty=False, max_length=settings.VOTE_BATCH_MAX_ITEMS)
+
+
+class BlogVoteBatchResultSerializer(serializers.Serializer):
+    blog_id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['created', 'changed', 'unchanged', 'removed', 'not_voted', 'not_found'])
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if self.child.expand_related:
+            data = Comment.resolve_targets(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        return super().to_representation(data)
+
+
 class CommentSerializer(serializers.ModelSerializer):
+    """
+    `related_object`, `related_id` and `source_type` describe what the comment
+    was posted on and come from content_type/object_id alone. The target itself
+    is only loaded (in batches) when the request asks for `?expand=related`.
+    """
     author = AuthorSerializer(read_only=True)
     related_object = serializers.SerializerMethodField()
+    related_id = serializers.IntegerField(source='object_id', read_only=True)
+    source_type = serializers.SerializerMethodField()
+    related = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
-        exclude = ('object_id', 'content_type')
+        # blog, depth and path are thread bookkeeping; CommentTreeSerializer
+        # nests by them instead
+        fields = ('id', 'author', 'description', 'reply_count', 'related_object', 'related_id', 'source_type',
+                  'related')
+        read_only_fields = ('reply_count',)
+        list_serializer_class = CommentListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        self.expand_related = request is not None and 'related' in request.query_params.get('expand', '').split(',')
+        if not self.expand_related:
+            self.fields.pop('related')
 
     def get_related_object(self, obj):
-        try:
-            return obj.content_object.__class__.__name__
-        except:
-            return None
+        model = ContentType.objects.get_for_id(obj.content_type_id).model_class()
+        return model.__name__ if model else None
+
+    def get_source_type(self, obj):
+        return ContentType.objects.get_for_id(obj.content_type_id).model
+
+    def get_related(self, obj):
+        target = obj.content_object
+        if isinstance(target, Blog):
+            return {'id': target.id, 'title': target.title}
+        if isinstance(target, Comment):
+            return {'id': target.id, 'description': str(target)}
+        return None
+
+
+class CommentTreeSerializer(serializers.ModelSerializer):
+    author = AuthorSerializer(read_only=True)
+    replies = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'author', 'description', 'depth', 'replies')
+
+    def get_replies(self, obj):
+        return [self.to_representation(reply) for reply in getattr(obj, 'tree_replies', [])]
 
 
 class CommentCreateSerializer(serializers.ModelSerializer):
@@ -95,6 +184,8 @@ class CommentCreateSerializer(serializers.ModelSerializer):
             data['content_object'] = Blog.objects.get(id=related_id)
         elif source_type == 'comment':
             data['content_object'] = Comment.objects.get(id=related_id)
+            if data['content_object'].depth >= Comment.MAX_DEPTH:
+                raise serializers.ValidationError(f"Replies can not be nested deeper than {Comment.MAX_DEPTH} levels.")
 
         data.pop('related_id', None)
         data.pop('source_type', None)
@@ -103,32 +194,84 @@ class CommentCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Create a Comment instance using content_object.
+        Create a Comment instance using content_object, counting it in its
+        blog's comment_count and its parent's reply_count.
         """
-        print('validated: ', validated_data)
         user = self.context['request'].user
         validated_data['author'] = user
         # content_object = validated_data.pop('content_object')
         # validated_data['content_type'] = ContentType.objects.get_for_model(content_object)
         # validated_data['object_id'] = content_object.id
-        return super().create(validated_data)
+        with transaction.atomic():
+            comment = super().create(validated_data)
+            Blog.objects.adjust_comment_counts({comment.blog_id: 1})
+            if comment.depth:
+                Comment.objects.adjust_reply_counts({comment.object_id: 1})
+        return comment
 
 
 class BlogDetailSerializer(BlogSerializer):
     comments = serializers.SerializerMethodField()
 
+    class Meta(BlogSerializer.Meta):
+        fields = BlogSerializer.Meta.fields + ('comments',)
+
     def get_comments(self, obj):
         request = self.context.get('request')
 
-        paginator = PageNumberPagination()
+        paginator = StandardPageNumberPagination()
         paginator.page_query_param = 'comments_page'
-        comments_queryset = obj.comments.all()
+        paginator.page_size_query_param = 'comments_page_size'
+        comments_queryset = obj.comments.select_related('author').order_by('id')
 
         page = paginator.paginate_queryset(comments_queryset, request, view=self.context.get('view'))
 
         if page is not None:
-            serializer = CommentSerializer(page, many=True)
+            serializer = CommentSerializer(page, many=True, context=self.context)
             return paginator.get_paginated_response(serializer.data).data
 
-        serializer = CommentSerializer(comments_queryset, many=True)
+        serializer = CommentSerializer(comments_queryset, many=True, context=self.context)
         return serializer.data
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(source='blob.size', read_only=True)
+    sha256 = serializers.CharField(source='blob.sha256', read_only=True)
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Attachment
+        fields = ('id', 'blog', 'filename', 'content_type', 'size', 'sha256', 'url', 'created_at')
+
+    def get_url(self, obj) -> str:
+        # presigned download links, signed for the whole page by the view
+        return self.context['links'][obj.id]
+
+
+class AttachmentUploadCreateSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=1, max_value=settings.ATTACHMENT_MAX_SIZE)
+    content_type = serializers.CharField(max_length=100, default='application/octet-stream')
+
+    class Meta:
+        model = AttachmentUpload
+        fields = ('filename', 'content_type', 'size')
+
+
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    attachment = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AttachmentUpload
+        fields = ('id', 'blog', 'filename', 'content_type', 'size', 'chunk_size', 'chunk_count', 'received_chunks',
+                  'attachment', 'created_at')
+
+    def get_received_chunks(self, obj) -> list[int]:
+        return self.context['received_chunks']
+
+    @extend_schema_field(AttachmentSerializer(allow_null=True))
+    def get_attachment(self, obj):
+        if obj.attachment is None:
+            return None
+        return AttachmentSerializer(obj.attachment, context=self.context).data
@@ -0,0 +1,25 @@
+from tasks.queue import handler
+from utils.storage import ObjectStorage
+from . import attachments
+
+
+@handler('blogs.delete_objects', batch=True, batch_size=1000, priority=-10)
+def delete_objects(payloads):
+    """
+    Delete storage objects, given as {'prefix', 'name'}, with one batch
+    delete request per prefix.
+    """
+    by_prefix = {}
+    for payload in payloads:
+        by_prefix.setdefault(payload['prefix'], []).append(payload['name'])
+    failed = {}
+    for prefix, names in by_prefix.items():
+        failed.update(ObjectStorage(prefix).delete_many(names))
+    if failed:
+        # deletes are idempotent, so retrying the whole batch is safe
+        raise RuntimeError(f"{len(failed)} objects were not deleted, e.g. {next(iter(failed.items()))}")
+
+
+@handler('blogs.abort_upload', priority=-10)
+def abort_upload(payload):
+    attachments.storage.abort_multipart_upload(payload['name'], payload['upload_id'])
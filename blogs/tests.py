@@ -1,3 +1,1051 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import warnings
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from core import metrics
+from utils import storage
+from . import attachments, detail_cache, export, leaderboard, search
+from .management.commands.import_content import Command as ImportCommand
+from .models import Attachment, AttachmentUpload, Blog, BlogVote, Comment, ImportCheckpoint, StoredBlob
+from users.models import User
 
-# Create your tests here.
+
+PAGE_SIZES = (1, 10, 100)
+
+
+class BlogApiTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(phone_number=f'09120000{i:02d}', password='password-123', first_name=f'user{i}')
+            for i in range(5)
+        ]
+        cls.author = cls.users[0]
+        Blog.objects.bulk_create([
+            Blog(title=f'blog {i}', description=f'description of blog {i}', author=cls.users[i % len(cls.users)])
+            for i in range(120)
+        ])
+        search.rebuild_index()  # bulk_create skips the post_save indexing
+        cls.blog = Blog.objects.order_by('id').first()
+        for i in range(110):
+            Comment.objects.create(author=cls.users[i % len(cls.users)], description=f'comment {i}',
+                                   content_object=cls.blog)
+        parent = cls.blog.comments.order_by('id').first()
+        for i in range(30):
+            parent = Comment.objects.create(author=cls.users[i % len(cls.users)], description=f'reply {i}',
+                                            content_object=parent)
+        for user in cls.users:
+            BlogVote.objects.create(blog=cls.blog, user=user, vote_type='up')
+        # the fixtures are written past the views that keep the counters
+        call_command('rebuild_counters', stdout=io.StringIO())
+
+    def setUp(self):
+        # keep the ContentType cache state identical for every measured request
+        ContentType.objects.clear_cache()
+        ContentType.objects.get_for_models(Blog, Comment)
+        cache.clear()
+        caches[settings.BLOG_DETAIL_CACHE].clear()
+
+
+class QueryBudgetTests(BlogApiTestCase):
+    """
+    Every read endpoint has to run a fixed number of queries, whatever the
+    page size. A failure here is an N+1 regression.
+    """
+
+    def assertQueryBudget(self, url, budget, page_size_param='page_size', **params):
+        for page_size in PAGE_SIZES:
+            with self.subTest(url=url, page_size=page_size):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url, {page_size_param: page_size, **params})
+                self.assertEqual(response.status_code, 200)
+
+    def test_blog_list(self):
+        # keyset pagination: the page with authors joined, no COUNT(*)
+        self.assertQueryBudget('/blog/blogs/', 1)
+        self.assertQueryBudget('/blog/blogs/', 1, ordering='top')
+
+    def test_blog_search(self):
+        # relevance ordered search is page numbered: count, page
+        self.assertQueryBudget('/blog/blogs/', 2, q='blog')
+        self.assertQueryBudget('/blog/blogs/', 1, q='blog', ordering='newest')
+
+    def test_blog_retrieve(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/blog/blogs/{self.blog.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_most_popular_blogs(self):
+        self.assertQueryBudget('/blog/most-popular-blogs', 1)
+
+    def test_comment_list(self):
+        self.assertQueryBudget('/blog/comments/', 1)
+
+    def test_comment_list_expanded(self):
+        # plus one query per target model on the page: the first pages only hold comments on blogs
+        self.assertQueryBudget('/blog/comments/', 2, expand='related')
+        cursor = self.client.get('/blog/comments/', {'page_size': 100}).data['next']
+        with self.assertNumQueries(3):
+            response = self.client.get(cursor + '&expand=related')
+        first, last = response.data['results'][0], response.data['results'][-1]
+        self.assertEqual((first['source_type'], first['related_id']), ('blog', self.blog.id))
+        self.assertEqual(first['related'], {'id': self.blog.id, 'title': self.blog.title})
+        self.assertEqual(last['source_type'], 'comment')
+        self.assertEqual(last['related']['id'], last['related_id'])
+
+    def test_comment_retrieve(self):
+        comment = Comment.objects.filter(depth=3).first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/blog/comments/{comment.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_blog_detail(self):
+        # blog with author, comments count, comments page with authors
+        self.assertQueryBudget(f'/blog/blog-detail/{self.blog.id}/', 3, page_size_param='comments_page_size')
+
+    def test_blog_comments(self):
+        # blog lookup, page with authors
+        self.assertQueryBudget(f'/blog/{self.blog.id}/comments/', 2)
+        self.assertQueryBudget(f'/blog/{self.blog.id}/comments/', 3, expand='related')
+
+    def test_blog_comment_tree(self):
+        self.assertQueryBudget(f'/blog/{self.blog.id}/comments/tree/', 1, page_size_param='limit')
+
+
+class KeysetPaginationTests(BlogApiTestCase):
+    def walk(self, url, **params):
+        pages = []
+        response = self.client.get(url, {'page_size': 7, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_popular_blogs_walk_every_blog_once_in_rank_order(self):
+        Blog.objects.filter(id__in=Blog.objects.order_by('-id').values('id')[:10]).update(score=3)
+        pages = self.walk('/blog/most-popular-blogs')
+
+        ranked = [(blog['total_votes'], blog['id']) for page in pages for blog in page['results']]
+        self.assertEqual(len(ranked), Blog.objects.count())
+        self.assertEqual(ranked, sorted(ranked, reverse=True))
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link_returns_the_previous_page(self):
+        pages = self.walk('/blog/blogs/', ordering='newest')
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_deep_page_costs_the_same_as_the_first(self):
+        last_cursor = self.walk('/blog/comments/')[-2]['next']
+        with self.assertNumQueries(1):
+            self.client.get(last_cursor)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/blog/blogs/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/blog/blogs/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursors_are_not_found(self):
+        def cursor(payload):
+            return urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        cases = [
+            ('/blog/blogs/', urlsafe_b64encode(b'{"p":').decode()),
+            ('/blog/blogs/', cursor({'p': ['abc'], 'r': 0})),
+            ('/blog/blogs/', cursor({'p': [[1]], 'r': 0})),
+            ('/blog/blogs/', cursor({'p': [None], 'r': 0})),
+            ('/blog/blogs/', cursor({'p': [1, 2], 'r': 0})),
+            ('/blog/blogs/', cursor([1])),
+            ('/blog/most-popular-blogs', cursor({'p': ['x', 1], 'r': 0})),
+            ('/blog/most-popular-blogs', cursor({'p': [1], 'r': 0})),
+            ('/blog/comments/', cursor({'p': [{}], 'r': 1})),
+        ]
+        for url, value in cases:
+            with self.subTest(url=url, cursor=value):
+                self.assertEqual(self.client.get(url, {'cursor': value}).status_code, 404)
+
+
+class HotRankingTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old_blog, self.new_blog, self.other_blog = Blog.objects.order_by('id')[1:4]
+        # three day-old upvotes against one fresh upvote
+        for user in self.users[:3]:
+            BlogVote.objects.create(blog=self.old_blog, user=user, vote_type='up')
+            Blog.objects.adjust_vote_counts(self.old_blog.id, added='up')
+        BlogVote.objects.filter(blog=self.old_blog).update(created_at=timezone.now() - timedelta(days=1))
+        BlogVote.objects.create(blog=self.new_blog, user=self.users[0], vote_type='up')
+        Blog.objects.adjust_vote_counts(self.new_blog.id, added='up')
+
+    def hot_ids(self):
+        response = self.client.get('/blog/most-popular-blogs', {'ranking': 'hot', 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return [blog['id'] for blog in response.data['results']]
+
+    def test_recent_votes_outrank_older_ones(self):
+        hot = self.hot_ids()
+        self.assertLess(hot.index(self.new_blog.id), hot.index(self.old_blog.id))
+        all_time = [blog['id'] for blog in self.client.get('/blog/most-popular-blogs', {'page_size': 100}).data['results']]
+        self.assertGreater(all_time.index(self.new_blog.id), all_time.index(self.old_blog.id))
+
+    def test_votes_update_the_cached_board(self):
+        self.hot_ids()
+        self.client.force_authenticate(self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/vote/{self.other_blog.id}/', {'vote_type': 'up'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/vote/{self.new_blog.id}/', {'vote_type': 'down'})
+        incremental = dict(leaderboard.ranking()[:])
+
+        leaderboard.rebuild()
+        rebuilt = dict(leaderboard.ranking()[:])
+        self.assertEqual(list(incremental), list(rebuilt))
+        for blog_id, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[blog_id], score, places=3)
+
+    def test_votes_off_the_board_are_scored_without_queries(self):
+        self.hot_ids()
+        outside = Blog.objects.order_by('id')[6]
+        self.client.force_authenticate(self.users[1])
+        # complete board: the vote is the blog's only one in the window
+        with self.assertNumQueries(4):  # savepoint, upsert, counter update, release
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/blog/vote/{outside.id}/', {'vote_type': 'up'})
+        self.assertIn(outside.id, dict(leaderboard.ranking()[:]))
+
+    def test_only_upvotes_can_lift_a_blog_onto_a_full_board(self):
+        with mock.patch.object(leaderboard, 'SIZE', 1):
+            self.hot_ids()
+            self.client.force_authenticate(self.users[1])
+            with self.assertNumQueries(4):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(f'/blog/vote/{self.old_blog.id}/', {'vote_type': 'down'})
+            # the blog's votes, loaded once the upvote might lift it
+            with self.assertNumQueries(5):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(f'/blog/vote/{self.other_blog.id}/', {'vote_type': 'up'})
+            incremental = dict(leaderboard.ranking()[:])
+            leaderboard.rebuild()
+            self.assertEqual(list(incremental), list(dict(leaderboard.ranking()[:])))
+
+    def test_page_is_served_from_the_cache(self):
+        self.hot_ids()
+        with self.assertNumQueries(1):  # the blogs of the page
+            self.hot_ids()
+
+    def test_invalid_ranking(self):
+        response = self.client.get('/blog/most-popular-blogs', {'ranking': 'newest'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BlogDetailCacheTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f'/blog/blog-detail/{self.blog.id}/'
+        self.admin = User.objects.create_superuser(phone_number='0912999999', password='password-123')
+
+    def assertCached(self, cached, **params):
+        before = detail_cache.stats()
+        with self.assertNumQueries(0 if cached else 3):
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        after = detail_cache.stats()
+        self.assertEqual(after['hits'] - before['hits'], int(cached))
+        self.assertEqual(after['misses'] - before['misses'], int(not cached))
+        return response
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.assertCached(False)
+        second = self.assertCached(True)
+        self.assertEqual(first.data, second.data)
+        self.assertCached(False, comments_page=2)
+        self.assertCached(True, comments_page=2)
+
+    def test_vote_invalidates(self):
+        self.assertCached(False)
+        voter = User.objects.create_user(phone_number='0912888888', password='password-123')
+        self.client.force_authenticate(voter)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/blog/vote/{self.blog.id}/', {'vote_type': 'down'})
+        self.client.force_authenticate(None)
+        response = self.assertCached(False)
+        self.assertEqual(response.data['total_votes'], len(self.users) - 1)
+
+    def test_comment_create_and_delete_invalidate(self):
+        self.assertCached(False)
+        reply_to = Comment.objects.filter(blog=self.blog, depth=2).first()
+        self.client.force_authenticate(self.admin)
+        self.client.post('/blog/comments/', {'description': 'new', 'related_id': reply_to.id, 'source_type': 'comment'})
+        self.client.force_authenticate(None)
+        self.assertCached(False)
+
+        self.client.force_authenticate(self.admin)
+        self.client.delete(f'/blog/comments/{reply_to.id}/')
+        self.client.force_authenticate(None)
+        self.assertCached(False)
+
+    def test_blog_edit_invalidates(self):
+        self.assertCached(False)
+        self.client.force_authenticate(self.author)
+        self.client.put(f'/blog/blogs/{self.blog.id}/', {'title': 'edited'})
+        self.client.force_authenticate(None)
+        self.assertEqual(self.assertCached(False).data['title'], 'edited')
+
+
+class VoteWritePathTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.target = Blog.objects.order_by('id')[5]
+        self.voter = self.users[1]
+        self.client.force_authenticate(self.voter)
+
+    def vote(self, vote_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/blog/vote/{self.target.id}/', {'vote_type': vote_type})
+
+    def assertCounters(self, up, down):
+        self.target.refresh_from_db()
+        self.assertEqual((self.target.up_count, self.target.down_count, self.target.score), (up, down, up - down))
+
+    def test_create_flip_repeat_and_delete(self):
+        self.assertEqual(self.vote('up').status_code, 200)
+        self.assertCounters(1, 0)
+        self.assertEqual(self.vote('up').status_code, 400)
+        self.assertCounters(1, 0)
+        self.assertEqual(self.vote('down').data, 'Vote updated to down.')
+        self.assertCounters(0, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/blog/vote/{self.target.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertCounters(0, 0)
+        self.assertFalse(BlogVote.objects.filter(blog=self.target, user=self.voter).exists())
+        self.assertEqual(self.client.delete(f'/blog/vote/{self.target.id}/').status_code, 404)
+
+    def test_blog_row_is_not_loaded(self):
+        # savepoint, upsert, counter update, release
+        with self.assertNumQueries(4):
+            self.vote('up')
+        # savepoint, upsert returning nothing, release
+        with self.assertNumQueries(3):
+            self.vote('up')
+
+    def test_upsert_tells_inserts_from_updates(self):
+        votes = BlogVote.objects
+        # a flip within the same clock tick as the first vote is still an update
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            self.assertEqual(votes.upsert(self.target.id, self.voter.id, 'up')[0], votes.CREATED)
+            self.assertEqual(votes.upsert(self.target.id, self.voter.id, 'down')[0], votes.CHANGED)
+            self.assertEqual(votes.upsert(self.target.id, self.voter.id, 'down'), (votes.UNCHANGED, None))
+        self.assertIsNotNone(votes.get(blog=self.target, user=self.voter).updated_at)
+
+    def test_unknown_blog(self):
+        response = self.client.post('/blog/vote/999999/', {'vote_type': 'up'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(BlogVote.objects.filter(blog_id=999999).exists())
+
+
+class VoteBatchTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.targets = list(Blog.objects.order_by('id')[10:20])
+        self.voter = self.users[2]
+        self.client.force_authenticate(self.voter)
+
+    def post_batch(self, votes):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/blog/vote/batch/', {'votes': votes}, format='json')
+
+    def assertCountersMatchVotes(self, blogs):
+        for blog in Blog.objects.filter(id__in=[blog.id for blog in blogs]):
+            up = BlogVote.objects.filter(blog=blog, vote_type='up').count()
+            down = BlogVote.objects.filter(blog=blog, vote_type='down').count()
+            self.assertEqual((blog.up_count, blog.down_count, blog.score), (up, down, up - down))
+
+    def test_items_are_applied_in_order(self):
+        first, second, third = self.targets[:3]
+        BlogVote.objects.create(blog=third, user=self.voter, vote_type='up')
+        Blog.objects.adjust_vote_counts(third.id, added='up')
+
+        response = self.post_batch([
+            {'blog_id': first.id, 'vote_type': 'up'},
+            {'blog_id': first.id, 'vote_type': 'up'},
+            {'blog_id': first.id, 'vote_type': 'down'},
+            {'blog_id': second.id, 'remove': True},
+            {'blog_id': second.id, 'vote_type': 'up'},
+            {'blog_id': second.id, 'remove': True},
+            {'blog_id': third.id, 'remove': True},
+            {'blog_id': 999999, 'vote_type': 'up'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data], [
+            'created', 'unchanged', 'changed', 'not_voted', 'created', 'removed', 'removed', 'not_found',
+        ])
+        votes = BlogVote.objects.filter(user=self.voter, blog__in=self.targets)
+        self.assertEqual(dict(votes.values_list('blog_id', 'vote_type')), {first.id: 'down'})
+        self.assertCountersMatchVotes(self.targets[:3])
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # savepoint, SQLite write lock, blogs, current votes, upsert, delete, counters, release
+        for size, voter in ((3, self.users[3]), (len(self.targets), self.users[4])):
+            self.client.force_authenticate(voter)
+            self.post_batch([{'blog_id': blog.id, 'vote_type': 'up'} for blog in self.targets])
+            votes = [{'blog_id': blog.id, 'vote_type': 'down'} for blog in self.targets[:size]]
+            votes.append({'blog_id': self.targets[-1].id, 'remove': True})
+            with self.subTest(size=size), self.assertNumQueries(8):
+                self.assertEqual(self.post_batch(votes).status_code, 200)
+        self.assertCountersMatchVotes(self.targets)
+
+    def test_hot_board_is_updated_with_one_query(self):
+        # two blogs for a board of one, so it is not complete
+        reader = User.objects.create_user(phone_number='0912999998', password='password-123')
+        for blog in Blog.objects.order_by('id')[:2]:
+            BlogVote.objects.create(blog=blog, user=reader, vote_type='up')
+        with mock.patch.object(leaderboard, 'SIZE', 1):
+            leaderboard.rebuild()
+            invalidations = detail_cache.stats()['invalidations']
+            # the batch as above without a delete, then the votes of the blogs the upvotes may lift onto the board
+            with self.assertNumQueries(8):
+                response = self.post_batch([{'blog_id': blog.id, 'vote_type': 'up'} for blog in self.targets])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(detail_cache.stats()['invalidations'] - invalidations, len(self.targets))
+            incremental = list(dict(leaderboard.ranking()[:]))
+            leaderboard.rebuild()
+            self.assertEqual(incremental, list(dict(leaderboard.ranking()[:])))
+
+    def test_invalid_items_reject_the_batch(self):
+        for votes in ([], [{'blog_id': self.targets[0].id}],
+                      [{'blog_id': self.targets[0].id, 'vote_type': 'up', 'remove': True}],
+                      [{'blog_id': self.targets[0].id, 'vote_type': 'sideways'}],
+                      [{'blog_id': self.targets[0].id, 'vote_type': 'up'}] * (settings.VOTE_BATCH_MAX_ITEMS + 1)):
+            with self.subTest(items=len(votes)):
+                self.assertEqual(self.post_batch(votes).status_code, 400)
+        self.assertFalse(BlogVote.objects.filter(user=self.voter, blog__in=self.targets).exists())
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.post_batch([{'blog_id': self.targets[0].id, 'vote_type': 'up'}]).status_code, 401)
+
+
+class AuthorPermissionTests(BlogApiTestCase):
+    """
+    The author check runs against the instance get_object() already loaded,
+    so authorizing a write costs no queries of its own.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.target = Blog.objects.filter(author=self.author).order_by('id')[1]
+        self.client.force_authenticate(self.author)
+
+    def test_blog_update(self):
+        # blog, UPDATE, search index DELETE + INSERT
+        with self.assertNumQueries(4):
+            response = self.client.put(f'/blog/blogs/{self.target.id}/', {'title': 'edited'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_blog_update_by_another_user(self):
+        self.client.force_authenticate(self.users[1])
+        with self.assertNumQueries(1):
+            response = self.client.put(f'/blog/blogs/{self.target.id}/', {'title': 'edited'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_blog_delete(self):
+        # blog, comments, attachments and thread comments to cascade to, votes, attachment uploads, blog,
+        # search index
+        with self.assertNumQueries(8):
+            response = self.client.delete(f'/blog/blogs/{self.target.id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_blog_delete_by_another_user(self):
+        self.client.force_authenticate(self.users[1])
+        with self.assertNumQueries(1):
+            response = self.client.delete(f'/blog/blogs/{self.target.id}/')
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Blog.objects.filter(id=self.target.id).exists())
+
+    def test_comment_delete(self):
+        comment = self.blog.comments.order_by('id').last()
+        admin = User.objects.create_superuser(phone_number='0912000099', password='password-123')
+        self.client.force_authenticate(admin)
+        # comment, savepoint, replies to cascade to, comment, blog comment_count, savepoint release
+        with self.assertNumQueries(6):
+            response = self.client.delete(f'/blog/comments/{comment.id}/')
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(BlogApiTestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The mirror has its own connection to the shared in-memory test
+        # database, outside the test transaction. Let it read that
+        # transaction's rows, as a caught up replica would.
+        connections['replica'].cursor().execute('PRAGMA read_uncommitted = true')
+
+    def setUp(self):
+        super().setUp()
+        self.reader = self.users[3]
+        self.client.force_authenticate(self.reader)
+
+    def assertServedBy(self, alias, url):
+        other = 'default' if alias == 'replica' else 'replica'
+        with CaptureQueriesContext(connections[alias]) as served, \
+                CaptureQueriesContext(connections[other]) as unused:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(served.captured_queries, f"{url} ran no queries on {alias}")
+        self.assertFalse(unused.captured_queries, f"{url} ran queries on {other}")
+        return response
+
+    def test_read_views_use_the_replica(self):
+        for url in ('/blog/blogs/', f'/blog/blogs/{self.blog.id}/', f'/blog/blog-detail/{self.blog.id}/',
+                    f'/blog/{self.blog.id}/comments/', '/blog/most-popular-blogs'):
+            with self.subTest(url=url):
+                self.assertServedBy('replica', url)
+
+    def test_other_views_use_the_primary(self):
+        self.assertServedBy('default', '/blog/comments/')
+        self.assertServedBy('default', f'/blog/{self.blog.id}/comments/tree/')
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        target = Blog.objects.order_by('id')[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/blog/vote/{target.id}/', {'vote_type': 'up'}).status_code, 200)
+        response = self.assertServedBy('default', f'/blog/blog-detail/{target.id}/')
+        self.assertEqual(response.data['total_votes'], 1)
+
+        # other users are not pinned
+        self.client.force_authenticate(self.users[4])
+        self.assertServedBy('replica', f'/blog/blogs/{target.id}/')
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post('/blog/vote/999999/', {'vote_type': 'up'})
+        self.assertServedBy('replica', f'/blog/blogs/{self.blog.id}/')
+
+    def test_objects_read_from_a_replica_are_saved_to_the_primary(self):
+        blog = Blog.objects.using('replica').get(id=self.blog.id)
+        blog.title = 'saved to the primary'
+        with CaptureQueriesContext(connections['default']) as primary:
+            blog.save()
+        self.assertTrue(primary.captured_queries)
+
+
+class RequestMetricsTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get(f'/blog/{self.blog.id}/comments/')
+        timings = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'total', 'db', 'serialize', 'render'})
+        # blog lookup, page with authors
+        self.assertIn('desc="2 queries"', timings['db'])
+
+    async def test_server_timing_under_asgi(self):
+        response = await self.async_client.get(f'/blog/{self.blog.id}/comments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+    def test_streamed_body_queries_are_counted(self):
+        admin = User.objects.create_user(phone_number='0912999997', password='password-123', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/blog/export/')
+        header_queries = int(response['Server-Timing'].split('desc="')[1].split(' ')[0])
+        b''.join(response.streaming_content)
+
+        route = 'method="GET",route="blog/export/"'
+        line = next(line for line in metrics.render().splitlines()
+                    if line.startswith(f'http_request_db_queries_total{{{route}}}'))
+        # the export reads blogs and comments in batches while it streams
+        self.assertGreater(int(line.rsplit(' ', 1)[1]), header_queries)
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_metrics_aggregate_per_route(self):
+        for blog in Blog.objects.order_by('id')[:3]:
+            self.client.get(f'/blog/blog-detail/{blog.id}/')
+        self.client.get(f'/blog/blog-detail/{self.blog.id}/')
+
+        self.client.force_authenticate(User.objects.create_user(phone_number='0912999999', password='password-123',
+                                                                is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        route = 'method="GET",route="blog/blog-detail/<int:pk>/"'
+        self.assertIn(f'http_request_duration_seconds_count{{{route}}} 4', lines)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{route},le="+Inf"}} 4', lines)
+        self.assertIn(f'http_requests_total{{{route},status="2xx"}} 4', lines)
+        self.assertIn(f'blog_detail_cache_events_total{{event="hits"}} {detail_cache.stats()["hits"]}', lines)
+
+
+class BlogExportTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(phone_number='0912999998', password='password-123', is_staff=True)
+
+    def export(self, **params):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/blog/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], export.CONTENT_TYPE)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_export_streams_every_blog_with_its_thread(self):
+        records = self.export()
+        self.assertEqual([record['id'] for record in records],
+                         list(Blog.objects.order_by('id').values_list('id', flat=True)))
+        first = records[0]
+        self.assertEqual(first['author'], {'id': str(self.author.id), 'first_name': 'user0', 'last_name': ''})
+        self.assertEqual((first['up_count'], first['score'], first['comment_count']), (5, 5, 140))
+        self.assertEqual([comment['id'] for comment in first['comments']],
+                         list(Comment.objects.filter(blog=self.blog).order_by('path').values_list('id', flat=True)))
+        reply = next(comment for comment in first['comments'] if comment['depth'] == 1)
+        self.assertIsNotNone(reply['parent_id'])
+
+    def test_since_watermark(self):
+        since = Blog.objects.order_by('id')[99].id
+        self.assertEqual(len(self.export(since=since)), 20)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/blog/export/', {'since': 'x'}).status_code, 400)
+
+    def test_queries_per_chunk(self):
+        # the blog rows, then the comments of each chunk of 50 blogs
+        with self.assertNumQueries(4):
+            self.assertEqual(len(list(export.iter_blogs(chunk_size=50))), 120)
+
+    def test_export_is_admin_only(self):
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get('/blog/export/').status_code, 403)
+
+
+class ImportContentTests(BlogApiTestCase):
+    def write_source(self, lines):
+        source = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        with source:
+            source.write(''.join(json.dumps(line) + '\n' for line in lines))
+        self.addCleanup(os.unlink, source.name)
+        return source.name
+
+    def test_import_resumes_after_the_last_committed_chunk(self):
+        author, voter = self.users[1].phone_number, self.users[2].phone_number
+        path = self.write_source([
+            {'type': 'blog', 'id': 'b1', 'author': author, 'title': 'legacy', 'description': 'legacy blog'},
+            {'type': 'comment', 'id': 'c1', 'author': voter, 'blog': 'b1', 'description': 'top'},
+            {'type': 'comment', 'id': 'c2', 'author': author, 'parent': 'c1', 'description': 'reply'},
+            {'type': 'vote', 'blog': 'b1', 'user': voter, 'vote_type': 'up'},
+            {'type': 'comment', 'id': 'c3', 'author': voter, 'parent': 'c2', 'description': 'reply to reply'},
+            {'type': 'vote', 'blog': 'b1', 'user': author, 'vote_type': 'down'},
+            {'type': 'comment', 'id': 'c4', 'author': '0000000000', 'blog': 'b1', 'description': 'unknown author'},
+        ])
+        import_votes = ImportCommand.import_votes
+        calls = []
+
+        def crash_in_second_chunk(command, records):
+            calls.append(records)
+            if len(calls) == 2:
+                raise RuntimeError('crash')
+            return import_votes(command, records)
+
+        with mock.patch.object(ImportCommand, 'import_votes', crash_in_second_chunk), \
+                self.assertRaises(RuntimeError):
+            call_command('import_content', path, chunk_size=4, stdout=io.StringIO())
+        self.assertEqual(ImportCheckpoint.objects.get().line, 4)
+
+        call_command('import_content', path, chunk_size=4, stdout=io.StringIO())
+        blog = Blog.objects.get(title='legacy')
+        self.assertEqual((blog.up_count, blog.down_count, blog.score), (1, 1, 0))
+        thread = list(Comment.objects.filter(blog=blog).order_by('path').values_list('description', 'depth'))
+        self.assertEqual(thread, [('top', 0), ('reply', 1), ('reply to reply', 2)])
+        self.assertEqual(ImportCheckpoint.objects.get().line, 7)
+        self.assertEqual(search.search_blogs(Blog.objects.all(), 'legacy').get(), blog)
+
+
+@override_settings(ATTACHMENT_CHUNK_SIZE=4, OBJECT_STORAGE_BACKEND='local')
+class AttachmentUploadTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        settings_override = override_settings(OBJECT_STORAGE_LOCAL_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        client_patcher = mock.patch.object(storage, '_client', None)
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+        storage.presigned_url_cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def upload(self, content, filename='notes.txt', chunks=None):
+        response = self.client.post(f'/blog/{self.blog.id}/attachments/',
+                                    {'filename': filename, 'content_type': 'text/plain', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.data['id']
+        numbers = chunks or range(1, response.data['chunk_count'] + 1)
+        for number in numbers:
+            response = self.client.put(f'/blog/attachment-uploads/{upload_id}/chunks/{number}/',
+                                       content[(number - 1) * 4:number * 4], content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 204)
+        return upload_id
+
+    def stored_objects(self):
+        return sorted(path.name for path in (self.root / settings.AWS_STORAGE_BUCKET_NAME / 'attachments').iterdir())
+
+    def test_upload_resume_and_complete(self):
+        upload_id = self.upload(b'hello attachment', chunks=[3, 1])
+        response = self.client.get(f'/blog/attachment-uploads/{upload_id}/')
+        self.assertEqual((response.data['chunk_count'], response.data['received_chunks']), (4, [1, 3]))
+        response = self.client.post(f'/blog/attachment-uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+
+        for number in (2, 4):
+            self.client.put(f'/blog/attachment-uploads/{upload_id}/chunks/{number}/',
+                            b'hello attachment'[(number - 1) * 4:number * 4], content_type='application/octet-stream')
+        response = self.client.post(f'/blog/attachment-uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get()
+        self.assertEqual(response.data['attachment']['id'], attachment.id)
+        self.assertEqual(attachment.blob.size, 16)
+        with attachments.storage.open(attachment.blob.name) as body:
+            self.assertEqual(body.read(), b'hello attachment')
+
+        self.client.force_authenticate(None)
+        response = self.client.get(f'/blog/{self.blog.id}/attachments/')
+        self.assertEqual([item['filename'] for item in response.data], ['notes.txt'])
+        self.assertTrue(response.data[0]['url'].startswith('file://'))
+
+    @override_settings(TASKS_EAGER=True)
+    def test_identical_content_is_stored_once(self):
+        for filename in ('a.txt', 'b.txt'):
+            upload_id = self.upload(b'same bytes', filename=filename)
+            # the duplicate is deleted by a deferred task
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(f'/blog/attachment-uploads/{upload_id}/complete/')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Attachment.objects.count(), 2)
+        blob = StoredBlob.objects.get()
+        self.assertEqual(self.stored_objects(), [blob.name])
+
+    def test_chunks_are_validated(self):
+        upload_id = self.upload(b'0123456789', chunks=[1])
+        url = f'/blog/attachment-uploads/{upload_id}/chunks/'
+        self.assertEqual(self.client.put(f'{url}2/', b'45', content_type='application/octet-stream').status_code, 400)
+        self.assertEqual(self.client.put(f'{url}4/', b'', content_type='application/octet-stream').status_code, 400)
+        self.assertEqual(self.client.put(f'{url}3/', b'89', content_type='application/octet-stream').status_code, 204)
+
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get(f'/blog/attachment-uploads/{upload_id}/').status_code, 404)
+        response = self.client.post(f'/blog/{self.blog.id}/attachments/',
+                                    {'filename': 'x', 'size': 1})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.author)
+        with self.settings(TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/blog/attachment-uploads/{upload_id}/').status_code, 204)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(list((self.root / '.multipart').iterdir()), [])
+
+    def test_abandoned_or_expired_upload_is_not_found(self):
+        upload_id = self.upload(b'0123456789', chunks=[1])
+        upload = AttachmentUpload.objects.get(id=upload_id)
+        attachments.storage.abort_multipart_upload(upload.name, upload.storage_upload_id)
+
+        url = f'/blog/attachment-uploads/{upload_id}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.put(f'{url}chunks/2/', b'4567', content_type='application/octet-stream')
+                         .status_code, 404)
+        self.assertEqual(self.client.post(f'{url}complete/').status_code, 404)
+
+    def test_upload_is_completed_by_one_request(self):
+        upload_id = self.upload(b'hello')
+        url = f'/blog/attachment-uploads/{upload_id}/complete/'
+        # another request is joining the chunks
+        AttachmentUpload.objects.filter(id=upload_id).update(completing_since=timezone.now())
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attachment.objects.exists())
+
+        # a claim left behind by a crashed request lapses
+        AttachmentUpload.objects.filter(id=upload_id).update(completing_since=timezone.now() - timedelta(days=1))
+        first = self.client.post(url)
+        self.assertEqual(first.status_code, 201)
+        again = self.client.post(url)
+        self.assertEqual(again.data['attachment']['id'], first.data['attachment']['id'])
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_blob_goes_with_its_last_attachment(self):
+        for filename in ('a.txt', 'b.txt'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/blog/attachment-uploads/{self.upload(b"shared", filename=filename)}/complete/')
+        blob = StoredBlob.objects.get()
+        other = Blog.objects.exclude(id=self.blog.id).first()
+        Attachment.objects.create(blog=other, blob=blob, filename='c.txt', content_type='text/plain')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog.delete()
+        self.assertEqual(StoredBlob.objects.get(), blob)
+        self.assertEqual(self.stored_objects(), [blob.name])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(self.stored_objects(), [])
+
+
+class CommentCounterTests(BlogApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+
+    def comment(self, source_type, related_id):
+        response = self.client.post('/blog/comments/', {'description': 'counted', 'source_type': source_type,
+                                                        'related_id': related_id})
+        self.assertEqual(response.status_code, 201)
+        return Comment.objects.latest('id')
+
+    def test_counts_follow_creates_and_recursive_deletes(self):
+        top = self.comment('blog', self.blog.id)
+        reply = self.comment('comment', top.id)
+        self.comment('comment', reply.id)
+        self.comment('comment', reply.id)
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.comment_count, 140 + 4)
+        self.assertEqual(self.client.get(f'/blog/comments/{top.id}/').data['reply_count'], 1)
+        self.assertEqual(self.client.get(f'/blog/comments/{reply.id}/').data['reply_count'], 2)
+
+        self.client.force_authenticate(User.objects.create_superuser(phone_number='0912999999', password='x'))
+        self.assertEqual(self.client.delete(f'/blog/comments/{reply.id}/').status_code, 204)
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.comment_count, 140 + 1)
+        self.assertEqual(Comment.objects.get(id=top.id).reply_count, 0)
+        response = self.client.get(f'/blog/blogs/{self.blog.id}/')
+        self.assertEqual(response.data['comment_count'], 141)
+        call_command('rebuild_counters', '--verify', stdout=io.StringIO())
+
+    def test_rebuild_backfills_and_verify_reports_drift(self):
+        Blog.objects.filter(id=self.blog.id).update(comment_count=0)
+        parent = Comment.objects.filter(blog=self.blog, depth=0, reply_count=1).get()
+        Comment.objects.filter(id=parent.id).update(reply_count=5)
+        output = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--verify', stdout=output)
+        self.assertIn(f'blog {self.blog.id}:', output.getvalue())
+        self.assertIn(f'comment {parent.id}: stored replies=5, actual replies=1', output.getvalue())
+
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.comment_count, 140)
+        call_command('rebuild_counters', '--verify', stdout=io.StringIO())
+
+
+class VoteCounterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.voters = [User.objects.create_user(phone_number=f'09121000{i:02d}', password='password-123')
+                      for i in range(3)]
+        cls.blog = Blog.objects.create(title='voted', description='voted on', author=cls.voters[0])
+        for voter in cls.voters:
+            BlogVote.objects.create(blog=cls.blog, user=voter, vote_type='up')
+        call_command('rebuild_counters', stdout=io.StringIO())
+
+    def test_vote_totals_are_read_from_the_blog_row(self):
+        for url in ('/blog/most-popular-blogs', f'/blog/blogs/{self.blog.id}/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([query for query in queries.captured_queries if 'blogs_blogvote' in query['sql']])
+            blog = response.data['results'][0] if 'results' in response.data else response.data
+            self.assertEqual((blog['id'], blog['total_votes']), (self.blog.id, len(self.voters)))
+            self.assertFalse({'score', 'up_count', 'down_count'} & set(blog))
+
+    def test_rebuild_repairs_drifted_counters(self):
+        Blog.objects.filter(id=self.blog.id).update(up_count=0, down_count=2, score=-2)
+        output = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--verify', stdout=output)
+        self.assertIn(f'blog {self.blog.id}:', output.getvalue())
+
+        call_command('rebuild_counters', stdout=io.StringIO())
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.up_count, self.blog.down_count, self.blog.score), (3, 0, 3))
+        call_command('rebuild_counters', '--verify', stdout=io.StringIO())
+
+
+class BlogSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number='0912110000', password='password-123')
+
+    def search(self, query, **params):
+        response = self.client.get('/blog/blogs/', {'q': query, 'page_size': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def search_ids(self, query, **params):
+        return [blog['id'] for blog in self.search(query, **params)]
+
+    def test_index_follows_saves_and_deletes(self):
+        blog = Blog.objects.create(title='zeppelin', description='an airship', author=self.author)
+        self.assertEqual(self.search_ids('zeppelin'), [blog.id])
+
+        blog.title = 'dirigible'
+        blog.save()
+        self.assertEqual(self.search_ids('zeppelin'), [])
+        self.assertEqual(self.search_ids('dirig'), [blog.id])
+
+        blog.delete()
+        self.assertEqual(self.search_ids('dirigible'), [])
+
+    def test_bulk_created_blogs_are_indexed_by_a_rebuild(self):
+        blogs = Blog.objects.bulk_create([
+            Blog(title=f'quokka {i}', description='marsupial', author=self.author) for i in range(2)
+        ])
+        self.assertEqual(self.search_ids('quokka'), [])
+        search.rebuild_index()
+        self.assertCountEqual(self.search_ids('quokka'), [blog.id for blog in blogs])
+
+    def test_title_hits_rank_above_description_hits(self):
+        in_description = Blog.objects.create(title='notes', description='a walrus on the beach', author=self.author)
+        in_title = Blog.objects.create(title='walrus', description='notes', author=self.author)
+        results = self.search('walrus')
+        self.assertEqual([blog['id'] for blog in results], [in_title.id, in_description.id])
+        self.assertLess(results[0]['rank'], results[1]['rank'])
+        self.assertIn(f'{search.SNIPPET_START}walrus{search.SNIPPET_END}', results[1]['snippet'])
+
+    def test_snippet_escapes_the_blog_text(self):
+        Blog.objects.create(title='notes', description='<img src=x onerror=alert(1)> ocelot & co',
+                            author=self.author)
+        snippet = self.search('ocelot')[0]['snippet']
+        self.assertNotIn('<img', snippet)
+        self.assertIn(f'&lt;img src=x onerror=alert(1)&gt; {search.SNIPPET_START}ocelot{search.SNIPPET_END} &amp; co',
+                      snippet)
+
+    def test_fallback_without_fts(self):
+        blogs = [Blog.objects.create(title=f'kiwi {i}', description='', author=self.author) for i in range(2)]
+        blogs.append(Blog.objects.create(title='fruit', description='one kiwi', author=self.author))
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            results = self.search('kiwi')
+        self.assertEqual([blog['id'] for blog in results], [blog.id for blog in reversed(blogs)])
+        self.assertEqual({(blog['rank'], blog['snippet']) for blog in results}, {(None, None)})
+
+    def test_query_without_words_is_ordered(self):
+        blogs = [Blog.objects.create(title=f'what?! {i}', description='', author=self.author) for i in range(3)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            self.assertEqual(self.search_ids('?!'), [blog.id for blog in reversed(blogs)])
+
+
+class CommentTreeTests(APITestCase):
+    """
+    Three top-level comments, the first of which starts a chain of five
+    nested replies.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(phone_number='0912120000', password='password-123')
+        cls.blog = Blog.objects.create(title='thread', description='a thread', author=cls.author)
+        cls.top = [Comment.objects.create(author=cls.author, description=f'comment {i}', content_object=cls.blog)
+                   for i in range(3)]
+        cls.chain = []
+        parent = cls.top[0]
+        for i in range(5):
+            parent = Comment.objects.create(author=cls.author, description=f'reply {i}', content_object=parent)
+            cls.chain.append(parent)
+
+    def tree(self, **params):
+        return self.client.get(f'/blog/{self.blog.id}/comments/tree/', params)
+
+    def test_paths_extend_the_parent_path(self):
+        self.assertEqual(self.top[0].path, Comment.path_segment(self.top[0].id))
+        parent = self.top[0]
+        for depth, reply in enumerate(self.chain, start=1):
+            self.assertEqual((reply.blog_id, reply.depth, reply.parent_path), (self.blog.id, depth, parent.path))
+            self.assertEqual(reply.path, parent.path + Comment.path_segment(reply.id))
+            parent = reply
+
+    def test_thread_bookkeeping_is_not_published(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.get(f'/blog/comments/{self.chain[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['related_id'], self.top[0].id)
+        self.assertFalse({'blog', 'depth', 'path'} & set(response.data))
+
+    def test_comment_without_target_is_rejected(self):
+        comment = Comment(author=self.author, description='orphan',
+                          content_type=ContentType.objects.get_for_model(Blog), object_id=999999)
+        with self.assertRaises(ValidationError):
+            comment.save()
+
+    def test_replies_below_max_depth_are_rejected(self):
+        self.client.force_authenticate(self.author)
+        deepest = self.chain[-1]
+        Comment.objects.filter(id=deepest.id).update(depth=Comment.MAX_DEPTH)
+        response = self.client.post('/blog/comments/', {'description': 'too deep', 'source_type': 'comment',
+                                                        'related_id': deepest.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_thread_is_nested_in_pre_order(self):
+        response = self.tree()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['truncated']), (8, False))
+        top_level = response.data['comments']
+        self.assertEqual([comment['id'] for comment in top_level], [comment.id for comment in self.top])
+        node, nested = top_level[0], []
+        while node['replies']:
+            node = node['replies'][0]
+            nested.append(node['id'])
+        self.assertEqual(nested, [reply.id for reply in self.chain])
+
+    def test_root_and_max_depth(self):
+        root = self.chain[1]
+        response = self.tree(root=root.id, max_depth=2)
+        self.assertEqual(response.data['count'], 3)
+        subtree = response.data['comments']
+        self.assertEqual([comment['id'] for comment in subtree], [root.id])
+        self.assertEqual(subtree[0]['replies'][0]['id'], self.chain[2].id)
+        self.assertEqual(subtree[0]['replies'][0]['replies'][0]['replies'], [])
+
+        self.assertEqual(self.tree(max_depth=0).data['count'], 3)
+        self.assertEqual(self.tree(root=self.chain[0].id, max_depth=0).data['count'], 1)
+        self.assertEqual(self.tree(root=999999).status_code, 404)
+
+    def test_limit_truncates_the_thread(self):
+        response = self.tree(limit=4)
+        self.assertEqual((response.data['count'], response.data['truncated']), (4, True))
+        # the first comment and three of its nested replies, cut off in pre-order
+        self.assertEqual(len(response.data['comments']), 1)
+        for limit in (0, -1, 'many'):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.tree(limit=limit).status_code, 400)
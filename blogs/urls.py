@@ -1,6 +1,7 @@
-from .views import BlogViewSet, BlogVoteView, \
+from .views import BlogViewSet, BlogVoteView, BlogVoteBatchView, \
     CommentViewSet, MostPopularBlogsView, \
-    BlogDetailView, BlogCommentsView
+    BlogDetailView, BlogCommentsView, BlogCommentTreeView, BlogExportView, \
+    BlogAttachmentsView, AttachmentUploadView, AttachmentChunkView, AttachmentUploadCompleteView
 from django.urls import path, include
 from rest_framework import routers
 
@@ -12,7 +13,16 @@ router.register(r"comments", CommentViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('vote/<int:pk>/', BlogVoteView.as_view()),
+    path('vote/batch/', BlogVoteBatchView.as_view(), name='blog_vote_batch'),
     path('most-popular-blogs', MostPopularBlogsView.as_view()),
     path('blog-detail/<int:pk>/', BlogDetailView.as_view(), name='blog_detail'),
     path('<int:pk>/comments/', BlogCommentsView.as_view(), name='blog_comments'),
+    path('<int:pk>/comments/tree/', BlogCommentTreeView.as_view(), name='blog_comment_tree'),
+    path('export/', BlogExportView.as_view(), name='blog_export'),
+    path('<int:pk>/attachments/', BlogAttachmentsView.as_view(), name='blog_attachments'),
+    path('attachment-uploads/<uuid:upload_id>/', AttachmentUploadView.as_view(), name='attachment_upload'),
+    path('attachment-uploads/<uuid:upload_id>/chunks/<int:number>/', AttachmentChunkView.as_view(),
+         name='attachment_upload_chunk'),
+    path('attachment-uploads/<uuid:upload_id>/complete/', AttachmentUploadCompleteView.as_view(),
+         name='attachment_upload_complete'),
 ]
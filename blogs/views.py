@@ -1,25 +1,65 @@
+import io
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .serializers import BlogSerializer, BlogCreateUpdateSerializer, \
-    BlogVoteRequestSerializer, CommentSerializer, \
-    CommentCreateSerializer, BlogDetailSerializer
-from .models import Blog, Comment, BlogVote
+    BlogVoteRequestSerializer, BlogVoteBatchRequestSerializer, BlogVoteBatchResultSerializer, CommentSerializer, \
+    CommentCreateSerializer, BlogDetailSerializer, BlogSearchSerializer, \
+    CommentTreeSerializer, HotBlogSerializer, AttachmentSerializer, AttachmentUploadCreateSerializer, \
+    AttachmentUploadSerializer
+from .models import AttachmentUpload, Blog, Comment, BlogVote
+from .search import ORDERINGS, search_blogs
+from . import attachments, detail_cache, export, leaderboard
+from .votes import apply_vote_batch, cast_vote, withdraw_vote
 from users.models import User
+from users.authentication import ClaimsJWTAuthentication
+from core.db_router import ReplicaReadMixin, reading_from_replica
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-from django.db.models import Count, Q
 from rest_framework import generics
 from utils.permissions import HasAuthorAccessBlog, HasAuthorAccessComment
-import time
-from rest_framework.exceptions import NotFound
+from utils.pagination import KeysetPagination, StandardPageNumberPagination
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
 
+COMMENT_TREE_MAX_NODES = 1000
 
-class BlogViewSet(viewsets.ModelViewSet):
+RANKINGS = ['all_time', 'hot']
+
+EXPAND_RELATED_PARAMETER = OpenApiParameter(
+    name='expand', type=str, enum=['related'], required=False,
+    description='include a summary of the blog or comment each comment was posted on',
+)
+
+
+class BlogViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = BlogSerializer
-    queryset = Blog.objects.all()
+    queryset = Blog.objects.select_related('author')
     http_method_names = ['get', 'post', 'delete', 'put']
 
+    @property
+    def pagination_class(self):
+        # bm25 rank is computed per query, so relevance-ordered search results
+        # can not be keyset paginated; search pages are shallow anyway
+        if self._ordering() is None and self.request.query_params.get('q'):
+            return StandardPageNumberPagination
+        return KeysetPagination
+
+    def get_keyset_ordering(self):
+        return ORDERINGS[self._ordering() or 'oldest']
+
+    def _ordering(self):
+        ordering = self.request.query_params.get('ordering')
+        if ordering is not None and ordering not in ORDERINGS:
+            raise ValidationError({'ordering': f"Use one of: {', '.join(ORDERINGS)}."})
+        if ordering == 'relevance':
+            return None
+        return ordering
+
     def get_permissions(self):
         permission_classes = []
         if self.request.method == 'POST':
@@ -31,19 +71,21 @@ class BlogViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.request.method == 'POST' or self.request.method == 'PUT' or self.request.method == 'PATCH':
             return BlogCreateUpdateSerializer
+        if self.action == 'list' and self.request.query_params.get('q'):
+            return BlogSearchSerializer
         return super().get_serializer_class()
 
     def get_queryset(self):
         if self.action == 'list':
             query = self.request.query_params.get('q', '')
-            return Blog.objects.filter(
-                Q(title__icontains=query) | Q(description__icontains=query)
-            )
+            return search_blogs(Blog.objects.select_related('author'), query, self._ordering())
         return super().get_queryset()
 
     @extend_schema(
         parameters=[
             OpenApiParameter(name='q', type=str, description='search query', required=False),
+            OpenApiParameter(name='ordering', type=str, enum=list(ORDERINGS), required=False,
+                             description='result ordering; defaults to relevance when searching'),
         ])
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
@@ -52,79 +94,120 @@ class BlogViewSet(viewsets.ModelViewSet):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        detail_cache.invalidate(serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        blog_id = instance.id
+        super().perform_destroy(instance)
+        detail_cache.invalidate(blog_id)
+
 
 class BlogVoteView(generics.CreateAPIView, generics.DestroyAPIView):
+    # votes only need the caller's id, taken from the token without a user query
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, pk, *args, **kwargs):
-        try:
-            blog_vote = BlogVote.objects.get(blog__id=pk, user__id=request.user.id)
-            blog_vote.delete()
-            return Response(f'Your Vote for blog with id: {pk} has been successfully deleted')
-        except BlogVote.DoesNotExist:
+        if withdraw_vote(pk, request.user.id) is None:
             return Response(f"No vote found with blog id: {pk} for the user", status=status.HTTP_404_NOT_FOUND)
+        return Response(f'Your Vote for blog with id: {pk} has been successfully deleted')
 
     @extend_schema(request=BlogVoteRequestSerializer)
     def post(self, request, pk, *args, **kwargs):
-
-        start_time = time.time()
-
         serializer = BlogVoteRequestSerializer(data=request.data)
         if not serializer.is_valid():
             return Response("Invalid request data.", status=status.HTTP_400_BAD_REQUEST)
 
+        vote_type = serializer.validated_data['vote_type']
         try:
-            blog = Blog.objects.get(id=pk)
-            user = request.user
-            vote_type = serializer.validated_data['vote_type']
-
-            # Check if the user has already voted
-            vote, created = BlogVote.objects.get_or_create(
-                blog=blog,
-                user=user,
-                defaults={'vote_type': vote_type},
-            )
-
-            if created:
-                message = f"{vote_type.capitalize()} vote successful."
-            else:
-                # If the vote type hasn't changed, do nothing
-                if vote.vote_type == vote_type:
-                    end_time = time.time()
-                    print(f"Query executed in {end_time - start_time:.4f} seconds")
-                    return Response("You've already voted on this blog.", status=status.HTTP_400_BAD_REQUEST)
-                else:
-                    # Update the vote type
-                    vote.vote_type = vote_type
-                    vote.save()
-                    message = f"Vote updated to {vote_type}."
-
-            end_time = time.time()
-            print(f"Query executed in {end_time - start_time:.4f} seconds")
-            return Response(message, status=status.HTTP_200_OK)
-
+            result = cast_vote(pk, request.user.id, vote_type)
         except Blog.DoesNotExist:
             return Response(f"No blog found with id: {pk}", status=status.HTTP_404_NOT_FOUND)
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+
+        if result == BlogVote.objects.UNCHANGED:
+            return Response("You've already voted on this blog.", status=status.HTTP_400_BAD_REQUEST)
+        if result == BlogVote.objects.CHANGED:
+            return Response(f"Vote updated to {vote_type}.", status=status.HTTP_200_OK)
+        return Response(f"{vote_type.capitalize()} vote successful.", status=status.HTTP_200_OK)
+
+
+class BlogVoteBatchView(generics.GenericAPIView):
+    """
+    Apply up to VOTE_BATCH_MAX_ITEMS votes or removals for the current user
+    in one transaction. Items are applied in order and each gets a status;
+    unknown blogs are reported as not_found instead of failing the batch.
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = BlogVoteBatchRequestSerializer
+    pagination_class = None
+
+    @extend_schema(request=BlogVoteBatchRequestSerializer, responses=BlogVoteBatchResultSerializer(many=True))
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        items = [(item['blog_id'], None if item['remove'] else item['vote_type'])
+                 for item in serializer.validated_data['votes']]
+        try:
+            statuses = apply_vote_batch(request.user.id, items)
+        except User.DoesNotExist:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+        return Response([
+            {'blog_id': blog_id, 'status': item_status} for (blog_id, _), item_status in zip(items, statuses)
+        ])
 
 
-class MostPopularBlogsView(generics.ListAPIView):
+class MostPopularBlogsView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    `ranking=all_time` (default) orders by net votes, keyset paginated.
+    `ranking=hot` serves the time-decayed board cached by blogs.leaderboard,
+    page numbered over the cached ranking.
+    """
     serializer_class = BlogSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-score', '-id')
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='ranking', type=str, enum=RANKINGS, required=False,
+                             description='all_time (net votes, default) or hot (time-decayed votes)'),
+        ])
+    def get(self, request, *args, **kwargs):
+        ranking = request.query_params.get('ranking', 'all_time')
+        if ranking not in RANKINGS:
+            raise ValidationError({'ranking': f"Use one of: {', '.join(RANKINGS)}."})
+        if ranking == 'hot':
+            return self.list_hot(request)
+        return super().get(request, *args, **kwargs)
+
+    def list_hot(self, request):
+        paginator = StandardPageNumberPagination()
+        page = paginator.paginate_queryset(leaderboard.ranking(), request, view=self)
+        blogs = Blog.objects.select_related('author').in_bulk([blog_id for blog_id, _ in page])
+
+        ranked = []
+        for blog_id, hot_score in page:
+            if blog_id in blogs:  # deleted since the board was built
+                blogs[blog_id].hot_score = hot_score
+                ranked.append(blogs[blog_id])
+        serializer = HotBlogSerializer(ranked, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
     def get_queryset(self):
-        start_time = time.time()
-        queryset = Blog.objects.annotate(
-            total_votes=Count('votes', filter=Q(votes__vote_type='up')) -
-            Count('votes', filter=Q(votes__vote_type='down'))
-        ).order_by('-total_votes')
-        end_time = time.time()
-        print(f"Query executed in {end_time - start_time:.4f} seconds")
-        return queryset
+        return Blog.objects.select_related('author').order_by(*self.keyset_ordering)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author').order_by('id')
     http_method_names = ['get', 'post', 'delete']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
 
     def get_permissions(self):
         permission_classes = []
@@ -143,27 +226,274 @@ class CommentViewSet(viewsets.ModelViewSet):
     def allowed_methods(self):
         return [method for method in super().allowed_methods if method not in ['PUT', 'PATCH']]
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        detail_cache.invalidate(serializer.instance.blog_id)
+
+    def perform_destroy(self, instance):
+        blog_id = instance.blog_id
+        with transaction.atomic():
+            # the comment and every reply below it, which the delete cascades to
+            removed = instance.delete()[1].get(Comment._meta.label, 0)
+            Blog.objects.adjust_comment_counts({blog_id: -removed})
+            if instance.depth:
+                Comment.objects.adjust_reply_counts({instance.object_id: -1})
+        detail_cache.invalidate(blog_id)
+
+    @extend_schema(parameters=[EXPAND_RELATED_PARAMETER])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
-class BlogDetailView(generics.RetrieveAPIView):
+class BlogDetailView(ReplicaReadMixin, generics.RetrieveAPIView):
+    """
+    Serialized payloads are cached per blog and comments page by
+    blogs.detail_cache and invalidated on blog edits, votes and comment
+    changes.
+    """
     serializer_class = BlogDetailSerializer
-    queryset = Blog.objects.prefetch_related('comments', 'comments__author')
+    queryset = Blog.objects.select_related('author')
 
     @extend_schema(
         parameters=[
             OpenApiParameter(name='comments_page', type=int, description='Page number for pagination', required=False),
+            OpenApiParameter(name='comments_page_size', type=int, description='Comments per page', required=False),
+            EXPAND_RELATED_PARAMETER,
         ],
         responses=BlogDetailSerializer
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        key = detail_cache.key_for(request, kwargs['pk'])
+        data = detail_cache.get(key)
+        if data is not None:
+            return Response(data)
 
+        response = super().get(request, *args, **kwargs)
+        # a lagging replica may have served an older version than the one the
+        # key was made for, so such entries only live as long as a write pin
+        timeout = settings.DATABASE_REPLICA_STICKY_SECONDS if reading_from_replica() else detail_cache.DEFAULT_TIMEOUT
+        detail_cache.set(key, response.data, timeout=timeout)
+        return response
 
-class BlogCommentsView(generics.ListAPIView):
+
+class BlogCommentsView(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+
+    @extend_schema(parameters=[EXPAND_RELATED_PARAMETER])
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         try:
-            queryset = Blog.objects.get(id=self.kwargs.get('pk')).comments.all()
+            queryset = Blog.objects.get(id=self.kwargs.get('pk')).comments.select_related('author').order_by('id')
             return queryset
         except Blog.DoesNotExist:
             raise NotFound(f"No blog found with id: {self.kwargs.get('pk')}")
+
+
+class BlogCommentTreeView(generics.GenericAPIView):
+    """
+    Return a blog's comment thread as a nested tree, fetched with one range
+    query over the materialized comment paths.
+    """
+    serializer_class = CommentTreeSerializer
+    pagination_class = None
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='root', type=int, required=False,
+                             description='only return the subtree under this comment'),
+            OpenApiParameter(name='max_depth', type=int, required=False,
+                             description='levels to return below the blog (or below root)'),
+            OpenApiParameter(name='limit', type=int, required=False,
+                             description=f'max comments to return, at most {COMMENT_TREE_MAX_NODES}'),
+        ])
+    def get(self, request, pk, *args, **kwargs):
+        root_id = self._int_param('root')
+        max_depth = self._int_param('max_depth')
+        limit = self._int_param('limit', minimum=1)
+        limit = COMMENT_TREE_MAX_NODES if limit is None else min(limit, COMMENT_TREE_MAX_NODES)
+
+        comments = Comment.objects.filter(blog_id=pk).select_related('author').order_by('path')
+        base_depth = 0
+        if root_id is not None:
+            try:
+                root = Comment.objects.only('path', 'depth').get(id=root_id, blog_id=pk)
+            except Comment.DoesNotExist:
+                raise NotFound(f"No comment found with id: {root_id} on blog: {pk}")
+            comments = comments.filter(path__gte=root.path, path__lt=root.path + Comment.PATH_END)
+            base_depth = root.depth
+        if max_depth is not None:
+            comments = comments.filter(depth__lte=base_depth + max_depth)
+
+        # pre-order by path, so any prefix of the thread keeps every node's ancestors
+        nodes = list(comments[:limit + 1])
+        truncated = len(nodes) > limit
+        nodes = nodes[:limit]
+        if not nodes and root_id is None and not Blog.objects.filter(id=pk).exists():
+            raise NotFound(f"No blog found with id: {pk}")
+
+        by_path = {}
+        top_level = []
+        for node in nodes:
+            node.tree_replies = []
+            by_path[node.path] = node
+            parent = by_path.get(node.parent_path)
+            if parent is not None:
+                parent.tree_replies.append(node)
+            else:
+                top_level.append(node)
+
+        serializer = self.get_serializer(top_level, many=True)
+        return Response({
+            'blog': pk,
+            'root': root_id,
+            'count': len(nodes),
+            'truncated': truncated,
+            'comments': serializer.data,
+        })
+
+    def _int_param(self, name, minimum=0):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        message = 'A positive integer is required.' if minimum else 'A non-negative integer is required.'
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: message})
+        if value < minimum:
+            raise ValidationError({name: message})
+        return value
+
+
+class BlogExportView(APIView):
+    """
+    Stream every blog with its author, counters and comments as NDJSON, one
+    blog per line in id order (see blogs.export). Pass the last exported id
+    as `since` to only get newer blogs.
+    """
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='since', type=int, required=False,
+                             description='only export blogs with a larger id'),
+        ],
+        responses={(200, export.CONTENT_TYPE): OpenApiTypes.STR},
+    )
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': 'An integer blog id is required.'})
+        return StreamingHttpResponse(export.export_ndjson(since), content_type=export.CONTENT_TYPE)
+
+
+class BlogAttachmentsView(generics.GenericAPIView):
+    """
+    GET lists a blog's attachments with presigned download links; POST
+    starts a chunked upload of a new one (see blogs.attachments), which only
+    the blog's author may do.
+    """
+    queryset = Blog.objects.all()
+    serializer_class = AttachmentSerializer
+    pagination_class = None
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [IsAuthenticated(), HasAuthorAccessBlog()]
+        return []
+
+    def get(self, request, pk, *args, **kwargs):
+        blog = self.get_object()
+        items = list(blog.attachments.select_related('blob').order_by('id'))
+        serializer = AttachmentSerializer(items, many=True, context={'links': attachments.download_links(items)})
+        return Response(serializer.data)
+
+    @extend_schema(request=AttachmentUploadCreateSerializer, responses={201: AttachmentUploadSerializer})
+    def post(self, request, pk, *args, **kwargs):
+        blog = self.get_object()
+        serializer = AttachmentUploadCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = attachments.start_upload(blog, request.user.id, **serializer.validated_data)
+        except attachments.UploadError as exc:
+            raise ValidationError({'size': str(exc)})
+        return Response(AttachmentUploadSerializer(upload, context={'received_chunks': []}).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class AttachmentUploadMixin:
+    # chunk requests only need the caller's id, taken from the token without a user query
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = AttachmentUploadSerializer
+
+    def get_upload(self):
+        return get_object_or_404(AttachmentUpload.objects.select_related('attachment__blob'),
+                                 id=self.kwargs['upload_id'], uploader_id=self.request.user.id)
+
+    def upload_response(self, upload, status_code=status.HTTP_200_OK):
+        try:
+            received_chunks = attachments.received_chunks(upload)
+        except attachments.UploadGone as exc:
+            raise NotFound(str(exc))
+        context = {
+            'received_chunks': received_chunks,
+            'links': attachments.download_links([upload.attachment]) if upload.attachment else {},
+        }
+        return Response(AttachmentUploadSerializer(upload, context=context).data, status=status_code)
+
+
+class AttachmentUploadView(AttachmentUploadMixin, generics.GenericAPIView):
+    """
+    GET reports the chunks received so far, to resume an interrupted
+    upload from; DELETE abandons the upload.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return self.upload_response(self.get_upload())
+
+    def delete(self, request, *args, **kwargs):
+        attachments.abort_upload(self.get_upload())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AttachmentChunkView(AttachmentUploadMixin, generics.GenericAPIView):
+    """
+    PUT the bytes of chunk `number` as the raw request body. They are
+    streamed into storage, never parsed or buffered whole.
+    """
+
+    @extend_schema(request={'application/octet-stream': OpenApiTypes.BINARY}, responses={204: None})
+    def put(self, request, number, *args, **kwargs):
+        upload = self.get_upload()
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise ValidationError({'chunk': 'A Content-Length header is required.'})
+        try:
+            attachments.write_chunk(upload, number, request.stream or io.BytesIO(), length)
+        except attachments.UploadGone as exc:
+            raise NotFound(str(exc))
+        except attachments.UploadError as exc:
+            raise ValidationError({'chunk': str(exc)})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AttachmentUploadCompleteView(AttachmentUploadMixin, generics.GenericAPIView):
+    @extend_schema(request=None, responses={201: AttachmentUploadSerializer})
+    def post(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        try:
+            attachments.complete_upload(upload)
+        except attachments.UploadGone as exc:
+            raise NotFound(str(exc))
+        except attachments.UploadError as exc:
+            raise ValidationError({'chunks': str(exc)})
+        return self.upload_response(upload, status.HTTP_201_CREATED)
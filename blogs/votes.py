@@ -0,0 +1,148 @@
+"""
+Vote write path shared by BlogVoteView, the batch endpoint and benchmarks.
+"""
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from users.models import User
+from . import detail_cache, leaderboard
+from .models import Blog, BlogVote
+
+OPPOSITE = {'up': 'down', 'down': 'up'}
+
+
+@contextmanager
+def _voter_must_exist(user_id, using):
+    """
+    Turn the IntegrityError of a vote by a deleted user into
+    User.DoesNotExist. Voters come from token claims without a user query, so
+    a deleted voter only shows up as the failing foreign key of the vote when
+    the transaction commits; the user is looked up only then.
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        if User.objects.db_manager(using).filter(id=user_id).exists():
+            raise
+        raise User.DoesNotExist(f"No user found with id: {user_id}") from exc
+
+
+def vote_committed(blog_id, created_at, added=None, removed=None):
+    leaderboard.record_vote(blog_id, created_at, added=added, removed=removed)
+    detail_cache.invalidate(blog_id)
+
+
+def votes_committed(changes):
+    # (blog_id, created_at, added, removed) per blog
+    leaderboard.record_votes(changes)
+    detail_cache.invalidate_many([change[0] for change in changes])
+
+
+def cast_vote(blog_id, user_id, vote_type, using=DEFAULT_DB_ALIAS):
+    """
+    Store a vote and shift the blog's counters in one transaction: one upsert
+    statement plus, when something changed, one counter UPDATE.
+
+    Returns BlogVote.objects.CREATED, CHANGED or UNCHANGED; raises
+    Blog.DoesNotExist when there is no such blog and User.DoesNotExist when
+    the voter has been deleted since their token was issued.
+    """
+    votes = BlogVote.objects.db_manager(using)
+    with _voter_must_exist(user_id, using):
+        with transaction.atomic(using=using):
+            result, created_at = votes.upsert(blog_id, user_id, vote_type)
+            if result == votes.UNCHANGED:
+                return result
+
+            removed = OPPOSITE[vote_type] if result == votes.CHANGED else None
+            if not Blog.objects.db_manager(using).adjust_vote_counts(blog_id, added=vote_type, removed=removed):
+                # rolls the vote back before its deferred foreign key is checked
+                raise Blog.DoesNotExist(f"No blog found with id: {blog_id}")
+            transaction.on_commit(lambda: vote_committed(blog_id, created_at, added=vote_type, removed=removed),
+                                  using=using)
+    return result
+
+
+def withdraw_vote(blog_id, user_id, using=DEFAULT_DB_ALIAS):
+    """
+    Delete a vote and shift the counters. Returns the removed vote type, or
+    None when the user had not voted on the blog.
+    """
+    with transaction.atomic(using=using):
+        deleted = BlogVote.objects.db_manager(using).withdraw(blog_id, user_id)
+        if deleted is None:
+            return None
+        vote_type, created_at = deleted
+        Blog.objects.db_manager(using).adjust_vote_counts(blog_id, removed=vote_type)
+        transaction.on_commit(lambda: vote_committed(blog_id, created_at, removed=vote_type), using=using)
+    return vote_type
+
+
+def apply_vote_batch(user_id, items, using=DEFAULT_DB_ALIAS):
+    """
+    Apply a sequence of (blog_id, vote_type) items for one user, where a
+    vote_type of None removes the vote. Items are applied in order, so the
+    status of each is relative to the items before it, but only the final
+    state per blog is written: a blog lock, a vote lookup, one bulk upsert,
+    one delete and one counter UPDATE, whatever the batch size.
+
+    Returns one status per item: created, changed, unchanged, removed,
+    not_voted or not_found. Raises User.DoesNotExist like cast_vote.
+    """
+    blog_ids = {blog_id for blog_id, _ in items}
+    blogs = Blog.objects.db_manager(using).filter(id__in=blog_ids)
+    votes = BlogVote.objects.db_manager(using)
+    with _voter_must_exist(user_id, using):
+        with transaction.atomic(using=using):
+            if connections[using].vendor == 'sqlite':
+                # take the write lock up front: SQLite fails a deferred read lock's
+                # upgrade with "database is locked" instead of waiting for it
+                blogs.update(up_count=F('up_count'))
+            # locked in id order, so concurrent batches on the same blogs queue up
+            existing_blogs = set(blogs.select_for_update().order_by('id').values_list('id', flat=True))
+            current = {
+                blog_id: (vote_type, created_at)
+                for blog_id, vote_type, created_at in votes.filter(user_id=user_id, blog_id__in=existing_blogs)
+                .values_list('blog_id', 'vote_type', 'created_at')
+            }
+
+            state = {blog_id: vote[0] for blog_id, vote in current.items()}
+            statuses = []
+            for blog_id, vote_type in items:
+                previous = state.get(blog_id)
+                if blog_id not in existing_blogs:
+                    statuses.append('not_found')
+                elif vote_type is None:
+                    statuses.append('removed' if previous else 'not_voted')
+                    state[blog_id] = None
+                else:
+                    statuses.append('created' if previous is None else 'unchanged' if previous == vote_type else 'changed')
+                    state[blog_id] = vote_type
+
+            upserts, removals, deltas, changes = [], [], {}, []
+            now = timezone.now()
+            for blog_id, new_type in state.items():
+                old_type, created_at = current.get(blog_id, (None, None))
+                if new_type == old_type:
+                    continue
+                if new_type is None:
+                    removals.append(blog_id)
+                else:
+                    upserts.append(BlogVote(blog_id=blog_id, user_id=user_id, vote_type=new_type,
+                                            updated_at=now if old_type else None))
+                deltas[blog_id] = (
+                    (new_type == 'up') - (old_type == 'up'),
+                    (new_type == 'down') - (old_type == 'down'),
+                )
+                changes.append((blog_id, created_at or now, new_type, old_type))
+
+            if upserts:
+                votes.bulk_create(upserts, update_conflicts=True, unique_fields=['blog', 'user'],
+                                  update_fields=['vote_type', 'updated_at'])
+            if removals:
+                votes.filter(user_id=user_id, blog_id__in=removals).delete()
+            Blog.objects.db_manager(using).bulk_adjust_vote_counts(deltas)
+
+            transaction.on_commit(lambda: votes_committed(changes), using=using)
+    return statuses
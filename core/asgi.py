@@ -9,8 +9,17 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# start the password hashing threads behind the async login / signup views
+from users import hashing
+hashing.pool.warm()
+
+if settings.HOT_LEADERBOARD_WARM_ON_START:
+    from blogs import leaderboard
+    leaderboard.warm()
@@ -0,0 +1,76 @@
+"""
+Primary / replica routing.
+
+Writes always go to the primary ('default'). Reads go to a random alias in
+DATABASE_REPLICAS only while a view that opted in with ReplicaReadMixin
+serves a safe request, so code that reads and then writes elsewhere never
+sees a lagging replica. A user who wrote recently is pinned to the primary
+for DATABASE_REPLICA_STICKY_SECONDS by PrimaryStickinessMiddleware, so they
+always see their own votes and comments.
+
+Pins live in the default cache; use a shared backend when several processes
+serve requests.
+"""
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _pin_key(user_id):
+    return f'db-router:primary-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    if getattr(user, 'is_authenticated', False):
+        cache.set(_pin_key(user.id), True, timeout=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return getattr(user, 'is_authenticated', False) and cache.get(_pin_key(user.id)) is not None
+
+
+def reading_from_replica():
+    return _replica_reads.get() and bool(settings.DATABASE_REPLICAS)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # an instance read from a replica would otherwise be saved back to it
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Serve GET / HEAD / OPTIONS on this view from a replica unless the user
+    is pinned to the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = _replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # after authentication, so the pin of the requesting user is known
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS and not is_pinned_to_primary(request.user):
+            _replica_reads.set(True)
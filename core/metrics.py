@@ -0,0 +1,129 @@
+"""
+Per-route request metrics, filled in by core.middleware.RequestMetricsMiddleware
+and served in the Prometheus text format by MetricsView.
+
+Latencies go into cumulative histograms with the METRICS_LATENCY_BUCKETS
+upper bounds (seconds), keyed by method and URL pattern, so
+`/blog/blogs/1/` and `/blog/blogs/2/` share one series. Everything lives in
+process memory: every worker exposes its own numbers, and a restart resets
+them, as Prometheus counters expect.
+"""
+import bisect
+import threading
+from django.conf import settings
+from django.http import HttpResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+PHASES = ('db', 'serialize', 'render')
+
+_lock = threading.Lock()
+_routes = {}
+
+
+class _RouteStats:
+    def __init__(self, buckets):
+        self.buckets = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.statuses = {}
+
+
+def observe(method, route, status, seconds, queries, phases):
+    """
+    Record one finished request. `phases` maps names in PHASES to seconds.
+    """
+    bounds = settings.METRICS_LATENCY_BUCKETS
+    with _lock:
+        stats = _routes.get((method, route))
+        if stats is None:
+            stats = _routes[(method, route)] = _RouteStats(bounds)
+        stats.buckets[bisect.bisect_left(bounds, seconds)] += 1
+        stats.count += 1
+        stats.seconds += seconds
+        stats.queries += queries
+        for phase, phase_seconds in phases.items():
+            stats.phases[phase] += phase_seconds
+        status_class = f'{status // 100}xx'
+        stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return f'{value:.6f}'.rstrip('0').rstrip('.') if isinstance(value, float) else str(value)
+
+
+def render():
+    from blogs import detail_cache
+    from users.authentication import user_cache
+    from utils.storage import presigned_url_cache
+
+    bounds = settings.METRICS_LATENCY_BUCKETS
+    with _lock:
+        routes = sorted(_routes.items())
+        lines = [
+            '# HELP http_request_duration_seconds Time from the first middleware to the rendered response.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), stats in routes:
+            cumulative = 0
+            for bound, count in zip([*bounds, '+Inf'], stats.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket'
+                             f'{_labels(method=method, route=route, le=bound)} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{_labels(method=method, route=route)} '
+                         f'{_number(stats.seconds)}')
+            lines.append(f'http_request_duration_seconds_count{_labels(method=method, route=route)} {stats.count}')
+
+        lines += ['# HELP http_requests_total Finished requests by status class.',
+                  '# TYPE http_requests_total counter']
+        for (method, route), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+
+        lines += ['# HELP http_request_db_queries_total Database queries run while serving requests.',
+                  '# TYPE http_request_db_queries_total counter']
+        for (method, route), stats in routes:
+            lines.append(f'http_request_db_queries_total{_labels(method=method, route=route)} {stats.queries}')
+
+        lines += ['# HELP http_request_phase_seconds_total Time spent per request phase.',
+                  '# TYPE http_request_phase_seconds_total counter']
+        for (method, route), stats in routes:
+            for phase, seconds in stats.phases.items():
+                lines.append(f'http_request_phase_seconds_total{_labels(method=method, route=route, phase=phase)} '
+                             f'{_number(seconds)}')
+
+    lines += ['# HELP blog_detail_cache_events_total Blog detail cache lookups and invalidations.',
+              '# TYPE blog_detail_cache_events_total counter']
+    for event, count in sorted(detail_cache.stats().items()):
+        lines.append(f'blog_detail_cache_events_total{_labels(event=event)} {count}')
+    lines += ['# HELP auth_user_cache_lookups_total Authenticated user cache lookups.',
+              '# TYPE auth_user_cache_lookups_total counter',
+              f'auth_user_cache_lookups_total{_labels(result="hit")} {user_cache.hits}',
+              f'auth_user_cache_lookups_total{_labels(result="miss")} {user_cache.misses}',
+              '# HELP presigned_url_cache_lookups_total Presigned download link cache lookups.',
+              '# TYPE presigned_url_cache_lookups_total counter',
+              f'presigned_url_cache_lookups_total{_labels(result="hit")} {presigned_url_cache.hits}',
+              f'presigned_url_cache_lookups_total{_labels(result="miss")} {presigned_url_cache.misses}']
+    return '\n'.join(lines) + '\n'
+
+
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,163 @@
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+from . import metrics
+from .db_router import pin_to_primary
+
+
+class PrimaryStickinessMiddleware(MiddlewareMixin):
+    """
+    Pin a user's reads to the primary database after a successful write, so
+    replica lag never hides their own changes (see core.db_router).
+    """
+
+    def process_response(self, request, response):
+        # DRF copies the user it authenticated onto the Django request
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(getattr(request, 'user', None))
+        return response
+
+
+class _RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.view_started = self.view_finished = None
+        self.db_before_view = self.db_after_view = 0.0
+        self.render_started = self.render_finished = None
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - began
+            self.queries += 1
+
+    def finish_view(self):
+        if self.view_started is not None and self.view_finished is None:
+            self.view_finished = time.perf_counter()
+            self.db_after_view = self.db
+
+    def phases(self):
+        # queries are lazy and mostly run while serializers walk the
+        # querysets, so the view's own time is its time outside the database
+        serialize = 0.0
+        if self.view_finished is not None:
+            view = self.view_finished - self.view_started
+            serialize = max(0.0, view - (self.db_after_view - self.db_before_view))
+        render = 0.0
+        if self.render_finished is not None:
+            render = self.render_finished - self.render_started
+        return {'db': self.db, 'serialize': serialize, 'render': render}
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request: total time, queries and time on every database
+    alias, the view's time outside the database and response rendering.
+    The numbers go out in a Server-Timing header and into the per-route
+    histograms of core.metrics. Keep it first in MIDDLEWARE so the total
+    covers the whole stack.
+
+    A streamed body runs its queries after the headers are sent, so the
+    header only covers the work up to the first byte; the histograms are
+    fed once the stream is exhausted or closed and include the body.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = request._metrics_timer = _RequestTimer()
+        with ExitStack() as stack:
+            self._count_queries(stack, timer)
+            response = self.get_response(request)
+            stack = stack.pop_all()
+        return self._finish(request, response, timer, stack)
+
+    async def __acall__(self, request):
+        timer = request._metrics_timer = _RequestTimer()
+        # connections are per thread: install the wrappers in the request's
+        # thread-sensitive executor, where sync views and the async ORM run
+        stack = await sync_to_async(self._count_queries)(ExitStack(), timer)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        return self._finish(request, response, timer, stack)
+
+    @staticmethod
+    def _count_queries(stack, timer):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return stack
+
+    def _finish(self, request, response, timer, stack):
+        timer.finish_view()
+        total = time.perf_counter() - timer.started
+        phases = timer.phases()
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={phases["db"] * 1000:.1f};desc="{timer.queries} queries"',
+            f'serialize;dur={phases["serialize"] * 1000:.1f}',
+            f'render;dur={phases["render"] * 1000:.1f}',
+        ])
+        if not response.streaming:
+            stack.close()
+            self._observe(request, response, timer, total)
+            return response
+
+        def finish_stream():
+            stack.close()
+            self._observe(request, response, timer, time.perf_counter() - timer.started)
+
+        if response.is_async:
+            response.streaming_content = self._astream(response.streaming_content, finish_stream)
+        else:
+            response.streaming_content = self._stream(response.streaming_content, finish_stream)
+        return response
+
+    @staticmethod
+    def _stream(content, finish):
+        try:
+            yield from content
+        finally:
+            finish()
+
+    @staticmethod
+    async def _astream(content, finish):
+        try:
+            async for part in content:
+                yield part
+        finally:
+            finish()
+
+    @staticmethod
+    def _observe(request, response, timer, total):
+        match = request.resolver_match
+        metrics.observe(request.method, match.route if match else 'unmatched', response.status_code, total,
+                        timer.queries, timer.phases())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = request._metrics_timer
+        timer.view_started, timer.db_before_view = time.perf_counter(), timer.db
+
+    def process_template_response(self, request, response):
+        # runs right before Django renders a DRF / template response
+        timer = request._metrics_timer
+        timer.finish_view()
+        timer.render_started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: setattr(timer, 'render_finished', time.perf_counter()))
+        return response
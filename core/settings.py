@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     # internal apps
     'blogs',
     'users',
+    'tasks',
 
     # external apps
     'corsheaders',
@@ -43,12 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PrimaryStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,7 +83,11 @@ SPECTACULAR_SETTINGS = {
     'DESCRIPTION': '',
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
-    'COMPONENT_SPLIT_REQUEST': True
+    'COMPONENT_SPLIT_REQUEST': True,
+    'PREPROCESSING_HOOKS': [
+        'drf_spectacular.hooks.preprocess_exclude_path_format',
+        'users.schema.add_async_auth_endpoints',
+    ],
     # OTHER SETTINGS
 }
 
@@ -91,20 +98,70 @@ AUTH_USER_MODEL = 'users.User'
 # djangorestframework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'utils.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.StandardPageNumberPagination',
     'PAGE_SIZE': 3
 }
 
 PAGINATION_PAGE_SIZE = 3
+PAGINATION_MAX_PAGE_SIZE = 100
+
+# "hot" ranking of most-popular-blogs (see blogs/leaderboard.py)
+HOT_RANKING_HALF_LIFE = 12 * 60 * 60  # seconds
+HOT_LEADERBOARD_SIZE = 500
+HOT_LEADERBOARD_REFRESH_SECONDS = 15 * 60
+HOT_LEADERBOARD_WARM_ON_START = True
+
+VOTE_BATCH_MAX_ITEMS = 500
+
+# upper bounds, in seconds, of the request latency histograms served on /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainPairWithClaimsSerializer",
 }
 
+# users.authentication.CachedJWTAuthentication
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 60  # seconds
+
+# users.hashing: password hashing pool behind the async login / signup views
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv('PASSWORD_HASH_QUEUE_DEPTH', 32))
+PASSWORD_HASH_RETRY_AFTER = 1  # seconds, sent with 503s when the pool is full
+
+# Cache configuration
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered BlogDetailView payloads (blogs/detail_cache.py); point it at a
+    # file, memcached or redis backend to share it between workers
+    'blog_detail': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog-detail',
+        'TIMEOUT': 10 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+BLOG_DETAIL_CACHE = 'blog_detail'
+
 # cors-headers configuration
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 CORS_ALLOW_ALL_ORIGINS = True
@@ -114,13 +171,60 @@ CORS_ALLOW_CREDENTIALS = True
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DJANGO_DB_PROFILE=production tunes SQLite for concurrent serving:
+# - WAL, so readers never block the writer or each other
+# - synchronous=NORMAL, which is safe with WAL and saves an fsync per commit
+# - larger page cache and memory-mapped reads
+# - a busy timeout, so writers wait for the lock instead of failing
+# - IMMEDIATE transactions, so a transaction that reads and then writes
+#   takes the write lock up front instead of failing the lock upgrade
+# - persistent connections, so the pragmas are not re-run per request
+DATABASE_PROFILES = {
+    'default': {},
+    'production': {
+        'CONN_MAX_AGE': int(os.getenv('DJANGO_DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # busy_timeout, in seconds
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
+    },
+}
+DATABASE_PROFILE = os.getenv('DJANGO_DB_PROFILE', 'default')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **DATABASE_PROFILES[DATABASE_PROFILE],
     }
 }
 
+# Read replicas, used by core.db_router for the views that opt in with
+# ReplicaReadMixin. DJANGO_DB_REPLICA_NAMES is a comma separated list of
+# SQLite files kept in sync with the primary; without it there is one
+# 'replica' alias on the primary's own file that nothing is routed to, so
+# tests (where it mirrors 'default') can enable routing with
+# override_settings(DATABASE_REPLICAS=['replica']).
+_replica_names = [name for name in os.getenv('DJANGO_DB_REPLICA_NAMES', '').split(',') if name]
+for _index, _name in enumerate(_replica_names or [DATABASES['default']['NAME']]):
+    DATABASES['replica' if _index == 0 else f'replica_{_index + 1}'] = {
+        **DATABASES['default'],
+        'NAME': _name,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default'] if _replica_names else []
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+# seconds a user's reads stay on the primary after they write
+DATABASE_REPLICA_STICKY_SECONDS = int(os.getenv('DJANGO_DB_REPLICA_STICKY_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -162,3 +266,45 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# tasks: side effects deferred past the response, run by `manage.py run_tasks`.
+# TASKS_EAGER=1 runs them in the web process instead, for development.
+TASKS_EAGER = os.getenv('TASKS_EAGER') == '1'
+TASKS_WORKER_THREADS = int(os.getenv('TASKS_WORKER_THREADS', 4))
+TASKS_CLAIM_SIZE = 200  # tasks per worker round
+TASKS_POLL_INTERVAL = 1  # seconds between rounds while the queue is empty
+TASKS_LEASE_SECONDS = 300  # a claimed task is handed out again after this
+TASKS_RETRY_DELAY = 10  # seconds before the first retry, doubled for every further one
+
+# Object storage (utils/storage.py). With an S3 compatible endpoint the
+# objects go to AWS_STORAGE_BUCKET_NAME on it; without one, to
+# OBJECT_STORAGE_LOCAL_ROOT on the local filesystem.
+AWS_SERVICE_NAME = 's3'
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')
+AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
+AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME', 'blog')
+
+OBJECT_STORAGE_BACKEND = os.getenv('OBJECT_STORAGE_BACKEND', 's3' if AWS_S3_ENDPOINT_URL else 'local')
+OBJECT_STORAGE_LOCAL_ROOT = os.getenv('OBJECT_STORAGE_LOCAL_ROOT', BASE_DIR / 'storage')
+# multipart part size; a streamed upload holds at most
+# OBJECT_STORAGE_TRANSFER_CONCURRENCY parts in memory
+OBJECT_STORAGE_CHUNK_SIZE = int(os.getenv('OBJECT_STORAGE_CHUNK_SIZE', 8 * 1024 * 1024))
+OBJECT_STORAGE_TRANSFER_CONCURRENCY = int(os.getenv('OBJECT_STORAGE_TRANSFER_CONCURRENCY', 4))
+# threads of upload_many, and HTTP connections of the shared client
+OBJECT_STORAGE_WORKERS = int(os.getenv('OBJECT_STORAGE_WORKERS', 8))
+OBJECT_STORAGE_MAX_POOL_CONNECTIONS = int(os.getenv('OBJECT_STORAGE_MAX_POOL_CONNECTIONS', 32))
+# presigned download links kept per process, and the seconds before their
+# expiry after which a link is signed again instead of reused
+OBJECT_STORAGE_PRESIGNED_URL_CACHE_SIZE = int(os.getenv('OBJECT_STORAGE_PRESIGNED_URL_CACHE_SIZE', 10000))
+OBJECT_STORAGE_PRESIGNED_URL_MARGIN = int(os.getenv('OBJECT_STORAGE_PRESIGNED_URL_MARGIN', 300))
+
+# blogs.attachments: chunked uploads. Every chunk but the last is exactly
+# ATTACHMENT_CHUNK_SIZE bytes (at least 5 MiB on S3) and becomes one
+# multipart part, so at most 10000 chunks make an attachment.
+ATTACHMENT_CHUNK_SIZE = int(os.getenv('ATTACHMENT_CHUNK_SIZE', OBJECT_STORAGE_CHUNK_SIZE))
+ATTACHMENT_MAX_SIZE = int(os.getenv('ATTACHMENT_MAX_SIZE', 5 * 1024 ** 3))
+ATTACHMENT_LINK_EXPIRY = 3600  # seconds
+# seconds after which a completion that never finished (its process died)
+# no longer keeps another request from completing the upload
+ATTACHMENT_COMPLETE_TIMEOUT = int(os.getenv('ATTACHMENT_COMPLETE_TIMEOUT', 15 * 60))
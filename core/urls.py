@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularRedocView
+from .metrics import MetricsView
 from .swagger_views import CustomSchemaView, CustomSpectacularSwaggerView
 
 urlpatterns = [
@@ -11,4 +12,5 @@ urlpatterns = [
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('api/auth/', include('users.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+if settings.HOT_LEADERBOARD_WARM_ON_START:
+    from blogs import leaderboard
+    leaderboard.warm()
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tasks'
+
+    def ready(self):
+        from . import queue
+
+        request_started.connect(queue.request_started, dispatch_uid='tasks_request_started')
+        request_finished.connect(queue.request_finished, dispatch_uid='tasks_request_finished')
+        # the task handlers of every app, registered with @queue.handler
+        autodiscover_modules('tasks')
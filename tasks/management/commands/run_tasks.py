@@ -0,0 +1,22 @@
+import signal
+from django.core.management.base import BaseCommand
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = ("Run the tasks deferred with tasks.queue.defer on a thread pool until interrupted (SIGINT / SIGTERM "
+            "finish the current round first). --drain exits once no task is ready, e.g. from cron or tests.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, help="Defaults to TASKS_WORKER_THREADS.")
+        parser.add_argument('--claim-size', type=int, help="Tasks claimed per round; defaults to TASKS_CLAIM_SIZE.")
+        parser.add_argument('--poll-interval', type=float, help="Seconds to sleep while the queue is empty.")
+        parser.add_argument('--drain', action='store_true')
+
+    def handle(self, *args, threads=None, claim_size=None, poll_interval=None, drain=False, **options):
+        worker = Worker(threads=threads, claim_size=claim_size)
+        if not drain:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: worker.stop())
+        claimed = worker.run(poll_interval=poll_interval, drain=drain)
+        self.stdout.write(self.style.SUCCESS(f"Ran {claimed} tasks."))
@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """
+    A deferred call of the handler registered for `kind` (see tasks.queue).
+    Tasks are deleted once they ran; the ones that failed max_attempts
+    times stay behind with their last error.
+    """
+    QUEUED, RUNNING, FAILED = 'queued', 'running', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(null=True)
+    # higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # a running task whose lease expired is claimed again, e.g. after a worker crash
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the worker's claim query
+            models.Index(fields=['status', '-priority', 'run_after'], name='tasks_task_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
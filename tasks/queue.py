@@ -0,0 +1,115 @@
+"""
+Deferred side effects of requests.
+
+`defer(kind, payload)` queues work the response does not depend on, such
+as storage deletes. Nothing is queued unless the surrounding transaction
+commits. Inside a request the committed tasks are then held until the
+response has been sent and written with one INSERT from the
+request_finished signal, so the request pays for neither the work nor the
+queueing. `manage.py run_tasks` runs them (see tasks.worker).
+
+Handlers are registered with `@handler(kind)` in an app's tasks.py, which
+TasksConfig imports at startup. A `batch=True` handler is called with the
+payloads of up to `batch_size` tasks of its kind at once.
+
+Tasks held for a response are lost if the process dies before sending it,
+so only defer work that may be lost that way or is repaired elsewhere. With
+TASKS_EAGER the handlers run in-process at that point instead of being
+queued, for development without a worker.
+"""
+import logging
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+# tasks waiting for the end of the current request; None outside requests
+_state = Local()
+
+
+class Handler:
+    def __init__(self, kind, func, batch=False, batch_size=100, priority=0, max_attempts=5):
+        self.kind = kind
+        self.func = func
+        self.batch = batch
+        self.batch_size = batch_size
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, payloads):
+        if self.batch:
+            self.func(payloads)
+        else:
+            for payload in payloads:
+                self.func(payload)
+
+
+def handler(kind, **options):
+    """
+    Register the decorated function as the handler of `kind`; the options
+    are those of Handler.
+    """
+    def decorator(func):
+        _handlers[kind] = Handler(kind, func, **options)
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    return _handlers.get(kind)
+
+
+def defer(kind, payload=None, priority=None, delay=None, using=DEFAULT_DB_ALIAS):
+    """
+    Queue a call of the `kind` handler with the JSON serializable `payload`
+    once the current transaction on `using` commits. `delay` (a timedelta)
+    holds it back for at least that long.
+    """
+    registered = _handlers.get(kind)
+    if registered is None:
+        raise LookupError(f"No task handler is registered for {kind!r}.")
+    task = Task(kind=kind, payload=payload, priority=registered.priority if priority is None else priority)
+    if delay:
+        task.run_after = timezone.now() + delay
+    transaction.on_commit(lambda: _enqueue(task), using=using)
+
+
+def _enqueue(task):
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.append(task)
+    else:
+        _store([task])
+
+
+def _store(tasks):
+    if not settings.TASKS_EAGER:
+        Task.objects.bulk_create(tasks)
+        return
+    by_kind = {}
+    for task in tasks:
+        by_kind.setdefault(task.kind, []).append(task.payload)
+    for kind, payloads in by_kind.items():
+        try:
+            _handlers[kind](payloads)
+        except Exception:
+            logger.exception("Task %s failed", kind)
+
+
+def request_started(**kwargs):
+    _state.pending = []
+
+
+def request_finished(**kwargs):
+    pending, _state.pending = getattr(_state, 'pending', None), None
+    if not pending:
+        return
+    try:
+        _store(pending)
+    except Exception:
+        # the response is out; failing here would only hide it from the logs
+        logger.exception("Queueing %d deferred tasks failed", len(pending))
@@ -0,0 +1,95 @@
+from datetime import timedelta
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from . import queue
+from .models import Task
+from .worker import Worker
+
+calls = []
+
+
+@queue.handler('tests.batch', batch=True, batch_size=3)
+def batch_handler(payloads):
+    calls.append(('batch', payloads))
+
+
+@queue.handler('tests.single', priority=5)
+def single_handler(payload):
+    calls.append(('single', payload))
+
+
+@queue.handler('tests.failing', max_attempts=2)
+def failing_handler(payload):
+    raise ValueError('boom')
+
+
+class DeferTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_wait_for_the_commit_and_the_end_of_the_request(self):
+        queue.request_started()
+        with self.captureOnCommitCallbacks(execute=True):
+            queue.defer('tests.single', {'n': 1})
+            self.assertFalse(Task.objects.exists())
+        self.assertFalse(Task.objects.exists())
+        queue.request_finished()
+        task = Task.objects.get()
+        self.assertEqual((task.kind, task.payload, task.priority), ('tests.single', {'n': 1}, 5))
+
+    def test_rolled_back_tasks_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                queue.defer('tests.single', {'n': 1})
+                transaction.set_rollback(True)
+        self.assertFalse(Task.objects.exists())
+
+    def test_unknown_kinds_are_rejected(self):
+        with self.assertRaises(LookupError):
+            queue.defer('tests.unknown')
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_in_process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue.defer('tests.batch', 1)
+        self.assertEqual(calls, [('batch', [1])])
+        self.assertFalse(Task.objects.exists())
+
+
+# the worker runs tasks on its own threads and database connections
+class WorkerTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_batches_by_kind_in_priority_order(self):
+        Task.objects.bulk_create([Task(kind='tests.batch', payload=i, priority=i % 2) for i in range(5)]
+                                 + [Task(kind='tests.single', payload='s', priority=5)])
+        self.assertEqual(Worker(threads=1).run(drain=True), 6)
+        self.assertEqual(calls, [('single', 's'), ('batch', [1, 3, 0]), ('batch', [2, 4])])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASKS_RETRY_DELAY=60)
+    def test_failures_are_retried_then_kept(self):
+        Task.objects.create(kind='tests.failing', payload=None)
+        Task.objects.create(kind='tests.gone', payload=None)
+        with self.assertLogs('tasks.worker', 'ERROR'):
+            self.assertEqual(Worker(threads=1).run(drain=True), 2)
+        task = Task.objects.get(kind='tests.failing')
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task.run_after, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(Task.objects.get(kind='tests.gone').status, Task.FAILED)
+
+        Task.objects.filter(id=task.id).update(run_after=timezone.now())
+        with self.assertLogs('tasks.worker', 'ERROR'):
+            Worker(threads=1).run(drain=True)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.last_error), (Task.FAILED, 2, 'ValueError: boom'))
+
+    def test_expired_leases_are_claimed_again(self):
+        Task.objects.create(kind='tests.single', payload='stuck', status=Task.RUNNING, attempts=1,
+                            locked_until=timezone.now() - timedelta(seconds=1))
+        Task.objects.create(kind='tests.single', payload='busy', status=Task.RUNNING, attempts=1,
+                            locked_until=timezone.now() + timedelta(minutes=1))
+        Worker(threads=1).run(drain=True)
+        self.assertEqual(calls, [('single', 'stuck')])
@@ -0,0 +1,112 @@
+"""
+Runs queued tasks on a thread pool.
+
+Each round claims up to `claim_size` ready tasks, best priority first, with
+one UPDATE that re-checks their state, so any number of workers can share
+the queue. Claimed tasks of a batch handler's kind run as one call per
+`batch_size` of them, the others one call each. A failed call puts its
+tasks back with an exponential delay of TASKS_RETRY_DELAY * 2 ** (attempt
+- 1) seconds until the handler's max_attempts, then marks them failed.
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from . import queue
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, threads=None, claim_size=None):
+        self.threads = threads or settings.TASKS_WORKER_THREADS
+        self.claim_size = claim_size or settings.TASKS_CLAIM_SIZE
+        self.stopping = threading.Event()
+
+    def claim(self):
+        now = timezone.now()
+        ready = Q(status=Task.QUEUED, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+        ids = list(Task.objects.filter(ready).order_by('-priority', 'run_after', 'id')
+                   .values_list('id', flat=True)[:self.claim_size])
+        if not ids:
+            return []
+        token = uuid.uuid4()
+        Task.objects.filter(ready, id__in=ids).update(
+            status=Task.RUNNING, claimed_by=token, attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=settings.TASKS_LEASE_SECONDS),
+        )
+        return list(Task.objects.filter(id__in=ids, claimed_by=token).order_by('-priority', 'run_after', 'id'))
+
+    def jobs(self, tasks):
+        """
+        Split claimed tasks into (handler, tasks) calls.
+        """
+        by_kind = {}
+        for task in tasks:
+            by_kind.setdefault(task.kind, []).append(task)
+        jobs = []
+        for kind, kind_tasks in by_kind.items():
+            handler = queue.get_handler(kind)
+            if handler is None:
+                Task.objects.filter(id__in=[task.id for task in kind_tasks]) \
+                    .update(status=Task.FAILED, last_error=f"No task handler is registered for {kind!r}.")
+                continue
+            size = handler.batch_size if handler.batch else 1
+            jobs += [(handler, kind_tasks[start:start + size]) for start in range(0, len(kind_tasks), size)]
+        return jobs
+
+    def execute(self, handler, tasks):
+        try:
+            handler([task.payload for task in tasks])
+        except Exception as exc:
+            logger.exception("Task %s failed", handler.kind)
+            self.failed(handler, tasks, exc)
+        else:
+            Task.objects.filter(id__in=[task.id for task in tasks]).delete()
+        finally:
+            close_old_connections()
+
+    def failed(self, handler, tasks, exc):
+        error = f'{type(exc).__name__}: {exc}'
+        now = timezone.now()
+        for task in tasks:
+            if task.attempts >= handler.max_attempts:
+                Task.objects.filter(id=task.id).update(status=Task.FAILED, last_error=error)
+            else:
+                delay = timedelta(seconds=settings.TASKS_RETRY_DELAY * 2 ** (task.attempts - 1))
+                Task.objects.filter(id=task.id).update(status=Task.QUEUED, run_after=now + delay, last_error=error)
+
+    def run_once(self, executor):
+        """
+        Claim and run one round of tasks; returns how many were claimed.
+        """
+        tasks = self.claim()
+        wait([executor.submit(self.execute, handler, batch) for handler, batch in self.jobs(tasks)])
+        return len(tasks)
+
+    def run(self, poll_interval=None, drain=False):
+        """
+        Run rounds until stop() is called, or with `drain` until no task is
+        ready. Returns the number of tasks claimed.
+        """
+        poll_interval = settings.TASKS_POLL_INTERVAL if poll_interval is None else poll_interval
+        claimed = 0
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='tasks') as executor:
+            while not self.stopping.is_set():
+                count = self.run_once(executor)
+                claimed += count
+                if not count:
+                    if drain:
+                        break
+                    close_old_connections()
+                    self.stopping.wait(poll_interval)
+        return claimed
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,120 @@
+"""
+JWT authentication without a user query per request.
+
+ClaimsJWTAuthentication builds a ClaimsUser from the token alone, for views
+that only need the caller's id and flags. The claims are written when the
+token is issued (see `token_for_user`), so a demoted or deactivated user
+keeps them until the access token expires.
+
+CachedJWTAuthentication returns full User objects from a per-process
+LRU cache with a TTL. `invalidate_user()` drops an entry in this process when
+the user changes; other processes pick the change up within
+AUTH_USER_CACHE_TTL seconds.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+CLAIMS = ('is_staff', 'is_active')
+
+
+def token_for_user(user):
+    """
+    Refresh token for `user` carrying the claims ClaimsUser reads; access
+    tokens issued from it copy them.
+    """
+    refresh = RefreshToken.for_user(user)
+    for claim in CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    return refresh
+
+
+class ClaimsUser(TokenUser):
+    """
+    TokenUser whose id is the User's UUID, so it compares equal to foreign
+    keys such as `blog.author_id`.
+    """
+
+    @cached_property
+    def id(self):
+        return uuid.UUID(str(self.token[api_settings.USER_ID_CLAIM]))
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', True)
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        user = ClaimsUser(validated_token)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class UserCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            # views may modify request.user, so never hand out the cached instance
+            return copy.copy(entry[1])
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, copy.copy(user))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def invalidate_user(user_id):
+    user_cache.invalidate(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
@@ -0,0 +1,65 @@
+"""
+Bounded thread pool for password hashing in the async auth views.
+
+PBKDF2 runs in C with the GIL released, so a few threads hash in parallel
+while the event loop and the threads running sync views keep going. At most
+PASSWORD_HASH_WORKERS hashes run at once, and at most
+PASSWORD_HASH_QUEUE_DEPTH more wait. Anything beyond that is refused with
+PoolSaturated right away, so a login storm gets fast 503s instead of queueing
+without bound.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise PoolSaturated
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pending += 1
+        future = self._executor.submit(func, *args)
+        # released when the hash finishes, even if the awaiting request was cancelled
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def warm(self):
+        """
+        Start every worker thread now rather than on the first logins.
+        """
+        barrier = threading.Barrier(self.workers, timeout=5)
+        futures = [self.submit(barrier.wait) for _ in range(self.workers)]
+        for future in futures:
+            try:
+                future.result()
+            except threading.BrokenBarrierError:
+                pass  # a worker was busy with a real hash; it exists either way
+
+
+pool = HashingPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_DEPTH)
@@ -0,0 +1,99 @@
+import asyncio
+import statistics
+import time
+from collections import Counter
+from asgiref.sync import ThreadSensitiveContext
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.test import AsyncClient, override_settings
+from blogs.models import Blog
+from users import hashing
+from users.models import User
+
+BENCH_NAME = 'bench-login'
+BENCH_PHONE = '0998000000'
+BENCH_PASSWORD = 'bench-password-1'
+
+LOGIN_URLS = {
+    'none': None,
+    'sync': '/api/auth/login/',
+    'async': '/api/auth/async/login/',
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve concurrent blog reads alongside a login storm through the in-process ASGI handler and report "
+        "read latency with no logins, with the sync LoginView and with the async login view. Every request "
+        "gets its own ThreadSensitiveContext, as behind an ASGI server, so each sync view runs on a thread of "
+        "its own. Creates its own user and blog and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per scenario.")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent read loops.")
+        parser.add_argument('--logins', type=int, default=16, help="Concurrent login loops.")
+        parser.add_argument('--scenario', choices=list(LOGIN_URLS), nargs='+', default=list(LOGIN_URLS))
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        user = User.objects.create_user(phone_number=BENCH_PHONE, password=BENCH_PASSWORD, first_name=BENCH_NAME)
+        blog = Blog.objects.create(title=BENCH_NAME, description=BENCH_NAME, author=user)
+        hashing.pool.warm()
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for scenario in options['scenario']:
+                    self.report(scenario, asyncio.run(self.run(LOGIN_URLS[scenario], blog.id, options)), options)
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        User.objects.filter(phone_number=BENCH_PHONE, first_name=BENCH_NAME).delete()
+
+    async def run(self, login_url, blog_id, options):
+        client = AsyncClient()
+        deadline = time.perf_counter() + options['duration']
+        read_latencies, login_statuses = [], Counter()
+
+        async def read():
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                async with ThreadSensitiveContext():
+                    response = await client.get(f'/blog/blogs/{blog_id}/')
+                read_latencies.append(time.perf_counter() - began)
+                assert response.status_code == 200, response.status_code
+
+        async def login():
+            while time.perf_counter() < deadline:
+                async with ThreadSensitiveContext():
+                    response = await client.post(login_url, {'phone_number': BENCH_PHONE,
+                                                             'password': BENCH_PASSWORD})
+                login_statuses[response.status_code] += 1
+                if response.status_code == 503:
+                    await asyncio.sleep(0.05)
+
+        loops = [read() for _ in range(options['readers'])]
+        if login_url:
+            loops += [login() for _ in range(options['logins'])]
+        await asyncio.gather(*loops)
+        return read_latencies, login_statuses
+
+    def report(self, scenario, results, options):
+        read_latencies, login_statuses = results
+        ms = [latency * 1000 for latency in read_latencies]
+        duration = options['duration']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"logins: {scenario}"))
+        self.stdout.write(f"  reads: {len(ms) / duration:.0f}/s  p50 {percentile(ms, 0.5):.1f}ms  "
+                          f"p95 {percentile(ms, 0.95):.1f}ms  p99 {percentile(ms, 0.99):.1f}ms  "
+                          f"max {max(ms, default=float('nan')):.1f}ms  mean {statistics.fmean(ms) if ms else 0:.1f}ms")
+        if login_statuses:
+            total = sum(login_statuses.values())
+            self.stdout.write(f"  logins: {login_statuses[200] / duration:.1f}/s ok, "
+                              f"statuses {dict(sorted(login_statuses.items()))} over {total} requests")
@@ -0,0 +1,44 @@
+"""
+drf-spectacular extensions for the project's simplejwt subclasses, which the
+bundled extensions only match by exact class, and a preprocessing hook for
+the views that are not DRF views.
+"""
+from django.urls import NoReverseMatch, get_script_prefix, reverse
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme, TokenObtainPairSerializerExtension
+from drf_spectacular.utils import extend_schema
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = 'users.authentication.CachedJWTAuthentication'
+
+
+class ClaimsJWTScheme(SimpleJWTScheme):
+    target_class = 'users.authentication.ClaimsJWTAuthentication'
+    name = 'jwtClaimsAuth'
+
+
+class TokenObtainPairWithClaimsSerializerExtension(TokenObtainPairSerializerExtension):
+    target_class = 'users.serializers.TokenObtainPairWithClaimsSerializer'
+
+
+def add_async_auth_endpoints(endpoints):
+    """
+    Preprocessing hook: list the async login and signup views, which the
+    schema generator skips as they are not DRF views, under the schema of
+    the DRF views whose requests and envelopes they share.
+    """
+    from .views import LoginView, SignUpView
+
+    description = ("Async variant for ASGI deployments. Answers 503 with Retry-After while the password "
+                   "hashing pool is full.")
+    prefix = get_script_prefix()
+    for name, view in (('async_login', LoginView), ('async_signup', SignUpView)):
+        try:
+            path = '/' + reverse(name)[len(prefix):]
+        except NoReverseMatch:
+            continue
+        # a subclass, as extend_schema decorates the class it is given; no
+        # token is read by the async views
+        schema_view = type(f'Async{view.__name__}Schema', (view,), {'authentication_classes': []})
+        endpoints.append((path, path, 'POST', extend_schema(description=description)(schema_view).as_view()))
+    return endpoints
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from drf_spectacular.utils import extend_schema
+from .authentication import token_for_user
 
 
 User = get_user_model()
@@ -25,7 +26,7 @@ class UserLoginSerializer(serializers.Serializer):
     token = serializers.SerializerMethodField()
 
     def get_token(self, user):
-        refresh = RefreshToken.for_user(user)
+        refresh = token_for_user(user)
         tokens = {
             "access": str(refresh.access_token),
             "refresh": str(refresh),
@@ -33,6 +34,12 @@ class UserLoginSerializer(serializers.Serializer):
         return tokens
 
 
+class TokenObtainPairWithClaimsSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return token_for_user(user)
+
+
 class UserSignupSerializerRequest(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -1,3 +1,151 @@
+import threading
+from unittest import mock
+from django.conf import settings
 from django.test import TestCase
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from blogs.models import Blog
+from . import hashing
+from .authentication import ClaimsUser, token_for_user, user_cache
+from .models import User
 
-# Create your tests here.
+
+class JwtAuthenticationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number='0912100000', password='password-123', first_name='reader')
+        cls.blog = Blog.objects.create(title='blog', description='description', author=cls.user)
+
+    def setUp(self):
+        user_cache.clear()
+
+    def authenticate(self, user=None, **claims):
+        token = token_for_user(user or self.user).access_token
+        for claim, value in claims.items():
+            token[claim] = value
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_issued_tokens_carry_claims(self):
+        response = self.client.post('/api/auth/jwt/create/', {'phone_number': '0912100000',
+                                                               'password': 'password-123'})
+        token = AccessToken(response.data['access'])
+        self.assertEqual((token['is_staff'], token['is_active']), (False, True))
+
+        response = self.client.post('/api/auth/login/', {'phone_number': '0912100000', 'password': 'password-123'})
+        token = AccessToken(response.data['result']['token']['access'])
+        self.assertEqual((token['is_staff'], token['is_active']), (False, True))
+
+    def test_login_records_last_login(self):
+        response = self.client.post('/api/auth/login/', {'phone_number': '0912100000', 'password': 'password-123'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_cached_user_is_loaded_once(self):
+        self.authenticate()
+        # user, blog
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f'/blog/blogs/{self.blog.id}/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/blog/blogs/{self.blog.id}/').status_code, 200)
+
+    def test_profile_update_invalidates_cached_user(self):
+        self.authenticate()
+        response = self.client.put('/api/auth/update-user-info/', {'first_name': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(user_cache.get(str(self.user.id)))
+        self.client.get(f'/blog/blogs/{self.blog.id}/')
+        self.assertEqual(user_cache.get(str(self.user.id)).first_name, 'renamed')
+
+    def test_vote_authenticates_from_claims(self):
+        self.authenticate()
+        # savepoint, upsert, counter update, release: no user query
+        with self.assertNumQueries(4):
+            response = self.client.post(f'/blog/vote/{self.blog.id}/', {'vote_type': 'up'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_claims_user(self):
+        user = ClaimsUser(token_for_user(self.user).access_token)
+        self.assertEqual(user.id, self.user.id)
+        self.assertEqual(self.blog.author_id, user.id)
+        self.assertTrue(user.is_authenticated)
+
+    def test_inactive_claim_is_rejected(self):
+        self.authenticate(is_active=False)
+        response = self.client.post(f'/blog/vote/{self.blog.id}/', {'vote_type': 'up'})
+        self.assertEqual(response.status_code, 401)
+
+
+class DeletedUserTokenTests(APITransactionTestCase):
+    # commits for real: the vote of a deleted user only fails on its deferred foreign key
+    def setUp(self):
+        author = User.objects.create_user(phone_number='0912100001', password='password-123')
+        self.blog = Blog.objects.create(title='blog', description='description', author=author)
+        user = User.objects.create_user(phone_number='0912100002', password='password-123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token_for_user(user).access_token}')
+        user.delete()
+
+    def test_vote_is_rejected(self):
+        response = self.client.post(f'/blog/vote/{self.blog.id}/', {'vote_type': 'up'})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Blog.objects.get(id=self.blog.id).up_count)
+
+    def test_vote_batch_is_rejected(self):
+        response = self.client.post('/blog/vote/batch/', {'votes': [{'blog_id': self.blog.id, 'vote_type': 'up'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Blog.objects.get(id=self.blog.id).up_count)
+
+
+class AsyncAuthViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number='0912200000', password='password-123')
+
+    async def test_login(self):
+        response = await self.async_client.post('/api/auth/async/login/', {'phone_number': '0912200000',
+                                                                            'password': 'password-123'})
+        self.assertEqual(response.status_code, 200)
+        token = AccessToken(response.json()['result']['token']['access'])
+        self.assertEqual(token['user_id'], str(self.user.id))
+        user = await User.objects.aget(id=self.user.id)
+        self.assertIsNotNone(user.last_login)
+
+        for phone_number, password in (('0912200000', 'wrong-password'), ('0912299999', 'password-123')):
+            response = await self.async_client.post('/api/auth/async/login/', {'phone_number': phone_number,
+                                                                                'password': password})
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.json()['resultStatus'], 1)
+
+    async def test_signup(self):
+        payload = {'phone_number': '0912200001', 'password': 'password-123', 'first_name': 'new'}
+        response = await self.async_client.post('/api/auth/async/signup/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user = await User.objects.aget(phone_number='0912200001')
+        self.assertTrue(user.check_password('password-123'))
+
+        response = await self.async_client.post('/api/auth/async/signup/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['validationMessage'][0]['message'], 'کاربری با این مشخصات از قبل وجود دارد')
+
+    async def test_saturated_pool_answers_503(self):
+        busy = threading.Event()
+        with mock.patch.object(hashing, 'pool', hashing.HashingPool(workers=1, queue_depth=0)):
+            hashing.pool.submit(busy.wait)
+            try:
+                response = await self.async_client.post('/api/auth/async/login/', {'phone_number': '0912200000',
+                                                                                    'password': 'password-123'})
+            finally:
+                busy.set()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(settings.PASSWORD_HASH_RETRY_AFTER))
+
+    def test_views_are_in_the_api_docs(self):
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        for path in ('/api/auth/async/login/', '/api/auth/async/signup/'):
+            operation = schema['paths'][path]['post']
+            self.assertIn('503', operation['description'])
+            # no token is read
+            self.assertEqual(operation.get('security', [{}]), [{}])
+        self.assertNotIn('description', schema['paths']['/api/auth/login/']['post'])
@@ -10,6 +10,8 @@ from rest_framework_simplejwt.views import (
 urlpatterns = [
     path("login/", views.LoginView.as_view(), name="login"),
     path("signup/", views.SignUpView.as_view(), name="signup"),
+    path("async/login/", views.AsyncLoginView.as_view(), name="async_login"),
+    path("async/signup/", views.AsyncSignUpView.as_view(), name="async_signup"),
     path("jwt/create/", TokenObtainPairView.as_view(), name="jwt_create"),
     path("jwt/refresh/", TokenRefreshView.as_view(), name="jwt_refresh_token"),
     path("jwt/verify/", TokenVerifyView.as_view(), name="jwt_verify_token"),
@@ -1,4 +1,12 @@
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -6,6 +14,8 @@ from rest_framework.views import APIView
 from .serializers import UserSerializer, UserLoginSerializer, UserSignupSerializerRequest, UserUpdateInfoSerializerRequest, UserLoginSerializerRequest, UserUpdatePasswordSerializer
 from drf_spectacular.utils import extend_schema
 from .models import User
+from .authentication import invalidate_user
+from . import hashing
 from django.utils.timezone import now
 
 
@@ -25,7 +35,7 @@ class LoginView(APIView):
 
         if authenticated_user:
             authenticated_user.last_login = now()
-            authenticated_user.save(update_fields=['last_login'])
+            User.objects.filter(pk=authenticated_user.pk).update(last_login=authenticated_user.last_login)
             serializer = UserLoginSerializer(authenticated_user)
             return Response({
                 'validationMessage': [{
@@ -103,6 +113,7 @@ class UpdatePasswordView(APIView):
         user = User.objects.get(id=request.user.id)
         user.set_password(serializer.validated_data.get('password'))
         user.save()
+        invalidate_user(user.id)
         return Response("Password successfully changed", status=status.HTTP_200_OK)
 
 
@@ -116,5 +127,104 @@ class UpdateUserInfo(APIView):
 
         if serializer.is_valid():
             serializer.save()
+            invalidate_user(request.user.id)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _envelope(status_code, message, result=None, headers=None):
+    return JsonResponse({
+        'validationMessage': [{
+            'statusCode': status_code,
+            'message': message
+        }],
+        'result': result,
+        'resultStatus': 0 if status_code < 400 else 1
+    }, status=status_code, headers=headers, json_dumps_params={'ensure_ascii': False})
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _saturated():
+    return _envelope(status.HTTP_503_SERVICE_UNAVAILABLE, 'Too many sign-in requests, try again shortly',
+                     headers={'Retry-After': str(settings.PASSWORD_HASH_RETRY_AFTER)})
+
+
+class AsyncAuthView(View):
+    """
+    Async counterparts of LoginView and SignUpView for ASGI deployments.
+    Under ASGI every request runs its sync view on a thread of its own, so a
+    login storm on the sync views hashes on as many threads at once as there
+    are requests in flight. Here the hashes run in users.hashing.pool, which
+    bounds them to PASSWORD_HASH_WORKERS and answers 503 with Retry-After
+    once its queue is full.
+
+    DRF's APIView dispatches synchronously and does not await async
+    handlers, so these are plain Django views returning JsonResponse. Like
+    APIView.as_view, as_view exempts them from CSRF: they read no session.
+    users.schema lists them in the API docs.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+
+class AsyncLoginView(AsyncAuthView):
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return _envelope(status.HTTP_400_BAD_REQUEST, 'Bad Request')
+
+        user = await User.objects.filter(phone_number=data.get('phone_number')).afirst()
+        try:
+            if user is None:
+                # hash anyway, like ModelBackend, so unknown numbers take as long as wrong passwords
+                await hashing.pool.run(User().set_password, data.get('password'))
+                authenticated = False
+            else:
+                authenticated = await hashing.pool.run(user.check_password, data.get('password'))
+        except hashing.PoolSaturated:
+            return _saturated()
+
+        if not authenticated or not user.is_active:
+            return _envelope(status.HTTP_401_UNAUTHORIZED, 'شماره تلفن یا رمز عبورتان را بدرستی وارد نکردید')
+
+        user.last_login = now()
+        await User.objects.filter(pk=user.pk).aupdate(last_login=user.last_login)
+        return _envelope(status.HTTP_200_OK, 'شما با موفقیت وارد شدید', UserLoginSerializer(user).data)
+
+
+class AsyncSignUpView(AsyncAuthView):
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return _envelope(status.HTTP_400_BAD_REQUEST, 'Bad Request')
+
+        serializer = UserSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            phone_errors = serializer.errors.get('phone_number') or []
+            if any(error.code == 'unique' for error in phone_errors):
+                return _envelope(status.HTTP_400_BAD_REQUEST, 'کاربری با این مشخصات از قبل وجود دارد')
+            return _envelope(status.HTTP_400_BAD_REQUEST, 'Bad Request')
+
+        fields = dict(serializer.validated_data)
+        try:
+            password = await hashing.pool.run(make_password, fields.pop('password'))
+        except hashing.PoolSaturated:
+            return _saturated()
+        user = User(password=password, **fields)
+        try:
+            await user.asave(force_insert=True)
+        except IntegrityError:
+            # registered by a concurrent request since validation
+            return _envelope(status.HTTP_400_BAD_REQUEST, 'کاربری با این مشخصات از قبل وجود دارد')
+        return _envelope(status.HTTP_201_CREATED, 'ثبت نام شما با موفقیت انجام شد', UserSerializer(user).data)
@@ -0,0 +1,34 @@
+"""
+JSON rendering on orjson when it is installed, with DRF's JSONRenderer as the
+fallback.
+
+orjson writes compact UTF-8 and serializes dicts, lists, str subclasses
+(ErrorDetail), UUIDs and datetimes itself; whatever it does not know (lazy
+translations, Decimal, querysets) goes through DRF's JSONEncoder. Indented
+output (`Accept: application/json; indent=4`, the browsable API) and values
+orjson refuses, such as integers beyond 64 bits, are rendered by
+JSONRenderer, so the output never depends on which path ran.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z if orjson else 0
+
+_encode_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encode_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped like JSONRenderer does, so the output stays a strict javascript subset
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,425 @@
+"""
+Object storage shared by every caller in the process.
+
+ObjectStorage stores objects under one key prefix of the configured bucket.
+Every instance uses the same client from `get_client()`: one boto3 S3 client
+with a connection pool of OBJECT_STORAGE_MAX_POOL_CONNECTIONS (boto3 clients
+are thread-safe), or, with OBJECT_STORAGE_BACKEND = 'local', a
+LocalFilesystemClient that keeps objects under OBJECT_STORAGE_LOCAL_ROOT for
+development and tests.
+
+Streams are uploaded in OBJECT_STORAGE_CHUNK_SIZE multipart parts with at
+most OBJECT_STORAGE_TRANSFER_CONCURRENCY parts in memory, so copying a
+multi-GB remote file costs a few chunks of memory, not the file.
+
+Presigned download links come from `presigned_url_cache`, a per-process LRU
+keyed by bucket, key and expiry. A link is handed out again until
+OBJECT_STORAGE_PRESIGNED_URL_MARGIN seconds before it expires, so whoever
+receives it always has at least that long to use it.
+"""
+import hashlib
+import logging
+import os
+import uuid
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlencode
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# the most keys one DeleteObjects request accepts
+DELETE_BATCH_SIZE = 1000
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class NoSuchUpload(Exception):
+    """
+    The multipart upload was completed, aborted or has expired.
+    """
+
+
+@contextmanager
+def _multipart_errors(upload_id):
+    try:
+        yield
+    except Exception as exc:
+        # botocore's ClientError; botocore is only imported with the client
+        response = getattr(exc, 'response', None)
+        if isinstance(response, dict) and response.get('Error', {}).get('Code') == 'NoSuchUpload':
+            raise NoSuchUpload(upload_id) from exc
+        raise
+
+
+def transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    config = TransferConfig(
+        multipart_threshold=settings.OBJECT_STORAGE_CHUNK_SIZE,
+        multipart_chunksize=settings.OBJECT_STORAGE_CHUNK_SIZE,
+        max_concurrency=settings.OBJECT_STORAGE_TRANSFER_CONCURRENCY,
+    )
+    # parts read ahead of the uploads from a non-seekable stream
+    config.max_in_memory_upload_chunks = settings.OBJECT_STORAGE_TRANSFER_CONCURRENCY
+    return config
+
+
+def _create_client():
+    if settings.OBJECT_STORAGE_BACKEND == 'local':
+        return LocalFilesystemClient(settings.OBJECT_STORAGE_LOCAL_ROOT)
+
+    import boto3
+    from botocore.config import Config
+
+    return boto3.session.Session().client(
+        settings.AWS_SERVICE_NAME,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        # upload_part streams request bodies that cannot be rewound, so botocore
+        # must not read them ahead to compute checksums or payload signatures
+        config=Config(max_pool_connections=settings.OBJECT_STORAGE_MAX_POOL_CONNECTIONS,
+                      retries={'mode': 'standard'}, request_checksum_calculation='when_required',
+                      s3={'payload_signing_enabled': False}),
+    )
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+class PresignedURLCache:
+    def __init__(self, max_size, margin):
+        self.max_size = max_size
+        self.margin = margin
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_many(self, keys):
+        """
+        Return {key: url} for the keys with a link that is still good to hand
+        out; keys are (bucket, object key, expires_in) tuples.
+        """
+        found, now = {}, time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, urls, signed_at):
+        with self._lock:
+            for key, url in urls.items():
+                serve_until = signed_at + key[2] - self.margin
+                if serve_until <= signed_at:
+                    continue  # expires too soon to be worth reusing
+                self._entries[key] = (serve_until, url)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+presigned_url_cache = PresignedURLCache(settings.OBJECT_STORAGE_PRESIGNED_URL_CACHE_SIZE,
+                                        settings.OBJECT_STORAGE_PRESIGNED_URL_MARGIN)
+
+
+class LocalFilesystemClient:
+    """
+    The subset of the boto3 S3 client ObjectStorage uses, on a directory:
+    `<root>/<bucket>/<key>`. Writes go through a temporary file, so readers
+    never see half an object.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+
+    def _path(self, bucket, key):
+        path = (self.root / bucket / key).resolve()
+        if not path.is_relative_to(self.root / bucket):
+            raise ValueError(f"Key {key!r} leaves the bucket.")
+        return path
+
+    def _write(self, bucket, key, source, chunk_size):
+        path = self._path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as temporary:
+            try:
+                if isinstance(source, (bytes, bytearray)):
+                    temporary.write(source)
+                else:
+                    shutil.copyfileobj(source, temporary, chunk_size)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+        os.replace(temporary.name, path)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._write(Bucket, Key, Body.encode() if isinstance(Body, str) else Body,
+                    settings.OBJECT_STORAGE_CHUNK_SIZE)
+        return {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        chunk_size = Config.multipart_chunksize if Config else settings.OBJECT_STORAGE_CHUNK_SIZE
+        self._write(Bucket, Key, Fileobj, chunk_size)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        return {'Body': path.open('rb'), 'ContentLength': path.stat().st_size}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._path(Bucket, Key).unlink(missing_ok=True)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted, errors = [], []
+        for item in Delete['Objects']:
+            try:
+                self.delete_object(Bucket, item['Key'])
+            except (OSError, ValueError) as exc:
+                errors.append({'Key': item['Key'], 'Code': type(exc).__name__, 'Message': str(exc)})
+            else:
+                deleted.append({'Key': item['Key']})
+        return {'Errors': errors} if Delete.get('Quiet') else {'Deleted': deleted, 'Errors': errors}
+
+    def _part_path(self, upload_id, number):
+        if not upload_id.isalnum():
+            raise ValueError(f"Invalid upload id {upload_id!r}.")
+        return self.root / '.multipart' / upload_id / f'{number:05d}'
+
+    def _upload_dir(self, upload_id):
+        directory = self._part_path(upload_id, 0).parent
+        if not directory.is_dir():
+            raise NoSuchUpload(upload_id)
+        return directory
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._path(Bucket, Key)
+        upload_id = uuid.uuid4().hex
+        (self.root / '.multipart' / upload_id).mkdir(parents=True)
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._upload_dir(UploadId)
+        path = self._part_path(UploadId, PartNumber)
+        digest = hashlib.md5(usedforsecurity=False)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as temporary:
+            while chunk := Body.read(64 * 1024):
+                digest.update(chunk)
+                temporary.write(chunk)
+        os.replace(temporary.name, path)
+        return {'ETag': f'"{digest.hexdigest()}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        directory = self._upload_dir(UploadId)
+        parts = []
+        for path in sorted(directory.iterdir()):
+            if path.name.isdigit():
+                with path.open('rb') as part:
+                    digest = hashlib.file_digest(part, lambda: hashlib.md5(usedforsecurity=False))
+                parts.append({'PartNumber': int(path.name), 'ETag': f'"{digest.hexdigest()}"',
+                              'Size': path.stat().st_size})
+        return {'Parts': parts, 'IsTruncated': False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        directory = self._upload_dir(UploadId)
+        stored = {part['PartNumber']: part['ETag'] for part in self.list_parts(Bucket, Key, UploadId)['Parts']}
+        for part in MultipartUpload['Parts']:
+            if stored.get(part['PartNumber']) != part['ETag']:
+                raise ValueError(f"Part {part['PartNumber']} does not match the uploaded one.")
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as temporary:
+            for part in MultipartUpload['Parts']:
+                with self._part_path(UploadId, part['PartNumber']).open('rb') as source:
+                    shutil.copyfileobj(source, temporary, settings.OBJECT_STORAGE_CHUNK_SIZE)
+        os.replace(temporary.name, path)
+        shutil.rmtree(directory)
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._part_path(UploadId, 0).parent, ignore_errors=True)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        return f"{self._path(Params['Bucket'], Params['Key']).as_uri()}?{urlencode({'expires_in': ExpiresIn})}"
+
+
+class ObjectStorage:
+    """
+    Objects under `<prefix>/` in the bucket, e.g. ObjectStorage('users').
+    Names are relative to the prefix.
+    """
+
+    def __init__(self, prefix, bucket=None, client=None):
+        self.prefix = prefix.strip('/')
+        self.bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    def key(self, name):
+        return f'{self.prefix}/{name}'
+
+    def upload(self, name, body, acl='private', content_type=None):
+        """
+        Store `body`, bytes or a readable file object. File objects are
+        streamed in multipart chunks and never read whole.
+        """
+        extra_args = {'ACL': acl}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        if hasattr(body, 'read'):
+            self.client.upload_fileobj(body, self.bucket, self.key(name), ExtraArgs=extra_args,
+                                       Config=transfer_config())
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=body, **extra_args)
+        return self.key(name)
+
+    def upload_from_url(self, url, name, acl='public-read', timeout=30):
+        """
+        Copy the file at `url` into the bucket, streaming the response body
+        straight into a multipart upload.
+        """
+        with requests.get(url, stream=True, allow_redirects=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return self.upload(name, response.raw, acl=acl, content_type=response.headers.get('Content-Type'))
+
+    def open(self, name):
+        """
+        Return the object's body as a readable stream.
+        """
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(name))['Body']
+
+    def presigned_url(self, name, expires_in=3600):
+        return self.presigned_urls([name], expires_in)[name]
+
+    def presigned_urls(self, names, expires_in=3600):
+        """
+        Return {name: presigned download link}, signing only the names
+        without a cached link and taking the cache lock twice for the batch.
+        """
+        keys = {name: (self.bucket, self.key(name), expires_in) for name in names}
+        cached = presigned_url_cache.get_many(keys.values())
+        signed, signed_at = {}, time.monotonic()
+        for key in keys.values():
+            if key not in cached and key not in signed:
+                signed[key] = self.client.generate_presigned_url(
+                    'get_object', Params={'Bucket': key[0], 'Key': key[1]}, ExpiresIn=expires_in,
+                )
+        if signed:
+            presigned_url_cache.set_many(signed, signed_at)
+        return {name: cached.get(key) or signed[key] for name, key in keys.items()}
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def create_multipart_upload(self, name, content_type=None):
+        """
+        Start a multipart upload whose parts may come from different requests
+        or processes; returns its upload id.
+        """
+        extra_args = {'ContentType': content_type} if content_type else {}
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key(name), ACL='private',
+                                                   **extra_args)['UploadId']
+
+    def upload_part(self, name, upload_id, number, body, length):
+        """
+        Stream `length` bytes of the readable `body` into part `number`
+        (1-based); returns the part's ETag. Raises NoSuchUpload when the
+        upload is gone, as do list_parts() and complete_multipart_upload().
+        """
+        with _multipart_errors(upload_id):
+            return self.client.upload_part(Bucket=self.bucket, Key=self.key(name), UploadId=upload_id,
+                                           PartNumber=number, Body=body, ContentLength=length)['ETag']
+
+    def list_parts(self, name, upload_id):
+        """
+        Return the parts stored so far as {number: (etag, size)}.
+        """
+        parts, kwargs = {}, {}
+        while True:
+            with _multipart_errors(upload_id):
+                response = self.client.list_parts(Bucket=self.bucket, Key=self.key(name), UploadId=upload_id,
+                                                  **kwargs)
+            for part in response.get('Parts', []):
+                parts[part['PartNumber']] = (part['ETag'], part['Size'])
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def complete_multipart_upload(self, name, upload_id, etags):
+        """
+        Join the parts, given as {number: etag}, into the object.
+        """
+        with _multipart_errors(upload_id):
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key(name), UploadId=upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag}
+                                           for number, etag in sorted(etags.items())]},
+            )
+
+    def abort_multipart_upload(self, name, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key(name), UploadId=upload_id)
+
+    def upload_many(self, items, acl='private', workers=None):
+        """
+        Upload (name, body) pairs from a thread pool over the shared client.
+        Returns {name: exception} for the uploads that failed.
+        """
+        def upload(item):
+            name, body = item
+            try:
+                self.upload(name, body, acl=acl)
+            except Exception as exc:
+                logger.warning("Uploading %s failed: %s", self.key(name), exc)
+                return name, exc
+            return name, None
+
+        with ThreadPoolExecutor(max_workers=workers or settings.OBJECT_STORAGE_WORKERS,
+                                thread_name_prefix='object-storage') as executor:
+            return {name: exc for name, exc in executor.map(upload, items) if exc is not None}
+
+    def delete_many(self, names):
+        """
+        Delete objects with one DeleteObjects request per DELETE_BATCH_SIZE
+        names. Returns {name: error message} for the objects that were not
+        deleted.
+        """
+        names = list(names)
+        failed = {}
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            batch = names[start:start + DELETE_BATCH_SIZE]
+            response = self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': self.key(name)} for name in batch],
+                'Quiet': True,
+            })
+            for error in response.get('Errors', []):
+                failed[error['Key'][len(self.prefix) + 1:]] = error.get('Message') or error.get('Code')
+        return failed
@@ -0,0 +1,155 @@
+import io
+import json
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from . import storage
+from .bucket_abr_arvan import UsersBucket
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+
+
+class _Stream:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, *args):
+        body, self.body = self.body, b''
+        return body
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'created_at': datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        'message': 'کاربری با این مشخصات از قبل وجود دارد',
+        'errors': [ErrorDetail('invalid', code='invalid')],
+        'lazy': gettext_lazy('This field is required.'),
+        'amount': Decimal('1.5'),
+        1: 'integer key',
+        'separator': 'a\u2028b',
+    }
+
+    def test_renders_like_json_renderer(self):
+        fast, stdlib = FastJSONRenderer().render(self.data), JSONRenderer().render(self.data)
+        self.assertEqual(json.loads(fast), json.loads(stdlib))
+        self.assertIn('کاربری'.encode(), fast)
+        self.assertNotIn(b'\xe2\x80\xa8', fast)
+        self.assertNotIn(b', ', fast)
+
+    def test_indent_and_unsupported_values_fall_back(self):
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'), b'{\n  "a": 1\n}')
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_parse(self):
+        body = FastJSONRenderer().render({'message': self.data['message'], 'ids': [1, 2]})
+        self.assertEqual(FastJSONParser().parse(_Stream(body)), JSONParser().parse(_Stream(body)))
+        for invalid in (b'{"a": ', b'{"a": NaN}'):
+            with self.subTest(body=invalid), self.assertRaises(ParseError):
+                FastJSONParser().parse(_Stream(invalid))
+
+
+class _ReadRecorder(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+class ObjectStorageTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        self.client = storage.LocalFilesystemClient(self.root)
+        settings_override = override_settings(OBJECT_STORAGE_CHUNK_SIZE=1024, AWS_STORAGE_BUCKET_NAME='bucket')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = storage.ObjectStorage('users', client=self.client)
+        storage.presigned_url_cache.clear()
+        self.addCleanup(storage.presigned_url_cache.clear)
+
+    def test_streams_file_objects_in_chunks(self):
+        body = _ReadRecorder(b'x' * 10_000)
+        self.assertEqual(self.storage.upload('a.bin', body), 'users/a.bin')
+        self.assertEqual((self.root / 'bucket/users/a.bin').read_bytes(), b'x' * 10_000)
+        self.assertTrue(all(0 < size <= 1024 for size in body.reads))
+
+    def test_upload_from_url_streams_the_response(self):
+        response = mock.MagicMock(raw=_ReadRecorder(b'y' * 5000), headers={'Content-Type': 'image/png'})
+        response.__enter__.return_value = response
+        with mock.patch.object(storage.requests, 'get', return_value=response) as get:
+            self.storage.upload_from_url('https://example.com/a.png', 'a.png')
+        self.assertTrue(get.call_args.kwargs['stream'])
+        self.assertEqual((self.root / 'bucket/users/a.png').read_bytes(), b'y' * 5000)
+        self.assertNotIn(-1, response.raw.reads)
+
+    def test_upload_many_and_delete_many(self):
+        with self.assertLogs('utils.storage', 'WARNING'):
+            failed = self.storage.upload_many([(f'{i}.txt', f'{i}'.encode()) for i in range(10)] + [('../../x', b'')],
+                                              workers=4)
+        self.assertEqual(list(failed), ['../../x'])
+        self.assertEqual(len(list((self.root / 'bucket/users').iterdir())), 10)
+        with mock.patch.object(storage, 'DELETE_BATCH_SIZE', 3), \
+                mock.patch.object(self.client, 'delete_objects', wraps=self.client.delete_objects) as delete_objects:
+            self.assertEqual(self.storage.delete_many(f'{i}.txt' for i in range(10)), {})
+        self.assertEqual(delete_objects.call_count, 4)
+        self.assertEqual(list((self.root / 'bucket/users').iterdir()), [])
+
+    def test_buckets_share_the_client(self):
+        with override_settings(OBJECT_STORAGE_BACKEND='local', OBJECT_STORAGE_LOCAL_ROOT=self.root), \
+                mock.patch.object(storage, '_client', None):
+            first, second = UsersBucket(), UsersBucket()
+            self.assertIs(first.client, second.client)
+            first.UploadFile(b'avatar', 'me.png')
+            self.assertTrue(second.GetDownloadLink('me.png').startswith((self.root / 'bucket/users/me.png').as_uri()))
+            second.deleteFile('me.png')
+        self.assertFalse((self.root / 'bucket/users/me.png').exists())
+
+
+class PresignedURLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.generate_presigned_url.side_effect = lambda method, Params, ExpiresIn: \
+            f"https://s3/{Params['Key']}?expires={ExpiresIn}&n={self.client.generate_presigned_url.call_count}"
+        self.cache = storage.PresignedURLCache(max_size=3, margin=60)
+        patcher = mock.patch.object(storage, 'presigned_url_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = storage.ObjectStorage('users', bucket='bucket', client=self.client)
+
+    def test_reuses_links_until_the_margin(self):
+        with mock.patch.object(storage.time, 'monotonic', return_value=1000):
+            first = self.storage.presigned_url('a.png', 600)
+            self.assertEqual(self.storage.presigned_url('a.png', 600), first)
+            self.assertNotEqual(self.storage.presigned_url('a.png', 1200), first)
+        with mock.patch.object(storage.time, 'monotonic', return_value=1000 + 600 - 60):
+            self.assertNotEqual(self.storage.presigned_url('a.png', 600), first)
+        self.assertEqual(self.client.generate_presigned_url.call_count, 3)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_links_expiring_within_the_margin_are_not_cached(self):
+        self.storage.presigned_url('a.png', 30)
+        self.storage.presigned_url('a.png', 30)
+        self.assertEqual(self.client.generate_presigned_url.call_count, 2)
+
+    def test_batches_sign_only_misses_and_evict_the_least_recently_used(self):
+        self.storage.presigned_urls(['a', 'b'])
+        urls = self.storage.presigned_urls(['a', 'b', 'c', 'd'])
+        self.assertEqual(list(urls), ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.client.generate_presigned_url.call_count, 4)
+        self.assertEqual(self.storage.presigned_urls(['b', 'c', 'd']), {name: urls[name] for name in 'bcd'})
+        self.storage.presigned_url('a')
+        self.assertEqual(self.client.generate_presigned_url.call_count, 5)